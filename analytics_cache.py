@@ -0,0 +1,152 @@
+"""
+Response cache and HTTP validators for the per-user analytics endpoints
+user_stats.analytics_version is bumped in the same upsert that records a quiz
+(submit-quiz, session auto-grading) and when the archival job moves a user's
+rows, so together with the user's current day it identifies the data an
+analytics response was computed from. The endpoints turn it into an ETag and
+Last-Modified, answer 304 when the client already holds that state, and
+otherwise serve the body this process cached for the same ETag before
+computing it again.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as day_time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from stats_service import STREAK_TIMEZONE, local_day, valid_timezone
+
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "300"))  # 0 keeps only the ETags
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "5000"))
+
+# (endpoint, user_id, tenant_id, *parameters)
+CacheKey = Tuple[Any, ...]
+
+
+def analytics_validators(key: CacheKey, version: Optional[int], updated_at: Optional[datetime],
+                         timezone_name: Optional[str] = None) -> Tuple[str, datetime]:
+    """ETag and Last-Modified of a user's analytics as of today in their time zone
+
+    Streaks and date windows roll over at midnight without a submit, so the day
+    is part of the ETag and Last-Modified is never earlier than its start.
+    """
+    name = timezone_name if timezone_name and valid_timezone(timezone_name) else STREAK_TIMEZONE
+    today = local_day(datetime.utcnow(), name)
+    day_start = datetime.combine(today, day_time.min, tzinfo=ZoneInfo(name)).astimezone(timezone.utc)
+
+    changed_at = updated_at.replace(tzinfo=timezone.utc) if updated_at else day_start
+    last_modified = max(changed_at, day_start).replace(microsecond=0)
+    fingerprint = "|".join(str(part) for part in (*key, version or 0, changed_at.timestamp(), today.isoformat()))
+    return f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()[:20]}"', last_modified
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        # Weak comparison: W/"x" and "x" name the same representation
+        return "*" in tags or etag in tags or etag[2:] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class AnalyticsCache:
+    """Thread-safe TTL + LRU cache of analytics response bodies, keyed by request and ETag"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str, Any]]" = OrderedDict()
+        self._keys_by_user: Dict[Tuple[int, str], Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: CacheKey, etag: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != etag or entry[0] <= time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: CacheKey, etag: str, body: Any):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, etag, body)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault((key[1], key[2]), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int, tenant_id: str):
+        """Drop a user's cached responses once their data changed (the new version misses anyway)"""
+        with self._lock:
+            for key in list(self._keys_by_user.get((user_id, tenant_id), ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+    def _remove(self, key: CacheKey):
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._keys_by_user.get((key[1], key[2]))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[(key[1], key[2])]
+
+    async def serve(self, request: Request, key: CacheKey, etag: str, last_modified: datetime,
+                    compute: Callable[[], Awaitable[Any]]) -> Response:
+        """304 if the client is current, else the cached or freshly computed body, with validators"""
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": "private, no-cache",
+            "Vary": "Authorization",
+        }
+        if _not_modified(request, etag, last_modified):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        body = self.get(key, etag)
+        if body is None:
+            body = jsonable_encoder(await compute())
+            self.put(key, etag, body)
+        return JSONResponse(body, headers=headers)
+
+
+analytics_cache = AnalyticsCache(ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_CACHE_MAX_ENTRIES)
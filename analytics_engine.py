@@ -0,0 +1,221 @@
+"""
+Vectorized analytics over columnar fetches
+Each fetch runs one query that selects only the columns the metrics need (hot
+and archived rows together) and loads them into a DataFrame. Topic,
+difficulty, time and trend metrics are then computed with pandas and NumPy
+instead of Python loops over ORM objects. AnalyticsService builds the full
+report served by GET /analytics/user/report from them; streaks come from
+user_stats.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, String, select, type_coerce, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+RESULT_COLUMNS = ["completed_at", "percentage", "score", "total_questions", "time_taken", "topic", "category", "difficulty"]
+HISTORY_COLUMNS = ["answered_at", "topic", "difficulty", "is_correct", "time_taken_seconds"]
+
+
+def _timestamps(column):
+    # Fetched as the driver's raw value (ISO text on SQLite) and parsed by pandas in one pass,
+    # instead of one datetime per row in the result processor
+    return type_coerce(column, String)
+
+
+def _frame(db: Session, statement, columns: List[str], time_column: str) -> pd.DataFrame:
+    result = db.execute(statement)
+    frame = pd.DataFrame.from_records(result.fetchall(), columns=columns)
+    frame[time_column] = pd.to_datetime(frame[time_column], format="ISO8601")
+    return frame
+
+
+def fetch_results(db: Session, user_id: int, tenant_id: str, since: Optional[datetime] = None,
+                  include_archived: bool = True) -> pd.DataFrame:
+    """One row per quiz result with its topic, category and quiz difficulty"""
+
+    def select_from(model):
+        statement = select(
+            _timestamps(model.completed_at), model.percentage, model.score, model.total_questions,
+            model.time_taken, models.Topic.name, models.Topic.category, models.Quiz.difficulty
+        ).select_from(model).outerjoin(
+            models.Quiz, models.Quiz.id == model.quiz_id
+        ).outerjoin(
+            models.Topic, models.Topic.id == models.Quiz.topic_id
+        ).where(model.user_id == user_id, model.tenant_id == tenant_id)
+        if since is not None:
+            statement = statement.where(model.completed_at >= since)
+        return statement
+
+    statement = select_from(models.QuizResult)
+    if include_archived:
+        statement = union_all(statement, select_from(models.QuizResultArchive))
+    return _frame(db, statement, RESULT_COLUMNS, "completed_at")
+
+
+def fetch_question_history(db: Session, user_id: int, tenant_id: str, since: Optional[datetime] = None,
+                           include_archived: bool = True) -> pd.DataFrame:
+    """One row per answered question"""
+
+    def select_from(model):
+        statement = select(
+            _timestamps(model.answered_at), model.topic_name, model.difficulty_level,
+            type_coerce(model.is_correct, Integer), model.time_taken_seconds
+        ).where(model.user_id == user_id, model.tenant_id == tenant_id)
+        if since is not None:
+            statement = statement.where(model.answered_at >= since)
+        return statement
+
+    statement = select_from(models.UserQuestionHistory)
+    if include_archived:
+        statement = union_all(statement, select_from(models.UserQuestionHistoryArchive))
+    frame = _frame(db, statement, HISTORY_COLUMNS, "answered_at")
+    frame["is_correct"] = frame["is_correct"].fillna(False).astype(bool)
+    frame["time_taken_seconds"] = frame["time_taken_seconds"].fillna(0)
+    return frame
+
+
+def overview(results: pd.DataFrame, now: datetime, recent_days: int = 30) -> Dict[str, float]:
+    """Totals, averages and completion rate over all results"""
+    total_quizzes = len(results)
+    total_questions = int(results["total_questions"].sum())
+    total_correct = int(results["score"].sum())
+    total_time = int(results["time_taken"].fillna(0).sum())
+    recent = results["percentage"][results["completed_at"] >= now - timedelta(days=recent_days)]
+    return {
+        "total_quizzes": total_quizzes,
+        "total_questions": total_questions,
+        "total_correct": total_correct,
+        "total_time": total_time,
+        "average_score": total_correct / total_questions if total_questions else 0.0,
+        "best_score": float(results["percentage"].max()) if total_quizzes else 0.0,
+        "recent_average": float(recent.mean()) if len(recent) else 0.0,
+        "average_time_per_question": total_time / total_questions if total_questions else 0.0,
+        "completion_rate": float((results["percentage"] >= 60).mean() * 100) if total_quizzes else 0.0,
+    }
+
+
+def _grouped_performance(results: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    grouped = results.dropna(subset=[keys[0]]).groupby(keys, dropna=False, sort=False).agg(
+        quizzes_taken=("score", "size"),
+        average_score=("percentage", "mean"),
+        total_correct=("score", "sum"),
+        total_questions=("total_questions", "sum"),
+    ).reset_index()
+    grouped["accuracy"] = np.where(
+        grouped["total_questions"] > 0,
+        grouped["total_correct"] / grouped["total_questions"].where(grouped["total_questions"] > 0, 1) * 100,
+        0.0,
+    )
+    return grouped
+
+
+def topic_performance(results: pd.DataFrame) -> List[Dict]:
+    grouped = _grouped_performance(results, ["topic", "category"])
+    return [
+        {
+            "topic": row.topic,
+            "category": None if pd.isna(row.category) else row.category,
+            "quizzes_taken": int(row.quizzes_taken),
+            "average_score": round(float(row.average_score), 2),
+            "total_correct": int(row.total_correct),
+            "total_questions": int(row.total_questions),
+            "accuracy": round(float(row.accuracy), 2),
+        }
+        for row in grouped.itertuples(index=False)
+    ]
+
+
+def difficulty_performance(results: pd.DataFrame) -> List[Dict]:
+    grouped = _grouped_performance(results, ["difficulty"])
+    return [
+        {
+            "difficulty": row.difficulty,
+            "quizzes_taken": int(row.quizzes_taken),
+            "average_score": round(float(row.average_score), 2),
+            "total_correct": int(row.total_correct),
+            "total_questions": int(row.total_questions),
+            "accuracy": round(float(row.accuracy), 2),
+        }
+        for row in grouped.itertuples(index=False)
+    ]
+
+
+def progress_over_time(results: pd.DataFrame, now: datetime, days: int = 30) -> List[Dict]:
+    """Per-day quizzes, questions and accuracy over the last `days` days"""
+    recent = results[results["completed_at"] >= now - timedelta(days=days)]
+    if recent.empty:
+        return []
+    daily = recent.groupby(recent["completed_at"].dt.strftime("%Y-%m-%d")).agg(
+        quizzes_taken=("score", "size"),
+        total_questions=("total_questions", "sum"),
+        total_correct=("score", "sum"),
+    )
+    questions = daily["total_questions"].to_numpy()
+    correct = daily["total_correct"].to_numpy()
+    averages = np.round(np.divide(correct * 100, questions, out=np.zeros(len(daily)), where=questions > 0), 2)
+    return [
+        {
+            "date": day,
+            "quizzes_taken": int(quizzes),
+            "average_score": float(average),
+            "total_questions": int(total_questions),
+            "total_correct": int(total_correct),
+        }
+        for day, quizzes, average, total_questions, total_correct in zip(
+            daily.index, daily["quizzes_taken"], averages, questions, correct
+        )
+    ]
+
+
+def improvement_rate(timestamps: pd.Series, percentages: pd.Series) -> float:
+    """Relative change of the mean score between the older and the newer half of the results"""
+    if len(percentages) < 2:
+        return 0.0
+    ordered = percentages.to_numpy(dtype=float)[np.argsort(timestamps.to_numpy(), kind="stable")]
+    mid_point = len(ordered) // 2
+    first_avg = ordered[:mid_point].mean()
+    second_avg = ordered[mid_point:].mean()
+    return round(float((second_avg - first_avg) / first_avg * 100), 2) if first_avg > 0 else 0.0
+
+
+def time_metrics(results: pd.DataFrame, history: pd.DataFrame) -> Dict[str, object]:
+    """Time spent per quiz and per question, by difficulty and by topic"""
+    durations = results["time_taken"].dropna().to_numpy(dtype=float)
+    per_question = history["time_taken_seconds"].to_numpy(dtype=float)
+
+    def seconds_by(column: str) -> List[Dict]:
+        if history.empty:
+            return []
+        grouped = history.dropna(subset=[column]).groupby(column, sort=False).agg(
+            questions=("is_correct", "size"),
+            correct=("is_correct", "sum"),
+            average_seconds=("time_taken_seconds", "mean"),
+            median_seconds=("time_taken_seconds", "median"),
+        ).reset_index()
+        return [
+            {
+                column: key,
+                "questions": int(questions),
+                "accuracy": round(float(correct) / questions * 100, 2),
+                "average_seconds": round(float(average), 2),
+                "median_seconds": round(float(median), 2),
+            }
+            for key, questions, correct, average, median in grouped.itertuples(index=False)
+        ]
+
+    return {
+        "average_quiz_seconds": round(float(durations.mean()), 2) if len(durations) else 0.0,
+        "median_quiz_seconds": round(float(np.median(durations)), 2) if len(durations) else 0.0,
+        "fastest_quiz_seconds": int(durations.min()) if len(durations) else None,
+        "slowest_quiz_seconds": int(durations.max()) if len(durations) else None,
+        "average_question_seconds": round(float(per_question.mean()), 2) if len(per_question) else 0.0,
+        "p90_question_seconds": round(float(np.percentile(per_question, 90)), 2) if len(per_question) else 0.0,
+        "by_difficulty": seconds_by("difficulty"),
+        "by_topic": seconds_by("topic"),
+    }
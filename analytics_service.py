@@ -10,7 +10,9 @@ from datetime import datetime, timedelta
 from sqlalchemy import func, and_, desc
 from sqlalchemy.orm import Session
 import pandas as pd
-import numpy as np
+
+import analytics_engine
+from stats_service import local_day, streak_summary, weak_areas
 
 class AnalyticsService:
     def __init__(self, db_session: Session):
@@ -19,49 +21,38 @@ class AnalyticsService:
     def get_user_analytics(self, user_id: int, tenant_id: str) -> Dict[str, Any]:
         """Get comprehensive analytics for a user"""
         try:
-            from models import User, QuizResult, Topic, Quiz, Question
+            from models import User
             
             # Get user data
             user = self.db_session.query(User).filter(User.id == user_id).first()
             if not user:
                 return {"error": "User not found"}
             
-            # Get all quiz results for the user
-            results = self.db_session.query(QuizResult).filter(
-                QuizResult.user_id == user_id,
-                QuizResult.tenant_id == tenant_id
-            ).all()
+            # Only the columns the metrics need, hot and archived, in one query each
+            results = analytics_engine.fetch_results(self.db_session, user_id, tenant_id)
             
-            if not results:
+            if results.empty:
                 return self._get_empty_analytics()
             
-            # Calculate basic metrics
-            total_quizzes = len(results)
-            total_questions = sum(r.total_questions for r in results)
-            total_correct = sum(r.score for r in results)
-            average_score = total_correct / total_questions if total_questions > 0 else 0
-            best_score = max(r.percentage for r in results) if results else 0
-            
-            # Calculate time-based metrics
-            total_time = sum(r.time_taken for r in results)
-            average_time_per_question = total_time / total_questions if total_questions > 0 else 0
+            history = analytics_engine.fetch_question_history(self.db_session, user_id, tenant_id)
+            now = datetime.utcnow()
             
-            # Get recent performance (last 30 days)
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            recent_results = [r for r in results if r.completed_at >= thirty_days_ago]
-            recent_average = sum(r.percentage for r in recent_results) / len(recent_results) if recent_results else 0
+            # Calculate basic metrics
+            summary = analytics_engine.overview(results, now)
+            average_score = summary["average_score"]
+            recent_average = summary["recent_average"]
             
             # Get topic-wise performance
-            topic_performance = self._get_topic_performance(user_id, tenant_id)
+            topic_performance = self._get_topic_performance(results)
             
             # Get difficulty-wise performance
-            difficulty_performance = self._get_difficulty_performance(user_id, tenant_id)
+            difficulty_performance = self._get_difficulty_performance(results)
             
             # Get progress over time
-            progress_data = self._get_progress_over_time(user_id, tenant_id)
+            progress_data = self._get_progress_over_time(results, now)
             
             # Get study streaks
-            streaks = self._calculate_streaks(results)
+            streaks = self._calculate_streaks(user, tenant_id)
             
             # Get improvement rate
             improvement_rate = self._calculate_improvement_rate(results)
@@ -78,29 +69,30 @@ class AnalyticsService:
                     "email": user.email,
                     "first_name": user.first_name,
                     "last_name": user.last_name,
-                    "total_quizzes_taken": total_quizzes,
-                    "total_questions_answered": total_questions,
-                    "total_correct_answers": total_correct,
+                    "total_quizzes_taken": summary["total_quizzes"],
+                    "total_questions_answered": summary["total_questions"],
+                    "total_correct_answers": summary["total_correct"],
                     "average_score": round(average_score * 100, 2),
-                    "best_score": round(best_score, 2),
-                    "total_study_time": round(total_time / 60, 2)  # Convert to minutes
+                    "best_score": round(summary["best_score"], 2),
+                    "total_study_time": round(summary["total_time"] / 60, 2)  # Convert to minutes
                 },
                 "performance_metrics": {
                     "overall_average": round(average_score * 100, 2),
                     "recent_average": round(recent_average, 2),
-                    "best_score": round(best_score, 2),
-                    "average_time_per_question": round(average_time_per_question, 2),
+                    "best_score": round(summary["best_score"], 2),
+                    "average_time_per_question": round(summary["average_time_per_question"], 2),
                     "improvement_rate": round(improvement_rate, 2),
-                    "completion_rate": round(len([r for r in results if r.percentage >= 60]) / total_quizzes * 100, 2)
+                    "completion_rate": round(summary["completion_rate"], 2)
                 },
                 "topic_performance": topic_performance,
                 "difficulty_performance": difficulty_performance,
+                "time_metrics": analytics_engine.time_metrics(results, history),
                 "progress_data": progress_data,
                 "streaks": streaks,
                 "weak_areas": weak_areas,
                 "achievements": achievements,
                 "recommendations": self._generate_recommendations(
-                    average_score, recent_average, weak_areas, streaks
+                    average_score * 100, recent_average, weak_areas, streaks
                 )
             }
             
@@ -140,211 +132,63 @@ class AnalyticsService:
             ]
         }
     
-    def _get_topic_performance(self, user_id: int, tenant_id: str) -> List[Dict]:
+    def _get_topic_performance(self, results: pd.DataFrame) -> List[Dict]:
         """Get performance breakdown by topic"""
         try:
-            from models import QuizResult, Quiz, Topic
-            
-            # Get topic-wise performance
-            topic_stats = self.db_session.query(
-                Topic.name,
-                Topic.category,
-                func.count(QuizResult.id).label('quizzes_taken'),
-                func.avg(QuizResult.percentage).label('average_score'),
-                func.sum(QuizResult.score).label('total_correct'),
-                func.sum(QuizResult.total_questions).label('total_questions')
-            ).join(Quiz, Quiz.topic_id == Topic.id).join(
-                QuizResult, QuizResult.quiz_id == Quiz.id
-            ).filter(
-                QuizResult.user_id == user_id,
-                QuizResult.tenant_id == tenant_id
-            ).group_by(Topic.id, Topic.name, Topic.category).all()
-            
-            return [
-                {
-                    "topic": stat.name,
-                    "category": stat.category,
-                    "quizzes_taken": stat.quizzes_taken,
-                    "average_score": round(stat.average_score, 2),
-                    "total_correct": stat.total_correct,
-                    "total_questions": stat.total_questions,
-                    "accuracy": round(stat.total_correct / stat.total_questions * 100, 2) if stat.total_questions > 0 else 0
-                }
-                for stat in topic_stats
-            ]
+            return analytics_engine.topic_performance(results)
         except Exception as e:
             print(f"❌ Error getting topic performance: {e}")
             return []
     
-    def _get_difficulty_performance(self, user_id: int, tenant_id: str) -> List[Dict]:
+    def _get_difficulty_performance(self, results: pd.DataFrame) -> List[Dict]:
         """Get performance breakdown by difficulty level"""
         try:
-            from models import QuizResult, Quiz
-            
-            difficulty_stats = self.db_session.query(
-                Quiz.difficulty,
-                func.count(QuizResult.id).label('quizzes_taken'),
-                func.avg(QuizResult.percentage).label('average_score'),
-                func.sum(QuizResult.score).label('total_correct'),
-                func.sum(QuizResult.total_questions).label('total_questions')
-            ).join(QuizResult, QuizResult.quiz_id == Quiz.id).filter(
-                QuizResult.user_id == user_id,
-                QuizResult.tenant_id == tenant_id
-            ).group_by(Quiz.difficulty).all()
-            
-            return [
-                {
-                    "difficulty": stat.difficulty,
-                    "quizzes_taken": stat.quizzes_taken,
-                    "average_score": round(stat.average_score, 2),
-                    "total_correct": stat.total_correct,
-                    "total_questions": stat.total_questions,
-                    "accuracy": round(stat.total_correct / stat.total_questions * 100, 2) if stat.total_questions > 0 else 0
-                }
-                for stat in difficulty_stats
-            ]
+            return analytics_engine.difficulty_performance(results)
         except Exception as e:
             print(f"❌ Error getting difficulty performance: {e}")
             return []
     
-    def _get_progress_over_time(self, user_id: int, tenant_id: str, days: int = 30) -> List[Dict]:
+    def _get_progress_over_time(self, results: pd.DataFrame, now: datetime, days: int = 30) -> List[Dict]:
         """Get progress data over time"""
         try:
-            from models import QuizResult
-            
-            # Get results from last N days
-            start_date = datetime.utcnow() - timedelta(days=days)
-            
-            results = self.db_session.query(QuizResult).filter(
-                QuizResult.user_id == user_id,
-                QuizResult.tenant_id == tenant_id,
-                QuizResult.completed_at >= start_date
-            ).order_by(QuizResult.completed_at).all()
-            
-            # Group by date
-            daily_data = {}
-            for result in results:
-                date_str = result.completed_at.strftime('%Y-%m-%d')
-                if date_str not in daily_data:
-                    daily_data[date_str] = {
-                        'date': date_str,
-                        'quizzes_taken': 0,
-                        'average_score': 0,
-                        'total_questions': 0,
-                        'total_correct': 0
-                    }
-                
-                daily_data[date_str]['quizzes_taken'] += 1
-                daily_data[date_str]['total_questions'] += result.total_questions
-                daily_data[date_str]['total_correct'] += result.score
-            
-            # Calculate averages
-            for date_data in daily_data.values():
-                if date_data['total_questions'] > 0:
-                    date_data['average_score'] = round(
-                        date_data['total_correct'] / date_data['total_questions'] * 100, 2
-                    )
-            
-            return list(daily_data.values())
-            
+            return analytics_engine.progress_over_time(results, now, days)
         except Exception as e:
             print(f"❌ Error getting progress over time: {e}")
             return []
     
-    def _calculate_streaks(self, results: List) -> Dict[str, int]:
-        """Calculate study streaks"""
+    def _calculate_streaks(self, user, tenant_id: str) -> Dict[str, int]:
+        """Study streaks kept on user_stats by submit-quiz"""
         try:
-            if not results:
-                return {"current_streak": 0, "longest_streak": 0}
-            
-            # Sort results by date
-            sorted_results = sorted(results, key=lambda x: x.completed_at.date())
-            
-            current_streak = 0
-            longest_streak = 0
-            temp_streak = 0
-            last_date = None
-            
-            for result in sorted_results:
-                result_date = result.completed_at.date()
-                
-                if last_date is None:
-                    temp_streak = 1
-                elif (result_date - last_date).days == 1:
-                    temp_streak += 1
-                else:
-                    temp_streak = 1
-                
-                longest_streak = max(longest_streak, temp_streak)
-                last_date = result_date
-            
-            # Check if current streak is ongoing
-            if last_date and (datetime.utcnow().date() - last_date).days <= 1:
-                current_streak = temp_streak
-            
-            return {
-                "current_streak": current_streak,
-                "longest_streak": longest_streak
-            }
+            from models import UserStats
             
+            stats = self.db_session.query(UserStats).filter(
+                UserStats.user_id == user.id,
+                UserStats.tenant_id == tenant_id
+            ).first()
+            return streak_summary(stats, local_day(datetime.utcnow(), user.timezone))
         except Exception as e:
             print(f"❌ Error calculating streaks: {e}")
             return {"current_streak": 0, "longest_streak": 0}
     
-    def _calculate_improvement_rate(self, results: List) -> float:
+    def _calculate_improvement_rate(self, results: pd.DataFrame) -> float:
         """Calculate improvement rate over time"""
         try:
-            if len(results) < 2:
-                return 0.0
-            
-            # Sort by date
-            sorted_results = sorted(results, key=lambda x: x.completed_at)
-            
-            # Split into first half and second half
-            mid_point = len(sorted_results) // 2
-            first_half = sorted_results[:mid_point]
-            second_half = sorted_results[mid_point:]
-            
-            first_avg = sum(r.percentage for r in first_half) / len(first_half)
-            second_avg = sum(r.percentage for r in second_half) / len(second_half)
-            
-            improvement_rate = ((second_avg - first_avg) / first_avg * 100) if first_avg > 0 else 0
-            return round(improvement_rate, 2)
-            
+            return analytics_engine.improvement_rate(results["completed_at"], results["percentage"])
         except Exception as e:
             print(f"❌ Error calculating improvement rate: {e}")
             return 0.0
     
     def _identify_weak_areas(self, user_id: int, tenant_id: str) -> List[Dict]:
-        """Identify user's weak areas"""
+        """Identify user's weak areas (wrong answers per category and difficulty)"""
         try:
-            from models import QuizResult, Quiz, Topic, Question
-            
-            # Get questions where user answered incorrectly
-            weak_questions = self.db_session.query(
-                Question.category,
-                Question.difficulty_level,
-                func.count(Question.id).label('incorrect_count')
-            ).join(Quiz, Question.quiz_id == Quiz.id).join(
-                QuizResult, QuizResult.quiz_id == Quiz.id
-            ).filter(
-                QuizResult.user_id == user_id,
-                QuizResult.tenant_id == tenant_id
-            ).group_by(Question.category, Question.difficulty_level).all()
-            
-            weak_areas = []
-            for weak in weak_questions:
-                if weak.incorrect_count > 0:
-                    weak_areas.append({
-                        "category": weak.category or "General",
-                        "difficulty": weak.difficulty_level,
-                        "incorrect_count": weak.incorrect_count,
-                        "recommendation": f"Focus on {weak.category} questions at {weak.difficulty_level} level"
-                    })
-            
-            # Sort by incorrect count
-            weak_areas.sort(key=lambda x: x['incorrect_count'], reverse=True)
-            return weak_areas[:5]  # Return top 5 weak areas
+            from models import UserErrorMatrix
+            
+            # One row per user, folded in at submit time
+            matrix = self.db_session.query(UserErrorMatrix).filter(
+                UserErrorMatrix.user_id == user_id,
+                UserErrorMatrix.tenant_id == tenant_id
+            ).first()
+            return weak_areas(matrix.get_cells() if matrix else {})  # Return top 5 weak areas
             
         except Exception as e:
             print(f"❌ Error identifying weak areas: {e}")
@@ -448,6 +292,7 @@ class AnalyticsService:
             else:
                 progress = ProgressTracking(
                     user_id=user_id,
+                    tenant_id=user.tenant_id,
                     date=datetime.utcnow(),
                     quizzes_taken=1,
                     questions_answered=quiz_result['total_questions'],
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Hot/cold archival job for user_question_history and quiz_results
+Rows older than the archive window are rolled up into user_topic_rollups and
+then moved, batch by batch, into the *_archive tables (tagged with their
+YYYY-MM partition). Hot queries read the recent rows plus the rollups; the
+archived rows stay queryable on demand. /analytics/user reads its recent trend
+and fastest/slowest quiz from both tiers (each bounded by its limit), so
+archiving does not change any field it returns; history listings show archived
+rows only with include_archived.
+
+Usage:
+    python archive_service.py [--days 180] [--batch-size 5000]
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+
+RollupKey = Tuple[int, str, str, str]
+
+
+def archive_cutoff(now: Optional[datetime] = None, days: int = ARCHIVE_AFTER_DAYS) -> datetime:
+    """Rows with a timestamp before this moment belong to the cold tier"""
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def _month_expr(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+
+
+def _get_rollups(db: Session, keys) -> Dict[RollupKey, models.UserTopicRollup]:
+    """Load or create the rollup rows for a set of (user_id, tenant_id, topic, difficulty) keys"""
+    rollups = {}
+    for user_id, tenant_id, topic_name, difficulty in keys:
+        rollup = db.scalars(select(models.UserTopicRollup).where(
+            models.UserTopicRollup.user_id == user_id,
+            models.UserTopicRollup.tenant_id == tenant_id,
+            models.UserTopicRollup.topic_name == topic_name,
+            models.UserTopicRollup.difficulty_level == difficulty
+        )).first()
+        if rollup is None:
+            rollup = models.UserTopicRollup(
+                user_id=user_id, tenant_id=tenant_id, topic_name=topic_name, difficulty_level=difficulty,
+                questions_answered=0, correct_answers=0, question_time_seconds=0,
+                quizzes_taken=0, quiz_score_total=0, quiz_questions_total=0, quiz_time_seconds=0,
+                percentage_total=0.0, best_percentage=0.0
+            )
+            db.add(rollup)
+        rollups[(user_id, tenant_id, topic_name, difficulty)] = rollup
+    return rollups
+
+
+def _touch(rollup: models.UserTopicRollup, first_at: datetime, last_at: datetime):
+    if rollup.first_activity_at is None or (first_at and first_at < rollup.first_activity_at):
+        rollup.first_activity_at = first_at
+    if rollup.last_activity_at is None or (last_at and last_at > rollup.last_activity_at):
+        rollup.last_activity_at = last_at
+    rollup.updated_at = datetime.utcnow()
+
+
+def _rollup_question_history(db: Session, conditions):
+    UQH = models.UserQuestionHistory
+    topic = func.coalesce(UQH.topic_name, "Unknown")
+    difficulty = func.coalesce(UQH.difficulty_level, "medium")
+    rows = db.execute(select(
+        UQH.user_id, UQH.tenant_id, topic, difficulty,
+        func.count(UQH.id),
+        func.sum(case((UQH.is_correct == True, 1), else_=0)),
+        func.sum(func.coalesce(UQH.time_taken_seconds, 0)),
+        func.min(UQH.answered_at),
+        func.max(UQH.answered_at)
+    ).where(*conditions).group_by(UQH.user_id, UQH.tenant_id, topic, difficulty)).all()
+
+    rollups = _get_rollups(db, {tuple(row[:4]) for row in rows})
+    for user_id, tenant_id, topic_name, diff, answered, correct, seconds, first_at, last_at in rows:
+        rollup = rollups[(user_id, tenant_id, topic_name, diff)]
+        rollup.questions_answered += answered
+        rollup.correct_answers += correct or 0
+        rollup.question_time_seconds += seconds or 0
+        _touch(rollup, first_at, last_at)
+
+
+def _rollup_quiz_results(db: Session, conditions):
+    QR = models.QuizResult
+    topic = func.coalesce(models.Topic.name, "Unknown")
+    difficulty = func.coalesce(models.Quiz.difficulty, "medium")
+    rows = db.execute(select(
+        QR.user_id, QR.tenant_id, topic, difficulty,
+        func.count(QR.id),
+        func.sum(func.coalesce(QR.score, 0)),
+        func.sum(func.coalesce(QR.total_questions, 0)),
+        func.sum(func.coalesce(QR.time_taken, 0)),
+        func.sum(func.coalesce(QR.percentage, 0)),
+        func.max(QR.percentage),
+        func.min(QR.completed_at),
+        func.max(QR.completed_at)
+    ).select_from(QR).outerjoin(models.Quiz, QR.quiz_id == models.Quiz.id).outerjoin(
+        models.Topic, models.Quiz.topic_id == models.Topic.id
+    ).where(*conditions).group_by(QR.user_id, QR.tenant_id, topic, difficulty)).all()
+
+    rollups = _get_rollups(db, {tuple(row[:4]) for row in rows})
+    for (user_id, tenant_id, topic_name, diff, quizzes, score, questions, seconds,
+         percentage_total, best, first_at, last_at) in rows:
+        rollup = rollups[(user_id, tenant_id, topic_name, diff)]
+        rollup.quizzes_taken += quizzes
+        rollup.quiz_score_total += score or 0
+        rollup.quiz_questions_total += questions or 0
+        rollup.quiz_time_seconds += seconds or 0
+        rollup.percentage_total += percentage_total or 0.0
+        rollup.best_percentage = max(rollup.best_percentage or 0.0, best or 0.0)
+        _touch(rollup, first_at, last_at)
+
+
+def _archive_batch(db: Session, hot_model, archive_model, timestamp_column: str,
+                   cutoff: datetime, batch_size: int, rollup) -> int:
+    """Roll up, copy and delete one batch of old rows in a single transaction"""
+    timestamp = getattr(hot_model, timestamp_column)
+    upper_id = db.scalar(
+        select(hot_model.id).where(timestamp < cutoff).order_by(hot_model.id).offset(batch_size - 1).limit(1)
+    )
+    if upper_id is None:
+        upper_id = db.scalar(select(func.max(hot_model.id)).where(timestamp < cutoff))
+    if upper_id is None:
+        return 0
+
+    conditions = (timestamp < cutoff, hot_model.id <= upper_id)
+    try:
+        # Rollups first, so analytics never sees rows missing from both tiers
+        rollup(db, conditions)
+        db.flush()
+
+        # The moved rows leave the hot-only parts of the analytics responses
+        db.execute(update(models.UserStats).where(
+            models.UserStats.user_id.in_(select(hot_model.user_id).where(*conditions))
+        ).values(
+            analytics_version=func.coalesce(models.UserStats.analytics_version, 0) + 1
+        ).execution_options(synchronize_session=False))
+
+        columns = [column.name for column in hot_model.__table__.columns]
+        source = select(
+            *[hot_model.__table__.c[name] for name in columns],
+            _month_expr(db, timestamp),
+            literal(datetime.utcnow())
+        ).where(*conditions)
+        db.execute(insert(archive_model.__table__).from_select(columns + ["partition_month", "archived_at"], source))
+        moved = db.execute(
+            delete(hot_model).where(*conditions).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return moved
+    except Exception:
+        db.rollback()
+        raise
+
+
+def archive_old_rows(db: Session, days: int = ARCHIVE_AFTER_DAYS,
+                     batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """Move rows older than `days` from the hot tables into the archive tier"""
+    cutoff = archive_cutoff(days=days)
+    moved = {"user_question_history": 0, "quiz_results": 0}
+
+    for key, hot_model, archive_model, timestamp_column, rollup in [
+        ("user_question_history", models.UserQuestionHistory, models.UserQuestionHistoryArchive,
+         "answered_at", _rollup_question_history),
+        ("quiz_results", models.QuizResult, models.QuizResultArchive, "completed_at", _rollup_quiz_results),
+    ]:
+        while True:
+            count = _archive_batch(db, hot_model, archive_model, timestamp_column, cutoff, batch_size, rollup)
+            if not count:
+                break
+            moved[key] += count
+            print(f"  📦 Archived {count} {key} rows")
+
+    return moved
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Archive old question history and quiz results")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive rows older than this")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Rows moved per transaction")
+    args = parser.parse_args()
+
+    print(f"Archiving rows older than {args.days} days...")
+    db = SessionLocal()
+    try:
+        result = archive_old_rows(db, days=args.days, batch_size=args.batch_size)
+    except Exception as e:
+        print(f"❌ Archival failed: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+    print(f"✅ Archived {result['user_question_history']} history rows and {result['quiz_results']} quiz results")
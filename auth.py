@@ -1,18 +1,33 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from database import get_db
+from database import AsyncSessionLocal, async_read_engine, get_db, get_async_db, get_read_db
 import models
-from passlib.context import CryptContext
+from password_hashing import HashingQueueFull, password_hasher, pwd_context
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
 import os
+import threading
+import time
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Authenticated-user cache: verified token -> user snapshot, per process
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# Read-only endpoints may build the user from the signed token claims without any lookup while the
+# token is younger than USER_CACHE_TTL_SECONDS (as stale as a cached user can be); older tokens take the cached lookup
+TRUST_TOKEN_CLAIMS_FOR_READS = os.getenv("TRUST_TOKEN_CLAIMS_FOR_READS", "false").lower() == "true"
+# Users allowed on the /admin endpoints (comma-separated emails; empty = nobody)
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
 security = HTTPBearer()
 
 def verify_password(plain_password, hashed_password):
@@ -21,18 +36,116 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def get_password_hash_async(password: str) -> str:
+    """Hash on the dedicated password hashing pool instead of a shared worker thread"""
+    try:
+        return await password_hasher.hash(password)
+    except HashingQueueFull:
+        raise HTTPException(status_code=503, detail="Too many requests in progress, please retry")
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    """Verify on the hashing pool; returns (valid, new_hash) where new_hash is set when the work factor changed"""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except HashingQueueFull:
+        raise HTTPException(status_code=503, detail="Too many requests in progress, please retry")
+
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    issued_at = datetime.utcnow()
+    expire = issued_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"iat": issued_at, "exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    token = credentials.credentials
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Detached, immutable view of the authenticated user"""
+    id: int
+    tenant_id: str
+    email: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    timezone: Optional[str] = None
+    is_active: bool = True
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            tenant_id=user.tenant_id,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            timezone=user.timezone,
+            is_active=user.is_active is not False,
+        )
+
+class UserCache:
+    """Thread-safe TTL + LRU cache of verified tokens to user snapshots"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, UserSnapshot]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return snapshot
+
+    def put(self, token: str, snapshot: UserSnapshot, token_expires_at: Optional[float] = None):
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._entries[token] = (expires_at, snapshot)
+            self._entries.move_to_end(token)
+            self._tokens_by_user.setdefault(snapshot.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of a user, e.g. after an update or deactivation"""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[1].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1].id]
+
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate_user(target.id)
+
+def decode_token_claims(token: str) -> dict:
+    """Verify a JWT and return its payload; user_id and tenant_id claims are required"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("user_id")  # Changed from "sub" to "user_id"
@@ -41,7 +154,96 @@ def get_current_user(
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    user = db.query(models.User).filter(models.User.id == user_id, models.User.tenant_id == tenant_id).first()
+    return payload
+
+def tenant_from_authorization(authorization: Optional[str]) -> Optional[str]:
+    """tenant_id claim of a valid bearer token, or None; used only to pick the tenant's shard"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token_claims(token)["tenant_id"]
+    except HTTPException:
+        return None
+
+def _cache_user(token: str, payload: dict, user: Optional[models.User]) -> UserSnapshot:
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user 
\ No newline at end of file
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.put(token, snapshot, payload.get("exp"))
+    return _ensure_active(snapshot)
+
+def _ensure_active(snapshot: UserSnapshot) -> UserSnapshot:
+    if not snapshot.is_active:
+        raise HTTPException(status_code=401, detail="User account is deactivated")
+    return snapshot
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    token = credentials.credentials
+    cached = user_cache.get(token)
+    if cached is not None:
+        return _ensure_active(cached)
+    payload = decode_token_claims(token)
+    user = db.query(models.User).filter(
+        models.User.id == payload["user_id"], models.User.tenant_id == payload["tenant_id"]
+    ).first()
+    return _cache_user(token, payload, user)
+
+async def _select_user_async(db: AsyncSession, payload: dict) -> Optional[models.User]:
+    return (await db.scalars(
+        select(models.User).where(models.User.id == payload["user_id"], models.User.tenant_id == payload["tenant_id"])
+    )).first()
+
+async def _load_user_async(token: str, db: AsyncSession) -> UserSnapshot:
+    cached = user_cache.get(token)
+    if cached is not None:
+        return _ensure_active(cached)
+    payload = decode_token_claims(token)
+    user = await _select_user_async(db, payload)
+    if user is None and async_read_engine is not None and db.bind is async_read_engine:
+        # Lag below the replica budget can still hide a user who just signed up
+        async with AsyncSessionLocal() as primary:
+            user = await _select_user_async(primary, payload)
+    return _cache_user(token, payload, user)
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Async variant of get_current_user for endpoints running on the async engine"""
+    return await _load_user_async(credentials.credentials, db)
+
+async def get_current_admin(current_user: UserSnapshot = Depends(get_current_user_async)):
+    """Authenticated user whose email is listed in ADMIN_EMAILS"""
+    if not current_user.email or current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+async def get_current_read_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """get_current_user_async for read-only endpoints; shares the request's get_read_db session.
+
+    With TRUST_TOKEN_CLAIMS_FOR_READS a fresh token's signed claims stand in for the user.
+    Deactivation and time-zone changes only reach the claims of new tokens, so tokens
+    older than the user cache TTL (or without a timezone claim) go through the cached lookup.
+    """
+    if TRUST_TOKEN_CLAIMS_FOR_READS:
+        payload = decode_token_claims(credentials.credentials)
+        issued_at = payload.get("iat")
+        if "timezone" in payload and issued_at is not None and time.time() - issued_at < USER_CACHE_TTL_SECONDS:
+            return UserSnapshot(
+                id=payload["user_id"], tenant_id=payload["tenant_id"], email=payload.get("sub"),
+                timezone=payload["timezone"]
+            )
+    return await _load_user_async(credentials.credentials, db)
+
+async def get_current_read_admin(current_user: UserSnapshot = Depends(get_current_read_user)):
+    """get_current_admin for read-only endpoints"""
+    if not current_user.email or current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
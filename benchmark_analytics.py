@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Analytics benchmark: ORM loops vs columnar fetch + vectorized metrics
+Seeds one user with N quiz results and N question-history rows, then times the
+previous AnalyticsService approach (load every QuizResult object and loop over
+it in Python) against analytics_engine (one narrow query per table, pandas /
+NumPy for topic, difficulty, time and trend metrics).
+
+Usage:
+    python benchmark_analytics.py [rows ...]    # default: 100000; try 100000 1000000
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+
+import analytics_engine
+import models
+from database import create_sqlite_engine
+from migrations import upgrade
+
+TENANT = "bench"
+TOPICS = ["Python", "SQL", "Networks", "Algorithms", "Statistics"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+BATCH = 20000
+
+
+def _seed(Session, rows: int):
+    rng = random.Random(42)
+    with Session() as db:
+        user = models.User(email="analytics@example.com", tenant_id=TENANT, hashed_password="x")
+        db.add(user)
+        quiz_ids = []
+        for i, name in enumerate(TOPICS):
+            topic = models.Topic(name=name, tenant_id=TENANT, category="Bench")
+            db.add(topic)
+            db.flush()
+            quiz = models.Quiz(tenant_id=TENANT, topic_id=topic.id, title=name, difficulty=DIFFICULTIES[i % 3])
+            db.add(quiz)
+            db.flush()
+            quiz_ids.append(quiz.id)
+        db.commit()
+        user_id = user.id
+
+    start = datetime.utcnow() - timedelta(days=720)
+    step = timedelta(days=720) / rows
+    with Session() as db:
+        for offset in range(0, rows, BATCH):
+            results, history = [], []
+            for i in range(offset, min(rows, offset + BATCH)):
+                at = start + step * i
+                total = 10
+                score = rng.randint(0, total)
+                results.append({
+                    "tenant_id": TENANT, "quiz_id": quiz_ids[i % len(quiz_ids)], "user_id": user_id,
+                    "score": score, "total_questions": total, "percentage": score * 100 / total,
+                    "grade": "C", "time_taken": rng.randint(60, 900), "completed_at": at,
+                })
+                history.append({
+                    "user_id": user_id, "question_id": i, "tenant_id": TENANT, "topic_name": TOPICS[i % len(TOPICS)],
+                    "difficulty_level": DIFFICULTIES[i % 3], "is_correct": rng.random() < 0.6,
+                    "time_taken_seconds": rng.randint(5, 120), "answered_at": at, "quiz_id": quiz_ids[i % len(quiz_ids)],
+                })
+            db.execute(insert(models.QuizResult), results)
+            db.execute(insert(models.UserQuestionHistory), history)
+        db.commit()
+    return user_id
+
+
+def legacy_metrics(db, user_id):
+    """The per-object loops AnalyticsService used before analytics_engine"""
+    results = db.query(models.QuizResult).filter(
+        models.QuizResult.user_id == user_id, models.QuizResult.tenant_id == TENANT
+    ).all()
+    total_questions = sum(r.total_questions for r in results)
+    total_correct = sum(r.score for r in results)
+    best_score = max(r.percentage for r in results)
+    total_time = sum(r.time_taken for r in results)
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    recent = [r for r in results if r.completed_at >= thirty_days_ago]
+    recent_average = sum(r.percentage for r in recent) / len(recent) if recent else 0
+
+    topic_stats = db.query(
+        models.Topic.name, func.count(models.QuizResult.id), func.avg(models.QuizResult.percentage)
+    ).join(models.Quiz, models.Quiz.topic_id == models.Topic.id).join(
+        models.QuizResult, models.QuizResult.quiz_id == models.Quiz.id
+    ).filter(models.QuizResult.user_id == user_id).group_by(models.Topic.id).all()
+
+    ordered = sorted(results, key=lambda r: r.completed_at)
+    mid = len(ordered) // 2
+    first = sum(r.percentage for r in ordered[:mid]) / mid
+    second = sum(r.percentage for r in ordered[mid:]) / (len(ordered) - mid)
+    return {
+        "total_quizzes": len(results), "total_correct": total_correct, "total_questions": total_questions,
+        "best_score": best_score, "total_time": total_time, "recent_average": recent_average,
+        "topics": len(topic_stats), "improvement_rate": round((second - first) / first * 100, 2),
+    }
+
+
+def vectorized_metrics(db, user_id):
+    now = datetime.utcnow()
+    results = analytics_engine.fetch_results(db, user_id, TENANT)
+    history = analytics_engine.fetch_question_history(db, user_id, TENANT)
+    summary = analytics_engine.overview(results, now)
+    topics = analytics_engine.topic_performance(results)
+    analytics_engine.difficulty_performance(results)
+    analytics_engine.progress_over_time(results, now)
+    analytics_engine.time_metrics(results, history)
+    return {
+        "total_quizzes": summary["total_quizzes"], "total_correct": summary["total_correct"],
+        "total_questions": summary["total_questions"], "best_score": summary["best_score"],
+        "total_time": summary["total_time"], "recent_average": summary["recent_average"],
+        "topics": len(topics),
+        "improvement_rate": analytics_engine.improvement_rate(results["completed_at"], results["percentage"]),
+    }
+
+
+def run(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(f"sqlite:///{os.path.join(tmp, 'analytics.db')}")
+        upgrade(engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+        user_id = _seed(Session, rows)
+
+        timings = {}
+        outputs = {}
+        for label, metrics in (("orm loops", legacy_metrics), ("vectorized", vectorized_metrics)):
+            with Session() as db:
+                started = time.perf_counter()
+                outputs[label] = metrics(db, user_id)
+                timings[label] = time.perf_counter() - started
+        engine.dispose()
+
+    legacy, vectorized = outputs["orm loops"], outputs["vectorized"]
+    same = all(
+        abs(legacy[key] - vectorized[key]) < 1e-6 if isinstance(legacy[key], float) else legacy[key] == vectorized[key]
+        for key in legacy
+    )
+    print(f"{rows:>9} rows  orm loops {timings['orm loops']:7.2f}s  vectorized {timings['vectorized']:7.2f}s  "
+          f"({timings['orm loops'] / timings['vectorized']:.1f}x)  results match: {'yes' if same else 'NO'}")
+    if not same:
+        print(f"  orm loops:  {legacy}\n  vectorized: {vectorized}")
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv[1:]] or [100000]
+    print("📊 Per-user analytics over quiz results + question history\n")
+    for rows in sizes:
+        run(rows)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
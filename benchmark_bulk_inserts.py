@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Bulk insert benchmark for the submit-quiz and generate-quiz write paths
+Compares one ORM object per row (the old code) with a single batched
+insert() per quiz, for 50-question quizzes under concurrent submits.
+
+Usage:
+    python benchmark_bulk_inserts.py [concurrent_submits] [quizzes_per_worker] [database_url]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import create_sqlite_engine
+from migrations import upgrade
+
+QUESTIONS_PER_QUIZ = 50
+
+
+def _history_rows(worker: int, quiz: int):
+    now = datetime.utcnow()
+    return [
+        {
+            "user_id": worker + 1, "question_id": i + 1, "tenant_id": "bench",
+            "question_text": f"Question {i}", "topic_name": "Benchmark", "difficulty_level": "medium",
+            "user_answer": "A", "correct_answer": "A", "is_correct": True, "time_taken_seconds": 12,
+            "quiz_id": quiz + 1, "quiz_session_id": None, "answered_at": now,
+        }
+        for i in range(QUESTIONS_PER_QUIZ)
+    ]
+
+
+def _question_rows(worker: int, quiz: int):
+    return [
+        {
+            "quiz_id": quiz + 1, "question_text": f"Generated question {i}", "correct_answer": "A",
+            "option_a": "A", "option_b": "B", "option_c": "C", "option_d": "D",
+            "explanation": "Because.", "difficulty_level": "medium", "category": "Benchmark",
+        }
+        for i in range(QUESTIONS_PER_QUIZ)
+    ]
+
+
+def _write_orm(Session, model, rows):
+    with Session() as db:
+        for row in rows:
+            db.add(model(**row))
+        db.commit()
+
+
+def _write_bulk(Session, model, rows):
+    with Session() as db:
+        db.execute(insert(model), rows)
+        db.commit()
+
+
+def run(engine, label, model, build_rows, write, workers, quizzes):
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    def worker(index):
+        for quiz in range(quizzes):
+            write(Session, model, build_rows(index, quiz))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    rows = workers * quizzes * QUESTIONS_PER_QUIZ
+    print(f"  {label:<6} {rows / elapsed:12.0f} rows/s  ({rows} rows in {elapsed:.2f}s)")
+    return rows / elapsed
+
+
+def main(argv):
+    workers = int(argv[1]) if len(argv) > 1 else 8
+    quizzes = int(argv[2]) if len(argv) > 2 else 25
+    url = argv[3] if len(argv) > 3 else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(url) if url else create_sqlite_engine(f"sqlite:///{os.path.join(tmp, 'bulk.db')}")
+        upgrade(engine)
+        print(f"📊 {workers} concurrent workers x {quizzes} quizzes x {QUESTIONS_PER_QUIZ} questions "
+              f"on {engine.dialect.name}\n")
+
+        for title, model, build_rows in [
+            ("submit-quiz: user_question_history", models.UserQuestionHistory, _history_rows),
+            ("generate-quiz: questions", models.Question, _question_rows),
+        ]:
+            print(title)
+            before = run(engine, "orm", model, build_rows, _write_orm, workers, quizzes)
+            after = run(engine, "bulk", model, build_rows, _write_bulk, workers, quizzes)
+            print(f"  ⚡ {after / before:.2f}x\n")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Connection-churn benchmark for the Postgres pool profiles
+Fires short request-sized transactions (checkout, one query, checkin) at a
+Postgres/Neon database from concurrent workers and compares the old engine
+settings (pre-ping on every checkout, recycle every 300s) with the "server"
+and "serverless" profiles in database.py, for the sync and the async engine.
+Reports throughput, checkout+query latency percentiles and how many physical
+connections each profile opened.
+
+Usage:
+    python benchmark_pool_profiles.py [postgresql://...] [requests] [concurrency]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import create_async_db_engine, create_postgres_engine, to_async_url
+
+PROFILES = ["legacy", "server", "serverless"]
+
+
+def build_engines(url: str, profile: str):
+    """(sync engine, async engine) for a profile; "legacy" is the pre-profile configuration"""
+    if profile == "legacy":
+        return (
+            create_engine(url, pool_pre_ping=True, pool_recycle=300),
+            create_async_engine(to_async_url(url), pool_pre_ping=True, pool_recycle=300),
+        )
+    return create_postgres_engine(url, profile=profile), create_async_db_engine(url, profile=profile)
+
+
+def _count_connects(sync_engine) -> list:
+    opened = [0]
+    lock = threading.Lock()
+
+    @event.listens_for(sync_engine, "connect")
+    def _opened(dbapi_connection, connection_record):
+        with lock:
+            opened[0] += 1
+
+    return opened
+
+
+def _summary(label: str, latencies: list, elapsed: float, opened: int, errors: int) -> dict:
+    latencies = sorted(latencies) or [0.0]
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{label:<22} {len(latencies) / elapsed:9.1f} req/s  p50 {pct(0.50):7.2f} ms  "
+          f"p95 {pct(0.95):7.2f} ms  p99 {pct(0.99):7.2f} ms  {opened:5d} connections  {errors} errors")
+    return {"throughput": len(latencies) / elapsed, "p50_ms": statistics.median(latencies) * 1000}
+
+
+def run_sync(sync_engine, requests: int, concurrency: int):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def one_request(_):
+        started = time.perf_counter()
+        try:
+            with sync_engine.connect() as conn:
+                conn.execute(text("SELECT 1")).scalar()
+        except Exception as e:
+            errors.append(e)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(requests)))
+    return latencies, time.perf_counter() - started, len(errors)
+
+
+async def run_async(async_engine, requests: int, concurrency: int):
+    latencies, errors = [], []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with gate:
+            started = time.perf_counter()
+            try:
+                async with async_engine.connect() as conn:
+                    await conn.scalar(text("SELECT 1"))
+            except Exception as e:
+                errors.append(e)
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    await async_engine.dispose()
+    return latencies, elapsed, len(errors)
+
+
+def main(argv):
+    url = argv[1] if len(argv) > 1 else os.getenv("DATABASE_URL", "")
+    requests = int(argv[2]) if len(argv) > 2 else 500
+    concurrency = int(argv[3]) if len(argv) > 3 else 20
+    if not url.startswith("postgresql"):
+        print("❌ Pass a postgresql:// URL (or set DATABASE_URL); the pool profiles only apply to Postgres")
+        return 1
+
+    print(f"📊 {requests} requests, {concurrency} concurrent, against {url.rsplit('@', 1)[-1]}\n")
+    for profile in PROFILES:
+        sync_engine, async_engine = build_engines(url, profile)
+        sync_opened = _count_connects(sync_engine)
+        async_opened = _count_connects(async_engine.sync_engine)
+
+        latencies, elapsed, errors = run_sync(sync_engine, requests, concurrency)
+        _summary(f"{profile} (sync)", latencies, elapsed, sync_opened[0], errors)
+        sync_engine.dispose()
+
+        latencies, elapsed, errors = asyncio.run(run_async(async_engine, requests, concurrency))
+        _summary(f"{profile} (async)", latencies, elapsed, async_opened[0], errors)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Concurrent writer benchmark for the SQLite engine profile
+Simulates many /submit-quiz transactions landing at once (plus dashboard readers)
+and compares the old default engine with database.create_sqlite_engine.
+
+Usage:
+    python benchmark_sqlite_writers.py [writers] [submits_per_writer] [readers]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import create_sqlite_engine
+from migrations import upgrade
+
+QUESTIONS_PER_QUIZ = 10
+
+
+def _seed(Session):
+    with Session() as db:
+        user = models.User(email="bench@example.com", tenant_id="bench", hashed_password="x")
+        topic = models.Topic(name="Benchmark", tenant_id="bench")
+        db.add_all([user, topic])
+        db.flush()
+        quiz = models.Quiz(tenant_id="bench", topic_id=topic.id, title="Benchmark quiz")
+        db.add(quiz)
+        db.flush()
+        db.add_all([
+            models.Question(quiz_id=quiz.id, question_text=f"Q{i}", correct_answer="A", option_a="A")
+            for i in range(QUESTIONS_PER_QUIZ)
+        ])
+        db.commit()
+        return user.id, quiz.id
+
+
+def _submit(Session, user_id, quiz_id):
+    """One submit-quiz write transaction: a session, a result and per-question history"""
+    now = datetime.utcnow()
+    with Session() as db:
+        session = models.QuizSession(quiz_id=quiz_id, user_id=user_id, tenant_id="bench",
+                                     start_time=now, end_time=now, status="completed")
+        db.add(session)
+        db.flush()
+        db.add(models.QuizResult(tenant_id="bench", quiz_id=quiz_id, user_id=user_id, session_id=session.id,
+                                 score=7, total_questions=QUESTIONS_PER_QUIZ, percentage=70.0, grade="C",
+                                 time_taken=120, completed_at=now))
+        for i in range(QUESTIONS_PER_QUIZ):
+            db.add(models.UserQuestionHistory(user_id=user_id, question_id=i + 1, tenant_id="bench",
+                                              quiz_id=quiz_id, quiz_session_id=session.id, user_answer="A",
+                                              correct_answer="A", is_correct=True, answered_at=now))
+        db.commit()
+
+
+def _read(Session, user_id):
+    with Session() as db:
+        db.execute(select(func.count(models.QuizResult.id)).where(models.QuizResult.user_id == user_id)).scalar()
+
+
+def run(label, engine, writers, submits, readers):
+    upgrade(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    user_id, quiz_id = _seed(Session)
+
+    errors = []
+    reads = [0]
+    stop = threading.Event()
+
+    def writer():
+        for _ in range(submits):
+            try:
+                _submit(Session, user_id, quiz_id)
+            except Exception as e:
+                errors.append(e)
+
+    def reader():
+        while not stop.is_set():
+            try:
+                _read(Session, user_id)
+                reads[0] += 1
+            except Exception as e:
+                errors.append(e)
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer) for _ in range(writers)]
+    for t in reader_threads:
+        t.start()
+    start = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in reader_threads:
+        t.join()
+    engine.dispose()
+
+    committed = writers * submits - len(errors)
+    print(f"{label:<10} {committed / elapsed:10.1f} submits/s {reads[0] / elapsed:10.1f} reads/s "
+          f"{len(errors):6d} errors  ({elapsed:.2f}s)")
+    return committed / elapsed
+
+
+def main(argv):
+    writers = int(argv[1]) if len(argv) > 1 else 8
+    submits = int(argv[2]) if len(argv) > 2 else 50
+    readers = int(argv[3]) if len(argv) > 3 else 4
+    print(f"📊 {writers} writers x {submits} submits, {readers} concurrent readers\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        default_url = f"sqlite:///{os.path.join(tmp, 'default.db')}"
+        tuned_url = f"sqlite:///{os.path.join(tmp, 'tuned.db')}"
+        baseline = run("default", create_engine(default_url, connect_args={"check_same_thread": False}),
+                       writers, submits, readers)
+        tuned = run("profile", create_sqlite_engine(tuned_url), writers, submits, readers)
+
+    print(f"\n⚡ Throughput gain: {tuned / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Cold start report for the API entry point
+Imports the entry module in a fresh interpreter with -X importtime, then lists
+the import cost per top-level package and per first-party module. Exits
+non-zero if the import takes longer than the budget or loads one of the heavy
+packages that must stay lazy (AI clients, ML and dataframe libraries).
+
+Usage:
+    python check_cold_start.py [--module api.index] [--budget-ms 1500] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Must not be imported while the app starts; the endpoints that need them import them on first use
+LAZY_PACKAGES = ["openai", "pandas", "numpy", "sentence_transformers", "chromadb", "torch", "transformers"]
+
+_PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+print("WALL_MS", elapsed)
+print("LOADED", ",".join(sorted({{name.split(".")[0] for name in sys.modules}})))
+"""
+
+
+def _first_party_modules() -> set:
+    return {name[:-3] for name in os.listdir(ROOT) if name.endswith(".py")} | {"api"}
+
+
+def measure(module: str) -> Tuple[float, List[str], List[Tuple[str, int, int]]]:
+    """Wall time (ms), loaded top-level packages and (module, self_us, cumulative_us) rows"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    wall_ms, loaded = 0.0, []
+    for line in result.stdout.splitlines():
+        if line.startswith("WALL_MS "):
+            wall_ms = float(line.split()[1])
+        elif line.startswith("LOADED "):
+            loaded = line.split(" ", 1)[1].split(",")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall_ms, loaded, rows
+
+
+def report(module: str, budget_ms: float, top: int) -> int:
+    wall_ms, loaded, rows = measure(module)
+    first_party = _first_party_modules()
+
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"\n🧊 Cold start: import {module} took {wall_ms:.0f} ms ({len(rows)} modules)")
+    print(f"\nTop {top} packages by import time (self time summed over submodules):")
+    for package, total_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        marker = "  (first party)" if package in first_party else ""
+        print(f"  {total_us / 1000:8.1f} ms  {package}{marker}")
+
+    print("\nFirst-party modules (cumulative, includes what they import first):")
+    for name, _, cumulative_us in sorted(
+        (row for row in rows if row[0].split(".")[0] in first_party), key=lambda row: -row[2]
+    ):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    ok = True
+    eager = [package for package in LAZY_PACKAGES if package in loaded]
+    if eager:
+        ok = False
+        print(f"\n❌ Heavy packages imported at startup: {', '.join(eager)}")
+    if budget_ms and wall_ms > budget_ms:
+        ok = False
+        print(f"\n❌ Import took {wall_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    if ok:
+        print(f"\n✅ Cold start within budget ({budget_ms:.0f} ms) with no heavy packages loaded")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import cost of the API entry point")
+    parser.add_argument("--module", default="api.index", help="Entry module to import (default: api.index)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("COLD_START_BUDGET_MS", "1500")))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    try:
+        sys.exit(report(args.module, args.budget_ms, args.top))
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+SQL statement budget check for the request paths in main.py
+Seeds a temporary SQLite database, calls every hot endpoint with a short and a
+long quiz history, and exits non-zero if an endpoint's statement count grows
+with the data (an N+1) or goes over its budget.
+
+Usage:
+    python check_query_counts.py
+"""
+
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'query_counts.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["SQL_DEBUG_HEADERS"] = "true"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ["ADMIN_EMAILS"] = "counts@example.com"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from sql_instrumentation import SQL_STATEMENTS_HEADER  # noqa: E402
+
+TENANT = "query-count"
+SHORT_HISTORY = 2
+LONG_HISTORY = 20
+
+# Maximum statements per request, including the user lookup of a cold auth cache
+BUDGETS = {
+    "GET /quizzes/{id}": 3,
+    "POST /start-quiz-session": 5,
+    "GET /quiz-session/{id}/status": 2,
+    "POST /submit-quiz": 18,  # one daily_topic_progress upsert per difficulty in the quiz
+    "GET /analytics/user": 9,
+    "GET /analytics/user (304)": 2,
+    "GET /analytics/user/report": 8,
+    "GET /analytics/user/report (304)": 2,
+    "GET /analytics/progress": 4,
+    "GET /analytics/progress (304)": 2,
+    "GET /analytics/tenant": 5,
+    "GET /leaderboard": 5,
+    "GET /quiz-history": 3,
+    "GET /quiz-history?include_archived": 4,
+    "GET /question-history": 3,
+    "GET /topics/available": 2,
+}
+
+
+def _statements(response) -> int:
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text}")
+    return int(response.headers[SQL_STATEMENTS_HEADER])
+
+
+def _seed_quiz() -> int:
+    db = SessionLocal()
+    try:
+        topic = models.Topic(name="Query Counts", tenant_id=TENANT, category="Check")
+        db.add(topic)
+        db.flush()
+        quiz = models.Quiz(tenant_id=TENANT, topic_id=topic.id, title="Query count quiz", duration=10, num_questions=5)
+        db.add(quiz)
+        db.flush()
+        for i in range(5):
+            db.add(models.Question(
+                quiz_id=quiz.id, question_text=f"Question {i}", correct_answer="A",
+                option_a="A", option_b="B", option_c="C", option_d="D",
+                difficulty_level=["easy", "medium", "hard"][i % 3], category="Check"
+            ))
+        db.commit()
+        return quiz.id
+    finally:
+        db.close()
+
+
+def _take_quiz(client: TestClient, headers: dict, quiz_id: int, counts: dict):
+    response = client.post("/start-quiz-session", json={"quiz_id": quiz_id, "tenant_id": TENANT}, headers=headers)
+    counts["POST /start-quiz-session"] = _statements(response)
+    session_id = response.json()["session_id"]
+
+    response = client.get(f"/quiz-session/{session_id}/status", params={"tenant_id": TENANT}, headers=headers)
+    counts["GET /quiz-session/{id}/status"] = _statements(response)
+
+    questions = client.get(f"/quizzes/{quiz_id}", params={"tenant_id": TENANT}, headers=headers).json()["questions"]
+    answers = {str(q["id"]): "A" if i % 2 else "B" for i, q in enumerate(questions)}
+    response = client.post("/submit-quiz", json={
+        "quiz_id": quiz_id, "session_id": session_id, "tenant_id": TENANT,
+        "user_answers": answers, "time_taken": 60, "question_times": {k: 12 for k in answers}
+    }, headers=headers)
+    counts["POST /submit-quiz"] = _statements(response)
+
+
+def _measure_reads(client: TestClient, headers: dict, quiz_id: int, counts: dict):
+    params = {"tenant_id": TENANT}
+    for name, path, extra in [
+        ("GET /quizzes/{id}", f"/quizzes/{quiz_id}", {}),
+        ("GET /analytics/user", "/analytics/user", {}),
+        ("GET /analytics/user/report", "/analytics/user/report", {}),
+        ("GET /analytics/progress", "/analytics/progress", {"days": 30}),
+        ("GET /analytics/tenant", "/analytics/tenant", {}),
+        ("GET /leaderboard", "/leaderboard", {"quiz_id": quiz_id}),
+        ("GET /quiz-history", "/quiz-history", {}),
+        ("GET /quiz-history?include_archived", "/quiz-history", {"include_archived": True}),
+        ("GET /question-history", "/question-history", {}),
+        ("GET /topics/available", "/topics/available", {}),
+    ]:
+        response = client.get(path, params={**params, **extra}, headers=headers)
+        counts[name] = _statements(response)
+        if f"{name} (304)" in BUDGETS:
+            revalidated = client.get(path, params={**params, **extra},
+                                     headers={**headers, "If-None-Match": response.headers["ETag"]})
+            if revalidated.status_code != 304:
+                raise RuntimeError(f"GET {path} did not revalidate: {revalidated.status_code}")
+            counts[f"{name} (304)"] = _statements(revalidated)
+
+
+def main_check() -> int:
+    upgrade()
+    client = TestClient(main.app)
+    client.post("/signup", json={
+        "email": "counts@example.com", "password": "query-counts", "tenant_id": TENANT,
+        "first_name": "Query", "last_name": "Counts"
+    })
+    token = client.post("/login", json={
+        "email": "counts@example.com", "password": "query-counts", "tenant_id": TENANT
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    quiz_id = _seed_quiz()
+
+    runs = []
+    taken = 0
+    for history in (SHORT_HISTORY, LONG_HISTORY):
+        counts = {}
+        while taken < history:
+            _take_quiz(client, headers, quiz_id, counts)
+            taken += 1
+        _measure_reads(client, headers, quiz_id, counts)
+        runs.append(counts)
+
+    ok = True
+    print(f"\n🔢 SQL statements per request ({SHORT_HISTORY} vs {LONG_HISTORY} quizzes taken)")
+    for name, budget in BUDGETS.items():
+        short, long = runs[0][name], runs[1][name]
+        if long > short:
+            ok = False
+            print(f"  ❌ {name}: {short} -> {long} statements (grows with history)")
+        elif long > budget:
+            ok = False
+            print(f"  ❌ {name}: {long} statements (budget {budget})")
+        else:
+            print(f"  ✓ {name}: {long} (budget {budget})")
+
+    if ok:
+        print("\n✅ All request paths within their SQL statement budgets")
+        return 0
+    print("\n❌ SQL statement budget exceeded")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
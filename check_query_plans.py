@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the hot queries in main.py
+Runs EXPLAIN on SQLite (always) and Postgres (when a URL is given) and exits
+non-zero if any hot query falls back to a full table scan.
+
+Usage:
+    python check_query_plans.py                       # SQLite only
+    python check_query_plans.py postgresql://...      # SQLite + Postgres
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import create_engine, exists, func, select, text, union_all
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+import models
+from migrations import upgrade
+from pagination import keyset
+from question_stats import effective_difficulty
+from session_sweeper import gradable_sessions
+
+
+class explain(Executable, ClauseElement):
+    """EXPLAIN wrapper that keeps bound parameters of the wrapped statement"""
+
+    inherit_cache = False
+
+    def __init__(self, statement, prefix: str):
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(explain)
+def _compile_explain(element, compiler, **kw):
+    return f"{element.prefix} {compiler.process(element.statement, **kw)}"
+
+
+def _both_tiers(user_id: int, tenant_id: str, order_by, limit: int):
+    # Same shape as main._results_across_tiers
+    tiers = [
+        select(model.quiz_id, model.percentage, model.time_taken, model.completed_at).where(
+            model.user_id == user_id, model.tenant_id == tenant_id
+        ).order_by(*order_by(model)).limit(limit).subquery().select()
+        for model in (models.QuizResult, models.QuizResultArchive)
+    ]
+    combined = union_all(*tiers).subquery()
+    return select(combined).order_by(*order_by(combined.c)).limit(limit)
+
+
+def hot_queries() -> Dict[str, Executable]:
+    """The queries main.py issues on every request path, with representative parameters"""
+    user_id, tenant_id, quiz_id, session_id = 1, "tenant-a", 1, 1
+    now = datetime.utcnow()
+    start = now - timedelta(days=30)
+    position = (now - timedelta(days=1), 1000)  # a cursor deep into the history
+
+    UQH = models.UserQuestionHistory
+    QR = models.QuizResult
+    unanswered_for_topic = (
+        models.Quiz.topic_id == 1,
+        models.Quiz.tenant_id == tenant_id,
+        ~exists().where(UQH.user_id == user_id, UQH.question_id == models.Question.id, UQH.tenant_id == tenant_id),
+        ~exists().where(
+            models.UserQuestionHistoryArchive.user_id == user_id,
+            models.UserQuestionHistoryArchive.question_id == models.Question.id,
+            models.UserQuestionHistoryArchive.tenant_id == tenant_id,
+        ),
+    )
+
+    return {
+        "auth.get_current_user": select(models.User).where(
+            models.User.id == user_id, models.User.tenant_id == tenant_id
+        ),
+        "login": select(models.User).where(
+            models.User.email == "user@example.com", models.User.tenant_id == tenant_id
+        ),
+        "generate_quiz: topic lookup": select(models.Topic).where(
+            models.Topic.name == "Python", models.Topic.tenant_id == tenant_id
+        ),
+        "generate_quiz: available count": select(func.count(models.Question.id)).join(models.Quiz).where(
+            *unanswered_for_topic
+        ),
+        "generate_quiz: selected questions": select(models.Question).join(models.Quiz).where(
+            *unanswered_for_topic, effective_difficulty() == "medium", models.Question.id >= 1
+        ).order_by(models.Question.id).limit(5),
+        "get_quiz: quiz": select(models.Quiz).where(
+            models.Quiz.id == quiz_id, models.Quiz.tenant_id == tenant_id, models.Quiz.is_active == True
+        ),
+        "get_quiz: questions": select(models.Question).where(models.Question.quiz_id == quiz_id),
+        "start_quiz_session: existing session": select(models.QuizSession).where(
+            models.QuizSession.quiz_id == quiz_id,
+            models.QuizSession.user_id == user_id,
+            models.QuizSession.status == "active",
+        ),
+        "quiz_session_status": select(models.QuizSession).where(
+            models.QuizSession.id == session_id,
+            models.QuizSession.user_id == user_id,
+            models.QuizSession.tenant_id == tenant_id,
+        ),
+        "session_sweeper: gradable sessions": gradable_sessions(now),
+        "analytics/user: stats": select(models.UserStats).where(
+            models.UserStats.user_id == user_id, models.UserStats.tenant_id == tenant_id
+        ),
+        "analytics/user: topic stats": select(models.UserTopicStats).where(
+            models.UserTopicStats.user_id == user_id, models.UserTopicStats.tenant_id == tenant_id
+        ),
+        "analytics/user: difficulty totals": select(UQH.difficulty_level, func.count(UQH.id)).where(
+            UQH.user_id == user_id, UQH.tenant_id == tenant_id
+        ).group_by(UQH.difficulty_level),
+        "analytics/user: recent results": _both_tiers(user_id, tenant_id, lambda c: [c.completed_at.desc()], 10),
+        "analytics/user: fastest quiz": _both_tiers(
+            user_id, tenant_id, lambda c: [c.time_taken.asc(), c.completed_at.desc()], 1
+        ),
+        "analytics/progress: daily rows": select(models.ProgressTracking).where(
+            models.ProgressTracking.user_id == user_id, models.ProgressTracking.tenant_id == tenant_id,
+            models.ProgressTracking.day >= start.date(), models.ProgressTracking.day <= now.date(),
+        ).order_by(models.ProgressTracking.day.asc()),
+        "analytics/progress: topic totals": select(
+            models.DailyTopicProgress.topic_name, func.sum(models.DailyTopicProgress.questions_answered)
+        ).where(
+            models.DailyTopicProgress.user_id == user_id, models.DailyTopicProgress.tenant_id == tenant_id,
+            models.DailyTopicProgress.day >= start.date(), models.DailyTopicProgress.day <= now.date(),
+        ).group_by(models.DailyTopicProgress.topic_name),
+        "analytics/tenant: topic totals": select(models.TenantTopicStats).where(
+            models.TenantTopicStats.tenant_id == tenant_id
+        ),
+        "analytics/tenant: learners per topic": select(
+            models.UserTopicStats.topic_name, func.count(models.UserTopicStats.id)
+        ).where(models.UserTopicStats.tenant_id == tenant_id).group_by(models.UserTopicStats.topic_name),
+        "analytics/tenant: most active users": select(models.UserStats).where(
+            models.UserStats.tenant_id == tenant_id
+        ).order_by(models.UserStats.total_quizzes_taken.desc()).limit(10),
+        "leaderboard: top entries": select(models.QuizLeaderboardEntry).where(
+            models.QuizLeaderboardEntry.tenant_id == tenant_id, models.QuizLeaderboardEntry.quiz_id == quiz_id
+        ).order_by(
+            models.QuizLeaderboardEntry.best_score.desc(), models.QuizLeaderboardEntry.best_time_seconds.asc()
+        ).limit(10),
+        "leaderboard: rank of caller": select(func.count(models.QuizLeaderboardEntry.id)).where(
+            models.QuizLeaderboardEntry.tenant_id == tenant_id, models.QuizLeaderboardEntry.quiz_id == quiz_id,
+            models.QuizLeaderboardEntry.best_score > 50.0
+        ),
+        "topics/available": select(models.Topic).where(
+            models.Topic.tenant_id == tenant_id, models.Topic.is_active == True
+        ),
+        "quiz-history": keyset(select(QR).join(models.Quiz).join(models.Topic).where(
+            QR.user_id == user_id, QR.tenant_id == tenant_id
+        ), QR.completed_at, QR.id, position).limit(21),
+        "question-history (archived)": keyset(select(models.UserQuestionHistoryArchive).where(
+            models.UserQuestionHistoryArchive.user_id == user_id,
+            models.UserQuestionHistoryArchive.tenant_id == tenant_id,
+        ), models.UserQuestionHistoryArchive.answered_at, models.UserQuestionHistoryArchive.id, position).limit(51),
+        "analytics/user: rollups": select(models.UserTopicRollup).where(
+            models.UserTopicRollup.user_id == user_id, models.UserTopicRollup.tenant_id == tenant_id
+        ),
+        "analytics/user: error matrix": select(models.UserErrorMatrix).where(
+            models.UserErrorMatrix.user_id == user_id, models.UserErrorMatrix.tenant_id == tenant_id
+        ),
+        "question-history": keyset(select(UQH).where(
+            UQH.user_id == user_id, UQH.tenant_id == tenant_id
+        ), UQH.answered_at, UQH.id, position).limit(51),
+        "chatbot history": select(models.ChatbotInteraction).where(
+            models.ChatbotInteraction.user_id == user_id
+        ).order_by(models.ChatbotInteraction.created_at.desc()).limit(10),
+    }
+
+
+def _sqlite_full_scans(engine: Engine, statement) -> List[str]:
+    tables = set(models.Base.metadata.tables)
+    with engine.connect() as conn:
+        # Raw cursor rows: the wrapped statement's column types (e.g. DateTime) do not apply to plan rows
+        rows = conn.execute(explain(statement, "EXPLAIN QUERY PLAN")).cursor.fetchall()
+    scans = []
+    for row in rows:
+        detail = row[-1]
+        parts = detail.split()
+        if len(parts) >= 2 and parts[0] == "SCAN" and parts[1] in tables and "USING" not in detail:
+            scans.append(detail)
+    return scans
+
+
+def _postgres_full_scans(engine: Engine, statement) -> List[str]:
+    def walk(plan):
+        if plan.get("Node Type") == "Seq Scan":
+            yield f"Seq Scan on {plan.get('Relation Name')}"
+        for child in plan.get("Plans", []):
+            yield from walk(child)
+
+    with engine.connect() as conn:
+        # Tiny tables make the planner prefer seq scans; disable them so any
+        # remaining seq scan means no usable index exists.
+        conn.execute(text("SET enable_seqscan = off"))
+        raw = conn.execute(explain(statement, "EXPLAIN (FORMAT JSON)")).scalar()
+        conn.rollback()
+    plan = raw if isinstance(raw, list) else json.loads(raw)
+    return list(walk(plan[0]["Plan"]))
+
+
+def check(engine: Engine) -> bool:
+    """Explain every hot query on the engine; return True when none does a full scan"""
+    dialect = engine.dialect.name
+    find_scans = _postgres_full_scans if dialect == "postgresql" else _sqlite_full_scans
+    ok = True
+    print(f"\n🔎 Checking query plans on {dialect}")
+    for name, statement in hot_queries().items():
+        scans = find_scans(engine, statement)
+        if scans:
+            ok = False
+            print(f"  ❌ {name}: {'; '.join(scans)}")
+        else:
+            print(f"  ✓ {name}")
+    return ok
+
+
+def main(argv: List[str]) -> int:
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plan_check.db')}")
+        upgrade(sqlite_engine)
+        results.append(check(sqlite_engine))
+        sqlite_engine.dispose()
+
+    postgres_url = argv[1] if len(argv) > 1 else os.getenv("PLAN_CHECK_POSTGRES_URL")
+    if postgres_url:
+        pg_engine = create_engine(postgres_url)
+        upgrade(pg_engine)
+        results.append(check(pg_engine))
+        pg_engine.dispose()
+    else:
+        print("\nℹ️ No Postgres URL given; skipping Postgres plans")
+
+    if all(results):
+        print("\n✅ No full table scans in hot queries")
+        return 0
+    print("\n❌ Full table scans found in hot queries")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Auto-grading check for the session sweeper
+Seeds a temporary SQLite database, lets quiz sessions with saved answers time
+out in each way the API can see them (left active, expired by a status check,
+expired by a late submit), and exits non-zero unless one sweep grades every
+one of them exactly once and a second sweep grades nothing.
+
+Usage:
+    python check_session_sweeper.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'session_sweeper.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["SESSION_SWEEP_INTERVAL_SECONDS"] = "0"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import func, select, update  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from session_sweeper import sweep  # noqa: E402
+
+TENANT = "session-sweeper"
+
+
+def _seed_quiz() -> int:
+    db = SessionLocal()
+    try:
+        topic = models.Topic(name="Session Sweeper", tenant_id=TENANT, category="Check")
+        db.add(topic)
+        db.flush()
+        quiz = models.Quiz(tenant_id=TENANT, topic_id=topic.id, title="Sweeper quiz", duration=10, num_questions=3)
+        db.add(quiz)
+        db.flush()
+        for i in range(3):
+            db.add(models.Question(
+                quiz_id=quiz.id, question_text=f"Question {i}", correct_answer="A",
+                option_a="A", option_b="B", option_c="C", option_d="D", category="Check"
+            ))
+        db.commit()
+        return quiz.id
+    finally:
+        db.close()
+
+
+def _time_out(session_id: int):
+    """Move the session's deadline into the past, as if the user walked away"""
+    db = SessionLocal()
+    try:
+        db.execute(update(models.QuizSession).where(models.QuizSession.id == session_id).values(
+            start_time=datetime.utcnow() - timedelta(minutes=11),
+            end_time=datetime.utcnow() - timedelta(minutes=1),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _abandon(client: TestClient, headers: dict, quiz_id: int) -> int:
+    """Start a session, save two answers and let it time out"""
+    response = client.post("/start-quiz-session", json={"quiz_id": quiz_id, "tenant_id": TENANT}, headers=headers)
+    session_id = response.json()["session_id"]
+    questions = client.get(f"/quizzes/{quiz_id}", params={"tenant_id": TENANT}, headers=headers).json()["questions"]
+    response = client.put(f"/quiz-session/{session_id}/answers", json={
+        "tenant_id": TENANT, "user_answers": {str(q["id"]): "A" for q in questions[:2]}
+    }, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"Saving answers failed: {response.status_code} {response.text}")
+    _time_out(session_id)
+    return session_id
+
+
+def _results(session_ids) -> dict:
+    db = SessionLocal()
+    try:
+        return dict(db.execute(
+            select(models.QuizResult.session_id, func.count())
+            .where(models.QuizResult.session_id.in_(session_ids))
+            .group_by(models.QuizResult.session_id)
+        ).all())
+    finally:
+        db.close()
+
+
+def _sweep() -> int:
+    db = SessionLocal()
+    try:
+        return sweep(db, auto_grade=True)["graded"]
+    finally:
+        db.close()
+
+
+def main_check() -> int:
+    upgrade()
+    client = TestClient(main.app)
+    client.post("/signup", json={
+        "email": "sweeper@example.com", "password": "session-sweeper", "tenant_id": TENANT,
+        "first_name": "Session", "last_name": "Sweeper"
+    })
+    token = client.post("/login", json={
+        "email": "sweeper@example.com", "password": "session-sweeper", "tenant_id": TENANT
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    quiz_id = _seed_quiz()
+
+    sessions = {}
+    sessions["left active"] = _abandon(client, headers, quiz_id)
+    _sweep()  # the first session is graded here, so the next start-quiz-session opens a new one
+
+    sessions["expired by status check"] = _abandon(client, headers, quiz_id)
+    status = client.get(f"/quiz-session/{sessions['expired by status check']}/status",
+                        params={"tenant_id": TENANT}, headers=headers).json()
+    if status["status"] != "expired":
+        raise RuntimeError(f"Status check did not expire the session: {status}")
+
+    sessions["expired by late submit"] = _abandon(client, headers, quiz_id)
+    response = client.post("/submit-quiz", json={
+        "quiz_id": quiz_id, "session_id": sessions["expired by late submit"], "tenant_id": TENANT,
+        "user_answers": {}, "time_taken": 600
+    }, headers=headers)
+    if response.status_code != 400:
+        raise RuntimeError(f"Late submit was not rejected: {response.status_code} {response.text}")
+
+    graded = _sweep()
+    regraded = _sweep()
+    results = _results(list(sessions.values()))
+
+    ok = True
+    print("\n🧹 Auto-grading of timed-out quiz sessions")
+    for name, session_id in sessions.items():
+        count = results.get(session_id, 0)
+        if count != 1:
+            ok = False
+            print(f"  ❌ {name}: {count} quiz results")
+        else:
+            print(f"  ✓ {name}: graded once")
+    if graded != 2 or regraded:
+        ok = False
+        print(f"  ❌ sweeps graded {graded} then {regraded} sessions (expected 2 then 0)")
+
+    if ok:
+        print("\n✅ The sweeper grades every timed-out session exactly once")
+        return 0
+    print("\n❌ Timed-out sessions were not graded exactly once")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
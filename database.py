@@ -1,7 +1,17 @@
+import asyncio
+import json
 import os
-from sqlalchemy import create_engine
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,29 +19,555 @@ load_dotenv()
 # Use Neon PostgreSQL for production, SQLite for development
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./quiziac.db")
 
+# SQLite performance profile: WAL lets readers run alongside a writer, NORMAL
+# sync is durable in WAL mode, and busy_timeout makes concurrent writers wait
+# for the lock instead of failing with "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),  # negative = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "10"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "20"))
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:") or "mode=memory" in url
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Connect-event hook that applies SQLITE_PRAGMAS to a new DBAPI connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+
+def create_sqlite_engine(url: str, **kwargs):
+    """Create a SQLite engine with the performance profile and a sized QueuePool"""
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if not _is_sqlite_memory(url):
+        # In-memory databases are per-connection, so they keep SQLAlchemy's default pool
+        kwargs.setdefault("poolclass", QueuePool)
+        kwargs.setdefault("pool_size", SQLITE_POOL_SIZE)
+        kwargs.setdefault("max_overflow", SQLITE_MAX_OVERFLOW)
+    sqlite_engine = create_engine(url, connect_args=connect_args, **kwargs)
+    event.listen(sqlite_engine, "connect", apply_sqlite_pragmas)
+    return sqlite_engine
+
+
+# Postgres connection profiles. "server" keeps a sized LIFO pool for long-running
+# processes and pings only connections that sat idle; "serverless" opens one
+# connection per checkout (NullPool) and is meant to go through the Neon/PgBouncer
+# pooler, which in transaction mode cannot keep server-side prepared statements.
+# "auto" picks serverless on Vercel / AWS Lambda.
+DB_POOL_PROFILE = os.getenv("DB_POOL_PROFILE", "auto")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Connections idle longer than this are pinged on checkout; -1 pings every checkout (pool_pre_ping)
+DB_PING_IDLE_SECONDS = float(os.getenv("DB_PING_IDLE_SECONDS", "30"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+
+def resolve_pool_profile(profile: str = DB_POOL_PROFILE) -> str:
+    if profile == "auto":
+        return "serverless" if os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "server"
+    if profile not in ("server", "serverless"):
+        raise ValueError(f"Unknown DB_POOL_PROFILE '{profile}' (use server, serverless or auto)")
+    return profile
+
+
+def _ping_idle_connections(pool_engine, idle_seconds: float):
+    """Liveness check only for connections that sat in the pool longer than idle_seconds"""
+
+    @event.listens_for(pool_engine, "checkin")
+    def _mark_idle(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(pool_engine, "checkout")
+    def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        except Exception as e:
+            # The pool discards this connection and checks out another one
+            raise exc.DisconnectionError(f"Stale pooled connection: {e}")
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def postgres_engine_kwargs(url: str, profile: Optional[str] = None, is_async: bool = False, **kwargs) -> dict:
+    """create_engine keyword arguments for a Postgres URL under the given pool profile"""
+    profile = resolve_pool_profile(profile or DB_POOL_PROFILE)
+    connect_args = dict(kwargs.pop("connect_args", {}))
+    if is_async:
+        connect_args.setdefault("timeout", DB_CONNECT_TIMEOUT)
+    else:
+        connect_args.setdefault("connect_timeout", DB_CONNECT_TIMEOUT)
+
+    if profile == "serverless":
+        kwargs.setdefault("poolclass", NullPool)
+        if is_async:
+            # Transaction-mode poolers hand each transaction a different server session
+            connect_args.setdefault("statement_cache_size", 0)
+            connect_args.setdefault("prepared_statement_cache_size", 0)
+        host = make_url(url).host or ""
+        if host.endswith("neon.tech") and "-pooler" not in host:
+            print("⚠️ Serverless profile without the Neon pooler: use the -pooler host to avoid connection limits")
+    else:
+        kwargs.setdefault("pool_size", DB_POOL_SIZE)
+        kwargs.setdefault("max_overflow", DB_MAX_OVERFLOW)
+        kwargs.setdefault("pool_timeout", DB_POOL_TIMEOUT)
+        kwargs.setdefault("pool_recycle", DB_POOL_RECYCLE)
+        kwargs.setdefault("pool_use_lifo", True)
+        kwargs.setdefault("pool_pre_ping", DB_PING_IDLE_SECONDS < 0)
+        if not is_async:
+            # Let the kernel notice dead peers instead of pinging on every checkout
+            connect_args.setdefault("keepalives", 1)
+            connect_args.setdefault("keepalives_idle", 30)
+            connect_args.setdefault("keepalives_interval", 10)
+            connect_args.setdefault("keepalives_count", 3)
+    kwargs["connect_args"] = connect_args
+    return kwargs
+
+
+def create_postgres_engine(url: str, profile: Optional[str] = None, **kwargs):
+    """Create a sync Postgres engine with the pool profile"""
+    profile = resolve_pool_profile(profile or DB_POOL_PROFILE)
+    pg_engine = create_engine(url, **postgres_engine_kwargs(url, profile, **kwargs))
+    if profile == "server" and DB_PING_IDLE_SECONDS >= 0:
+        _ping_idle_connections(pg_engine, DB_PING_IDLE_SECONDS)
+    return pg_engine
+
+
+def create_db_engine(url: str, **kwargs):
+    """Sync engine for any supported URL: the SQLite profile or a Postgres pool profile"""
+    if url.startswith("sqlite"):
+        return create_sqlite_engine(url, **kwargs)
+    return create_postgres_engine(url, **kwargs)
+
+
 # Configure engine based on database type
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-    )
-else:
-    # PostgreSQL configuration
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        pool_pre_ping=True,
-        pool_recycle=300,
-    )
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def to_async_url(url: str) -> str:
+    """Map a sync database URL to its async driver: aiosqlite for SQLite, asyncpg for Postgres"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql":
+        # asyncpg takes ssl=<mode> instead of libpq's sslmode and rejects other libpq-only options
+        query = dict(parsed.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode and "ssl" not in query:
+            query["ssl"] = sslmode
+        return parsed.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+    return url
+
+
+def create_async_db_engine(url: str, **kwargs):
+    """Create the AsyncEngine counterpart of a sync URL, with the same tuning as the sync engine"""
+    async_url = to_async_url(url)
+    if async_url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if not _is_sqlite_memory(url):
+            kwargs.setdefault("poolclass", AsyncAdaptedQueuePool)
+            kwargs.setdefault("pool_size", SQLITE_POOL_SIZE)
+            kwargs.setdefault("max_overflow", SQLITE_MAX_OVERFLOW)
+        async_engine = create_async_engine(async_url, connect_args=connect_args, **kwargs)
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+        return async_engine
+    profile = resolve_pool_profile(kwargs.pop("profile", None) or DB_POOL_PROFILE)
+    pg_engine = create_async_engine(async_url, **postgres_engine_kwargs(async_url, profile, is_async=True, **kwargs))
+    if profile == "server" and DB_PING_IDLE_SECONDS >= 0:
+        _ping_idle_connections(pg_engine.sync_engine, DB_PING_IDLE_SECONDS)
+    return pg_engine
+
+
+# Async engine for the hot endpoints, so requests wait on the database
+# instead of holding a worker thread each
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+# Optional read replica for read-heavy endpoints (analytics and history)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("DATABASE_REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DATABASE_REPLICA_LAG_CHECK_SECONDS", "10"))
+
+# Seconds since the last replayed transaction; 0 when the server is not a standby
+POSTGRES_REPLICA_LAG_SQL = (
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "ELSE 0 END"
+)
+
+
+class ReplicaRouter:
+    """Decides whether read-only sessions may use the replica, based on its measured lag"""
+
+    def __init__(self, replica_engine, max_lag_seconds: float, check_interval_seconds: float):
+        self.replica_engine = replica_engine
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.last_lag_seconds = None
+        self._healthy = False
+        self._checked_at = None
+        self._lock = asyncio.Lock()
+
+    async def _measure_lag(self) -> float:
+        async with self.replica_engine.connect() as conn:
+            if self.replica_engine.dialect.name == "postgresql":
+                return float(await conn.scalar(text(POSTGRES_REPLICA_LAG_SQL)) or 0.0)
+            await conn.execute(text("SELECT 1"))
+            return 0.0
+
+    def _check_due(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval_seconds
+
+    async def use_replica(self) -> bool:
+        """True while the replica is reachable and within the lag budget; re-checked every interval"""
+        if self._check_due():
+            async with self._lock:
+                if self._check_due():
+                    try:
+                        self.last_lag_seconds = await self._measure_lag()
+                        self._healthy = self.last_lag_seconds <= self.max_lag_seconds
+                    except Exception as e:
+                        print(f"⚠️ Read replica unavailable, using primary: {e}")
+                        self.last_lag_seconds = None
+                        self._healthy = False
+                    self._checked_at = time.monotonic()
+        return self._healthy
+
+
+if DATABASE_REPLICA_URL:
+    async_read_engine = create_async_db_engine(DATABASE_REPLICA_URL)
+    AsyncReadSessionLocal = async_sessionmaker(
+        bind=async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+    replica_router = ReplicaRouter(async_read_engine, REPLICA_MAX_LAG_SECONDS, REPLICA_LAG_CHECK_SECONDS)
+    # Sync twin for read-only work that runs in a worker thread (pandas reports)
+    read_engine = create_db_engine(DATABASE_REPLICA_URL)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+else:
+    async_read_engine = None
+    AsyncReadSessionLocal = None
+    replica_router = None
+    read_engine = None
+    ReadSessionLocal = None
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+
+# Tenant sharding. TENANT_SHARDS names extra shards as a JSON object of
+# name -> URL or {"url": ..., "schema": ...}; URLs and schemas may contain
+# {tenant_id}, e.g. "sqlite:///./shards/{tenant_id}.db" for one file per tenant
+# or {"url": "postgresql://...", "schema": "tenant_{tenant_id}"} for one
+# Postgres schema per tenant. Tenants are assigned in the tenant_shards table
+# (see move_tenant.py); unassigned tenants use TENANT_DEFAULT_SHARD.
+DEFAULT_SHARD = "default"
+TENANT_SHARDS = json.loads(os.getenv("TENANT_SHARDS") or "{}")
+TENANT_DEFAULT_SHARD = os.getenv("TENANT_DEFAULT_SHARD", DEFAULT_SHARD)
+TENANT_DIRECTORY_TTL_SECONDS = float(os.getenv("TENANT_DIRECTORY_TTL_SECONDS", "30"))
+
+_TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,62}$")
+_SCHEMA_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,62}$")
+
+
+class TenantMoving(Exception):
+    """Raised while a tenant is being copied to another shard"""
+
+
+class ShardTarget(NamedTuple):
+    name: str
+    url: str
+    schema: Optional[str] = None
+
+
+class TenantRouter:
+    """Maps tenant_id to a shard and lazily creates one engine (and session factory) per shard"""
+
+    def __init__(self, shards: Dict[str, object], default_shard: str, directory_ttl_seconds: float):
+        self.shards = shards
+        self.default_shard = default_shard
+        self.directory_ttl_seconds = directory_ttl_seconds
+        self._directory: Dict[str, Tuple[Optional[str], str, float]] = {}
+        self._sync: Dict[Tuple[str, Optional[str]], Tuple[object, sessionmaker]] = {}
+        self._async: Dict[Tuple[str, Optional[str]], Tuple[object, async_sessionmaker]] = {}
+        self._lock = threading.Lock()
+        # One asyncio.Lock per shard being opened, so a migrating shard only holds up its own tenants
+        self._opening: Dict[Tuple[str, Optional[str]], asyncio.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shards) or self.default_shard != DEFAULT_SHARD
+
+    def target(self, shard: str, tenant_id: Optional[str]) -> ShardTarget:
+        """Resolve a shard name (and tenant, for templated shards) to a URL and optional schema"""
+        if shard == DEFAULT_SHARD:
+            return ShardTarget(DEFAULT_SHARD, SQLALCHEMY_DATABASE_URL)
+        if shard not in self.shards:
+            raise KeyError(f"Unknown shard '{shard}' (define it in TENANT_SHARDS)")
+        spec = self.shards[shard]
+        url, schema = (spec, None) if isinstance(spec, str) else (spec["url"], spec.get("schema"))
+        if "{tenant_id}" in url or (schema and "{tenant_id}" in schema):
+            if not tenant_id or not _TENANT_ID_PATTERN.match(tenant_id):
+                raise ValueError(f"Tenant id {tenant_id!r} cannot be used in a shard name")
+            url = url.replace("{tenant_id}", tenant_id)
+            if schema:
+                schema = schema.replace("{tenant_id}", tenant_id.replace("-", "_").replace(".", "_"))
+        if schema and not _SCHEMA_PATTERN.match(schema):
+            raise ValueError(f"Invalid schema name {schema!r}")
+        return ShardTarget(shard, url, schema)
+
+    # Directory lookups (tenant_shards lives in the default database)
+
+    def _cached_entry(self, tenant_id: str):
+        entry = self._directory.get(tenant_id)
+        if entry and time.monotonic() - entry[2] < self.directory_ttl_seconds:
+            return entry
+        return None
+
+    def _remember(self, tenant_id: str, row) -> Tuple[Optional[str], str, float]:
+        entry = (row[0], row[1], time.monotonic()) if row else (None, "active", time.monotonic())
+        self._directory[tenant_id] = entry
+        return entry
+
+    def _shard_from_entry(self, tenant_id: str, entry) -> str:
+        shard, status, _ = entry
+        if status == "moving":
+            raise TenantMoving(f"Tenant {tenant_id} is being moved between shards")
+        return shard or self.default_shard
+
+    def shard_for(self, tenant_id: Optional[str]) -> ShardTarget:
+        if not self.enabled or not tenant_id:
+            return self.target(DEFAULT_SHARD, None)
+        entry = self._cached_entry(tenant_id)
+        if entry is None:
+            with engine.connect() as conn:
+                row = conn.execute(
+                    text("SELECT shard, status FROM tenant_shards WHERE tenant_id = :t"), {"t": tenant_id}
+                ).first()
+            entry = self._remember(tenant_id, row)
+        return self.target(self._shard_from_entry(tenant_id, entry), tenant_id)
+
+    async def shard_for_async(self, tenant_id: Optional[str]) -> ShardTarget:
+        if not self.enabled or not tenant_id:
+            return self.target(DEFAULT_SHARD, None)
+        entry = self._cached_entry(tenant_id)
+        if entry is None:
+            async with async_engine.connect() as conn:
+                row = (await conn.execute(
+                    text("SELECT shard, status FROM tenant_shards WHERE tenant_id = :t"), {"t": tenant_id}
+                )).first()
+            entry = self._remember(tenant_id, row)
+        return self.target(self._shard_from_entry(tenant_id, entry), tenant_id)
+
+    def forget(self, tenant_id: str):
+        """Drop a cached directory entry (after a move)"""
+        self._directory.pop(tenant_id, None)
+
+    # Engines and sessions, created on first use and cached per (url, schema)
+
+    def _prepare_shard(self, target: ShardTarget, shard_engine):
+        """Create the schema (Postgres) or directory (SQLite) and bring the shard up to date"""
+        from migrations import upgrade
+
+        if shard_engine.dialect.name == "sqlite":
+            path = make_url(target.url).database
+            if path and not _is_sqlite_memory(target.url):
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        elif target.schema:
+            with create_engine(target.url, poolclass=NullPool).begin() as conn:
+                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{target.schema}"'))
+        print(f"🗄️ Preparing shard {target.name} ({target.schema or make_url(target.url).database})")
+        upgrade(shard_engine)
+
+    def engine(self, target: ShardTarget):
+        if target.name == DEFAULT_SHARD:
+            return engine
+        return self._sync_entry(target)[0]
+
+    def _sync_entry(self, target: ShardTarget):
+        key = (target.url, target.schema)
+        entry = self._sync.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._sync.get(key)
+                if entry is None:
+                    if target.url.startswith("sqlite"):
+                        shard_engine = create_sqlite_engine(target.url)
+                    else:
+                        connect_args = {"options": f"-csearch_path={target.schema}"} if target.schema else {}
+                        shard_engine = create_postgres_engine(target.url, connect_args=connect_args)
+                    self._prepare_shard(target, shard_engine)
+                    entry = (shard_engine, sessionmaker(autocommit=False, autoflush=False, bind=shard_engine))
+                    self._sync[key] = entry
+        return entry
+
+    def _async_entry(self, target: ShardTarget):
+        key = (target.url, target.schema)
+        entry = self._async.get(key)
+        if entry is None:
+            self._sync_entry(target)  # makes sure the shard exists and is migrated
+            with self._lock:
+                entry = self._async.get(key)
+                if entry is None:
+                    kwargs = {}
+                    if target.schema:
+                        kwargs["connect_args"] = {"server_settings": {"search_path": target.schema}}
+                    shard_engine = create_async_db_engine(target.url, **kwargs)
+                    entry = (shard_engine, async_sessionmaker(
+                        bind=shard_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+                    ))
+                    self._async[key] = entry
+        return entry
+
+    def session(self, target: ShardTarget):
+        if target.name == DEFAULT_SHARD:
+            return SessionLocal()
+        return self._sync_entry(target)[1]()
+
+    async def async_session(self, target: ShardTarget):
+        """Async session for a shard; creating and migrating a new shard runs in a worker thread"""
+        if target.name == DEFAULT_SHARD:
+            return AsyncSessionLocal()
+        key = (target.url, target.schema)
+        entry = self._async.get(key)
+        if entry is None:
+            lock = self._opening.setdefault(key, asyncio.Lock())
+            async with lock:
+                entry = self._async.get(key)
+                if entry is None:
+                    entry = await asyncio.to_thread(self._async_entry, target)
+            self._opening.pop(key, None)
+        return entry[1]()
+
+    def prepare_known_shards(self) -> List[str]:
+        """Create and migrate every shard nameable without a tenant plus the shards of tenants in the
+        directory, so deploys migrate them up front instead of the first request for each"""
+        targets = {
+            self.target(name, None) for name, spec in self.shards.items()
+            if "{tenant_id}" not in json.dumps(spec)
+        }
+        if self.enabled:
+            with engine.connect() as conn:
+                for tenant_id, shard in conn.execute(text("SELECT tenant_id, shard FROM tenant_shards")):
+                    if shard and shard != DEFAULT_SHARD:
+                        targets.add(self.target(shard, tenant_id))
+        for target in targets:
+            self._sync_entry(target)
+        return sorted(f"{target.name} ({target.schema or make_url(target.url).database})" for target in targets)
+
+    def session_factories(self):
+        """The default session factory plus those of every shard opened by this process"""
+        return [SessionLocal] + [factory for _, factory in list(self._sync.values())]
+
+    def dispose(self):
+        for shard_engine, _ in self._sync.values():
+            shard_engine.dispose()
+        self._sync.clear()
+
+
+tenant_router = TenantRouter(TENANT_SHARDS, TENANT_DEFAULT_SHARD, TENANT_DIRECTORY_TTL_SECONDS)
+
+
+def request_tenant(request: Request) -> Optional[str]:
+    """Tenant of the authenticated caller, set on request.state by the routing middleware in main.py"""
+    return getattr(request.state, "tenant_id", None)
+
+
+def _tenant_moving(e: TenantMoving):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+
+def get_db(request: Request):
+    try:
+        target = tenant_router.shard_for(request_tenant(request))
+    except TenantMoving as e:
+        raise _tenant_moving(e)
+    db = tenant_router.session(target)
     try:
         yield db
     finally:
         db.close()
 
+async def _open_async_db(tenant_id: Optional[str], read_only: bool = False):
+    try:
+        target = await tenant_router.shard_for_async(tenant_id)
+    except TenantMoving as e:
+        raise _tenant_moving(e)
+    if target.name == DEFAULT_SHARD:
+        session_factory = AsyncSessionLocal
+        if read_only and replica_router is not None and await replica_router.use_replica():
+            session_factory = AsyncReadSessionLocal
+        return session_factory()
+    return await tenant_router.async_session(target)
+
+async def get_async_db(request: Request):
+    async with await _open_async_db(request_tenant(request)) as db:
+        yield db
+
+async def get_body_tenant_db(request: Request):
+    """Async session for unauthenticated endpoints (signup, login) that name their tenant in the JSON body"""
+    tenant_id = None
+    if tenant_router.enabled:
+        body = await request.json()
+        tenant_id = body.get("tenant_id") if isinstance(body, dict) else None
+    async with await _open_async_db(tenant_id) as db:
+        yield db
+
+async def get_read_db(request: Request):
+    """Session for read-only endpoints: the replica when configured and fresh, else the primary"""
+    async with await _open_async_db(request_tenant(request), read_only=True) as db:
+        yield db
+
+async def read_session_factory(tenant_id: Optional[str]):
+    """Sync session factory routed like get_read_db, for read-only work handed to a worker thread
+
+    The shard and replica are resolved here on the event loop, so a moving
+    tenant gets the same 503 as the async endpoints; a shard opened for the
+    first time is created when the factory is called in the thread.
+    """
+    try:
+        target = await tenant_router.shard_for_async(tenant_id)
+    except TenantMoving as e:
+        raise _tenant_moving(e)
+    if target.name == DEFAULT_SHARD:
+        if replica_router is not None and await replica_router.use_replica():
+            return ReadSessionLocal
+        return SessionLocal
+    return lambda: tenant_router.session(target)
+
 # Export for use in other modules
-__all__ = ['Base', 'engine', 'SessionLocal', 'get_db', 'SQLALCHEMY_DATABASE_URL'] 
\ No newline at end of file
+__all__ = [
+    'Base', 'engine', 'SessionLocal', 'get_db', 'SQLALCHEMY_DATABASE_URL', 'create_sqlite_engine',
+    'async_engine', 'AsyncSessionLocal', 'get_async_db', 'create_async_db_engine',
+    'async_read_engine', 'replica_router', 'get_read_db', 'read_engine', 'read_session_factory',
+    'tenant_router', 'request_tenant', 'get_body_tenant_db', 'TenantMoving',
+    'create_db_engine', 'create_postgres_engine', 'DB_POOL_PROFILE', 'resolve_pool_profile',
+]
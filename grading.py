@@ -0,0 +1,90 @@
+"""
+Quiz grading shared by submit-quiz and the session sweeper
+Scores answers against the quiz questions and builds the per-question
+analysis, the user_question_history rows and the error matrix cells that both
+paths store.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+import models
+
+
+def letter_grade(percentage: float) -> str:
+    return "A" if percentage >= 90 else "B" if percentage >= 80 else "C" if percentage >= 70 else "D" if percentage >= 60 else "F"
+
+
+@dataclass
+class GradedQuiz:
+    correct_answers: int = 0
+    total_questions: int = 0
+    question_analysis: List[dict] = field(default_factory=list)
+    question_history_rows: List[dict] = field(default_factory=list)
+    # {category: {difficulty: [answered, incorrect]}} for this quiz, folded into user_error_matrix
+    error_cells: Dict[str, Dict[str, List[int]]] = field(default_factory=dict)
+
+    @property
+    def percentage(self) -> float:
+        return (self.correct_answers / self.total_questions) * 100 if self.total_questions else 0.0
+
+    @property
+    def grade(self) -> str:
+        return letter_grade(self.percentage)
+
+
+def grade_answers(
+    questions: Sequence[models.Question],
+    user_answers: Dict[str, str],
+    question_times: Dict[str, int],
+    *,
+    user_id: int,
+    tenant_id: str,
+    quiz_id: int,
+    session_id: int,
+    topic_name: str,
+    answered_at: datetime,
+) -> GradedQuiz:
+    """Score the answers; unanswered questions count as wrong"""
+    graded = GradedQuiz(total_questions=len(questions))
+    for question in questions:
+        user_answer = user_answers.get(str(question.id), "")
+        is_correct = user_answer == question.correct_answer
+        question_time = question_times.get(str(question.id), 0)
+
+        if is_correct:
+            graded.correct_answers += 1
+
+        cell = graded.error_cells.setdefault(question.category or "General", {}).setdefault(
+            question.difficulty_level or "medium", [0, 0]
+        )
+        cell[0] += 1
+        cell[1] += 0 if is_correct else 1
+
+        # Track this answered question
+        graded.question_history_rows.append({
+            "user_id": user_id,
+            "question_id": question.id,
+            "tenant_id": tenant_id,
+            "question_text": question.question_text,
+            "topic_name": topic_name,
+            "difficulty_level": question.difficulty_level,
+            "user_answer": user_answer,
+            "correct_answer": question.correct_answer,
+            "is_correct": is_correct,
+            "time_taken_seconds": question_time,
+            "quiz_id": quiz_id,
+            "quiz_session_id": session_id,
+            "answered_at": answered_at
+        })
+
+        graded.question_analysis.append({
+            "question_id": question.id,
+            "user_answer": user_answer,
+            "correct_answer": question.correct_answer,
+            "is_correct": is_correct,
+            "explanation": question.explanation,
+            "time_taken": question_time
+        })
+    return graded
@@ -4,32 +4,47 @@ Enhanced Quiz Application with RAG Chatbot, Analytics, and Progress Tracking
 Production-ready FastAPI application for dynamic quiz generation and learning
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Body, Query
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from sqlalchemy import and_, case, exists, func, insert, or_, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-import json
+import asyncio
+import os
+import random
 import uuid
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Literal, Optional, Any
 
 # Import our modules
 import models
 import schemas
-from database import get_db, engine
-from auth import get_current_user, create_access_token, get_password_hash, verify_password
-from ai_service import generate_quiz_questions, generate_unique_seed
-from simple_chatbot_service import SimpleChatbotService
-from analytics_service import AnalyticsService
+from database import get_db, get_async_db, get_body_tenant_db, get_read_db, read_session_factory, tenant_router
+from auth import (
+    get_current_user, get_current_user_async, get_current_read_user, create_access_token,
+    get_password_hash_async, verify_and_update_password_async, tenant_from_authorization, get_current_admin,
+    get_current_read_admin
+)
+from password_hashing import password_hasher
+from stats_service import (
+    average_score, daily_progress_upserts, local_day, quiz_stats_upserts, record_errors_async, streak_summary,
+    valid_timezone, weak_areas
+)
+from pagination import decode_cursor, keyset, paginate
+from grading import grade_answers
+from session_sweeper import SESSION_SWEEP_INTERVAL_SECONDS, run_periodically as run_session_sweeper, sweep_metrics
+from sql_instrumentation import SQL_PROFILE_TOP_N, count_request_statements, query_profile
+from analytics_cache import analytics_cache, analytics_validators
+from question_stats import (
+    QUESTION_STATS_FLUSH_INTERVAL_SECONDS, effective_difficulty, question_stats,
+    run_periodically as run_question_stats_flusher
+)
 
-# Create database tables
-try:
-    models.Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created successfully")
-except Exception as e:
-    print(f"⚠️ Database tables may already exist: {e}")
-    # Continue anyway as tables might already be created
+# Schema changes are an explicit deploy step (python migrations.py); AUTO_MIGRATE=true
+# runs them on startup instead, which is convenient locally but slows cold starts
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
 
 app = FastAPI(
     title="AI-Powered Quiz Application",
@@ -46,9 +61,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request SQL statement count (X-SQL-Statements header when SQL_DEBUG_HEADERS is on)
+app.middleware("http")(count_request_statements)
+
+@app.middleware("http")
+async def route_tenant(request, call_next):
+    """Record the caller's tenant so the session dependencies open its shard"""
+    if tenant_router.enabled:
+        request.state.tenant_id = tenant_from_authorization(request.headers.get("Authorization"))
+    return await call_next(request)
+
 # Security
 security = HTTPBearer()
 
+_background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def run_migrations():
+    if AUTO_MIGRATE:
+        from migrations import upgrade
+
+        await asyncio.to_thread(upgrade)
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    if SESSION_SWEEP_INTERVAL_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(run_session_sweeper(SESSION_SWEEP_INTERVAL_SECONDS)))
+
+@app.on_event("startup")
+async def start_question_stats_flusher():
+    if QUESTION_STATS_FLUSH_INTERVAL_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(run_question_stats_flusher(QUESTION_STATS_FLUSH_INTERVAL_SECONDS)))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    # Write out the question stats still pending in this process
+    await asyncio.to_thread(question_stats.flush)
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
+
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
@@ -62,49 +118,77 @@ def health_check():
             "Analytics & Progress Tracking",
             "Multitenancy Support",
             "AI-powered Question Generation"
-        ]
+        ],
+        "password_hashing": password_hasher.stats(),
+        "session_sweeper": sweep_metrics.stats(),
+        "analytics_cache": analytics_cache.stats(),
+        "question_stats": question_stats.stats()
+    }
+
+@app.get("/admin/perf/sql")
+def get_sql_profile(
+    limit: int = Query(SQL_PROFILE_TOP_N, ge=1, le=500),
+    order_by: Literal["total_ms", "max_ms", "calls"] = Query("total_ms"),
+    admin: models.User = Depends(get_current_admin)
+):
+    """Slowest SQL statements of this process, grouped by fingerprint, with captured plans"""
+    return {
+        "success": True,
+        "summary": query_profile.summary(),
+        "queries": query_profile.top(limit, order_by)
     }
 
+@app.delete("/admin/perf/sql")
+def reset_sql_profile(admin: models.User = Depends(get_current_admin)):
+    """Start a fresh profiling window"""
+    query_profile.reset()
+    return {"success": True}
+
 @app.post("/signup", response_model=Dict[str, Any])
-def signup(
+async def signup(
     user_data: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_body_tenant_db)
 ):
     """User registration endpoint"""
+    if user_data.timezone and not valid_timezone(user_data.timezone):
+        raise HTTPException(status_code=400, detail=f"Unknown time zone: {user_data.timezone}")
+    
     try:
         # Check if user already exists in this tenant
-        existing_user = db.query(models.User).filter(
+        existing_user = (await db.scalars(select(models.User).where(
             models.User.email == user_data.email,
             models.User.tenant_id == user_data.tenant_id
-        ).first()
+        ))).first()
         
         if existing_user:
             raise HTTPException(status_code=400, detail="User already exists in this tenant")
         
-        # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        # Create new user (bcrypt runs on the password hashing pool)
+        hashed_password = await get_password_hash_async(user_data.password)
         db_user = models.User(
             email=user_data.email,
             hashed_password=hashed_password,
             tenant_id=user_data.tenant_id,
             first_name=user_data.first_name,
             last_name=user_data.last_name,
+            timezone=user_data.timezone,
             created_at=datetime.utcnow()
         )
         
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         # Create initial progress tracking
         progress = models.ProgressTracking(
             user_id=db_user.id,
+            tenant_id=user_data.tenant_id,
             date=datetime.utcnow(),
             current_streak=0,
             longest_streak=0
         )
         db.add(progress)
-        db.commit()
+        await db.commit()
         
         return {
             "success": True,
@@ -118,35 +202,49 @@ def signup(
             }
         }
         
+    except HTTPException:
+        # Duplicate email (400) and a full hashing queue (503) keep their status
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/login", response_model=Dict[str, Any])
-def login(
+async def login(
     user_data: schemas.UserLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_body_tenant_db)
 ):
     """User login endpoint"""
     try:
-        user = db.query(models.User).filter(
+        user = (await db.scalars(select(models.User).where(
             models.User.email == user_data.email,
             models.User.tenant_id == user_data.tenant_id
-        ).first()
+        ))).first()
+        
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        if not user or not verify_password(user_data.password, user.hashed_password):
+        password_valid, upgraded_hash = await verify_and_update_password_async(
+            user_data.password, user.hashed_password
+        )
+        if not password_valid:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         if not user.is_active:
             raise HTTPException(status_code=401, detail="User account is deactivated")
         
+        # Transparently re-hash when the configured bcrypt work factor changed
+        if upgraded_hash:
+            user.hashed_password = upgraded_hash
+        
         # Update last login
         user.last_login = datetime.utcnow()
-        db.commit()
+        await db.commit()
         
         # Create access token
         access_token = create_access_token(
-            data={"sub": user.email, "user_id": user.id, "tenant_id": user.tenant_id}
+            data={"sub": user.email, "user_id": user.id, "tenant_id": user.tenant_id, "timezone": user.timezone}
         )
         
         return {
@@ -162,9 +260,27 @@ def login(
             }
         }
         
+    except HTTPException:
+        # Bad credentials (401) and a full hashing queue (503) keep their status
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _random_window(db: Session, candidates, low: int, high: int, limit: int) -> List[models.Question]:
+    """Up to `limit` candidate questions from a random point in [low, high] of Question.id, wrapping
+    around; walks the primary key instead of sorting every candidate by random()"""
+    if limit <= 0:
+        return []
+    pivot = random.randint(low, high)
+    questions = db.scalars(
+        candidates.where(models.Question.id >= pivot).order_by(models.Question.id).limit(limit)
+    ).all()
+    if len(questions) < limit:
+        questions += db.scalars(
+            candidates.where(models.Question.id < pivot).order_by(models.Question.id).limit(limit - len(questions))
+        ).all()
+    return questions
+
 @app.post("/generate-quiz")
 def generate_quiz(
     topic: str = Body(...),
@@ -180,6 +296,9 @@ def generate_quiz(
     if current_user.tenant_id != tenant_id:
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
+    # Imported on first use: ai_service pulls in openai and both Llama clients
+    from ai_service import generate_quiz_questions, generate_unique_seed
+    
     try:
         print(f"🎯 API: Generating quiz for topic: '{topic}' for tenant: {tenant_id}")
         print(f"🎯 API: Current user: {current_user.email}, tenant: {current_user.tenant_id}")
@@ -212,31 +331,45 @@ def generate_quiz(
         else:
             print(f"📝 API: Using existing topic: {topic} with ID: {db_topic.id}")
         
-        # Get user's answered questions to avoid duplicates
-        answered_question_ids = set()
-        user_answered_questions = db.query(models.UserQuestionHistory).filter(
+        # Questions for this topic the user has not answered yet, as a NOT EXISTS
+        # anti-join so the user's history never leaves the database
+        already_answered = exists().where(
             models.UserQuestionHistory.user_id == current_user.id,
+            models.UserQuestionHistory.question_id == models.Question.id,
             models.UserQuestionHistory.tenant_id == tenant_id
-        ).all()
-        
-        for qh in user_answered_questions:
-            answered_question_ids.add(qh.question_id)
-        
-        print(f"📝 API: User has answered {len(answered_question_ids)} questions previously")
-        
-        # Get available questions for this topic (excluding answered ones)
-        available_questions = db.query(models.Question).join(models.Quiz).filter(
+        )
+        answered_and_archived = exists().where(
+            models.UserQuestionHistoryArchive.user_id == current_user.id,
+            models.UserQuestionHistoryArchive.question_id == models.Question.id,
+            models.UserQuestionHistoryArchive.tenant_id == tenant_id
+        )
+        available_filter = (
             models.Quiz.topic_id == db_topic.id,
             models.Quiz.tenant_id == tenant_id,
-            ~models.Question.id.in_(answered_question_ids) if answered_question_ids else True
-        ).all()
+            ~already_answered,
+            ~answered_and_archived
+        )
+        available_count, lowest_id, highest_id = db.execute(
+            select(func.count(models.Question.id), func.min(models.Question.id), func.max(models.Question.id))
+            .join(models.Quiz).where(*available_filter)
+        ).one()
         
-        print(f"📝 API: Found {len(available_questions)} available questions for topic: {topic}")
+        print(f"📝 API: Found {available_count} available questions for topic: {topic}")
         
         # If we have enough available questions, use them
-        if len(available_questions) >= num_questions:
+        if available_count >= num_questions:
             print(f"📝 API: Using existing questions from database")
-            selected_questions = available_questions[:num_questions]
+            # Prefer questions that play at the requested difficulty (observed accuracy once
+            # they have enough answers), each group sampled from a random id window
+            candidates = select(models.Question).join(models.Quiz).where(*available_filter)
+            selected_questions = _random_window(
+                db, candidates.where(effective_difficulty() == difficulty), lowest_id, highest_id, num_questions
+            )
+            selected_questions += _random_window(
+                db, candidates.where(effective_difficulty() != difficulty), lowest_id, highest_id,
+                num_questions - len(selected_questions)
+            )
+            random.shuffle(selected_questions)
             questions_data = []
             
             for question in selected_questions:
@@ -286,22 +419,25 @@ def generate_quiz(
         # Create questions in database (if they're new)
         if model_used != "Database":
             print(f"📝 API: Creating questions in database...")
-            for i, q in enumerate(questions_data):
+            question_rows = []
+            for q in questions_data:
                 correct_answer = next((a['text'] for a in q['answers'] if a['correct']), None)
-                db_question = models.Question(
-                    quiz_id=quiz.id,
-                    question_text=q['question'],
-                    correct_answer=correct_answer,
-                    option_a=q['answers'][0]['text'],
-                    option_b=q['answers'][1]['text'],
-                    option_c=q['answers'][2]['text'],
-                    option_d=q['answers'][3]['text'],
-                    explanation=q.get('explanation', ''),
-                    difficulty_level=difficulty,
-                    category=db_topic.category
-                )
-                db.add(db_question)
-                print(f"📝 API: Added question {i+1}")
+                question_rows.append({
+                    "quiz_id": quiz.id,
+                    "question_text": q['question'],
+                    "correct_answer": correct_answer,
+                    "option_a": q['answers'][0]['text'],
+                    "option_b": q['answers'][1]['text'],
+                    "option_c": q['answers'][2]['text'],
+                    "option_d": q['answers'][3]['text'],
+                    "explanation": q.get('explanation', ''),
+                    "difficulty_level": difficulty,
+                    "category": db_topic.category
+                })
+            
+            # Single batched INSERT for all generated questions
+            db.execute(insert(models.Question), question_rows)
+            print(f"📝 API: Added {len(question_rows)} questions")
             
             db.commit()
             print(f"✅ API: Successfully committed all questions to database")
@@ -325,7 +461,7 @@ def generate_quiz(
             "difficulty": difficulty,
             "tenant_id": tenant_id,
             "unique_questions": True,  # Indicates these are unique for the user
-            "available_questions_remaining": len(available_questions) - len(questions_data) if model_used == "Database" else "Unlimited"
+            "available_questions_remaining": available_count - len(questions_data) if model_used == "Database" else "Unlimited"
         }
         
         print(f"✅ API: Successfully created quiz with {len(questions_data)} questions for topic: '{topic}' for tenant: {tenant_id}")
@@ -339,11 +475,11 @@ def generate_quiz(
         raise HTTPException(status_code=500, detail=f"Error generating quiz: {str(e)}")
 
 @app.get("/quizzes/{quiz_id}")
-def get_quiz(
+async def get_quiz(
     quiz_id: int,
     tenant_id: str = Query(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async)
 ):
     """Get a specific quiz with questions"""
     # Ensure user belongs to the specified tenant
@@ -351,19 +487,19 @@ def get_quiz(
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
     # Get quiz with tenant isolation
-    quiz = db.query(models.Quiz).filter(
+    quiz = (await db.scalars(select(models.Quiz).where(
         models.Quiz.id == quiz_id,
         models.Quiz.tenant_id == tenant_id,
         models.Quiz.is_active == True
-    ).first()
+    ))).first()
     
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     # Get questions for this quiz
-    questions = db.query(models.Question).filter(
+    questions = (await db.scalars(select(models.Question).where(
         models.Question.quiz_id == quiz_id
-    ).all()
+    ))).all()
     
     # Format questions for frontend
     formatted_questions = []
@@ -392,11 +528,11 @@ def get_quiz(
     }
 
 @app.post("/start-quiz-session")
-def start_quiz_session(
+async def start_quiz_session(
     quiz_id: int = Body(...),
     tenant_id: str = Body(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async)
 ):
     """Start a quiz session with timer tracking"""
     # Ensure user belongs to the specified tenant
@@ -404,21 +540,21 @@ def start_quiz_session(
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
     # Get quiz with tenant isolation
-    quiz = db.query(models.Quiz).filter(
+    quiz = (await db.scalars(select(models.Quiz).where(
         models.Quiz.id == quiz_id,
         models.Quiz.tenant_id == tenant_id,
         models.Quiz.is_active == True
-    ).first()
+    ))).first()
     
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     # Check if user already has an active session for this quiz
-    existing_session = db.query(models.QuizSession).filter(
+    existing_session = (await db.scalars(select(models.QuizSession).where(
         models.QuizSession.quiz_id == quiz_id,
         models.QuizSession.user_id == current_user.id,
         models.QuizSession.status == "active"
-    ).first()
+    ))).first()
     
     if existing_session:
         # Return existing session
@@ -448,8 +584,8 @@ def start_quiz_session(
     )
     
     db.add(quiz_session)
-    db.commit()
-    db.refresh(quiz_session)
+    await db.commit()
+    await db.refresh(quiz_session)
     
     return {
         "success": True,
@@ -463,11 +599,11 @@ def start_quiz_session(
     }
 
 @app.get("/quiz-session/{session_id}/status")
-def get_quiz_session_status(
+async def get_quiz_session_status(
     session_id: int,
     tenant_id: str = Query(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async)
 ):
     """Get quiz session status and time remaining"""
     # Ensure user belongs to the specified tenant
@@ -475,11 +611,11 @@ def get_quiz_session_status(
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
     # Get session
-    session = db.query(models.QuizSession).filter(
+    session = (await db.scalars(select(models.QuizSession).where(
         models.QuizSession.id == session_id,
         models.QuizSession.user_id == current_user.id,
         models.QuizSession.tenant_id == tenant_id
-    ).first()
+    ))).first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Quiz session not found")
@@ -491,7 +627,7 @@ def get_quiz_session_status(
     if time_remaining <= 0 and session.status == "active":
         # Auto-submit expired session
         session.status = "expired"
-        db.commit()
+        await db.commit()
         return {
             "success": True,
             "session_id": session_id,
@@ -509,16 +645,54 @@ def get_quiz_session_status(
         "end_time": session.end_time.isoformat()
     }
 
+@app.put("/quiz-session/{session_id}/answers")
+async def save_quiz_session_answers(
+    session_id: int,
+    tenant_id: str = Body(...),
+    user_answers: Dict[str, str] = Body(...),
+    question_times: Dict[str, int] = Body({}),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async)
+):
+    """Save in-progress answers so an expired session can still be auto-graded"""
+    # Ensure user belongs to the specified tenant
+    if current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
+    
+    current_time = datetime.utcnow()
+    answered = len([a for a in user_answers.values() if a])
+    saved = (await db.execute(update(models.QuizSession).where(
+        models.QuizSession.id == session_id,
+        models.QuizSession.user_id == current_user.id,
+        models.QuizSession.tenant_id == tenant_id,
+        models.QuizSession.status == "active",
+        models.QuizSession.end_time > current_time
+    ).values(
+        partial_answers={"user_answers": user_answers, "question_times": question_times},
+        questions_answered=answered,
+        last_activity=current_time
+    ))).rowcount
+    await db.commit()
+    
+    if not saved:
+        raise HTTPException(status_code=400, detail="Quiz session is not active")
+    
+    return {
+        "success": True,
+        "session_id": session_id,
+        "questions_answered": answered
+    }
+
 @app.post("/submit-quiz")
-def submit_quiz(
+async def submit_quiz(
     quiz_id: int = Body(...),
     session_id: int = Body(...),
     tenant_id: str = Body(...),
     user_answers: Dict[str, str] = Body(...),
     time_taken: int = Body(...),
     question_times: Dict[str, int] = Body({}),  # Time spent on each question
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async)
 ):
     """Submit quiz answers with enhanced validation and question tracking"""
     # Ensure user belongs to the specified tenant
@@ -526,12 +700,12 @@ def submit_quiz(
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
     # Get quiz session
-    session = db.query(models.QuizSession).filter(
+    session = (await db.scalars(select(models.QuizSession).where(
         models.QuizSession.id == session_id,
         models.QuizSession.quiz_id == quiz_id,
         models.QuizSession.user_id == current_user.id,
         models.QuizSession.tenant_id == tenant_id
-    ).first()
+    ))).first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Quiz session not found")
@@ -544,23 +718,26 @@ def submit_quiz(
     current_time = datetime.utcnow()
     if current_time > session.end_time:
         session.status = "expired"
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=400, detail="Quiz time has expired")
     
-    # Get quiz
-    quiz = db.query(models.Quiz).filter(
+    # Get quiz and its topic name in one joined query
+    quiz_row = (await db.execute(select(models.Quiz, models.Topic.name).outerjoin(
+        models.Topic, models.Quiz.topic_id == models.Topic.id
+    ).where(
         models.Quiz.id == quiz_id,
         models.Quiz.tenant_id == tenant_id,
         models.Quiz.is_active == True
-    ).first()
+    ))).first()
     
-    if not quiz:
+    if not quiz_row:
         raise HTTPException(status_code=404, detail="Quiz not found")
+    quiz, quiz_topic_name = quiz_row
     
     # Get questions for this quiz
-    questions = db.query(models.Question).filter(
+    questions = (await db.scalars(select(models.Question).where(
         models.Question.quiz_id == quiz_id
-    ).all()
+    ))).all()
     
     if not questions:
         raise HTTPException(status_code=404, detail="No questions found for this quiz")
@@ -576,47 +753,22 @@ def submit_quiz(
         )
     
     # Calculate score and track answered questions
-    correct_answers = 0
-    question_analysis = []
+    topic_name = quiz_topic_name or "Unknown"
+    graded = grade_answers(
+        questions, user_answers, question_times,
+        user_id=current_user.id, tenant_id=tenant_id, quiz_id=quiz_id, session_id=session_id,
+        topic_name=topic_name, answered_at=current_time
+    )
+    correct_answers = graded.correct_answers
+    question_analysis = graded.question_analysis
+    question_history_rows = graded.question_history_rows
     
-    for question in questions:
-        user_answer = user_answers.get(str(question.id), "")
-        is_correct = user_answer == question.correct_answer
-        question_time = question_times.get(str(question.id), 0)
-        
-        if is_correct:
-            correct_answers += 1
-        
-        # Track this answered question
-        question_history = models.UserQuestionHistory(
-            user_id=current_user.id,
-            question_id=question.id,
-            tenant_id=tenant_id,
-            question_text=question.question_text,
-            topic_name=quiz.topic.name if quiz.topic else "Unknown",
-            difficulty_level=question.difficulty_level,
-            user_answer=user_answer,
-            correct_answer=question.correct_answer,
-            is_correct=is_correct,
-            time_taken_seconds=question_time,
-            quiz_id=quiz_id,
-            quiz_session_id=session_id,
-            answered_at=current_time
-        )
-        db.add(question_history)
-        
-        question_analysis.append({
-            "question_id": question.id,
-            "user_answer": user_answer,
-            "correct_answer": question.correct_answer,
-            "is_correct": is_correct,
-            "explanation": question.explanation,
-            "time_taken": question_time
-        })
+    # One batched INSERT for the whole quiz instead of a unit-of-work object per question
+    await db.execute(insert(models.UserQuestionHistory), question_history_rows)
     
     # Calculate percentage and grade
-    percentage = (correct_answers / total_questions) * 100
-    grade = "A" if percentage >= 90 else "B" if percentage >= 80 else "C" if percentage >= 70 else "D" if percentage >= 60 else "F"
+    percentage = graded.percentage
+    grade = graded.grade
     
     # Update session status
     session.status = "completed"
@@ -633,34 +785,38 @@ def submit_quiz(
         percentage=percentage,
         grade=grade,
         time_taken=time_taken,
-        user_answers=json.dumps(user_answers),
-        correct_answers=json.dumps({str(q.id): q.correct_answer for q in questions}),
-        questions_analysis=json.dumps(question_analysis),
+        user_answers=user_answers,
+        correct_answers={str(q.id): q.correct_answer for q in questions},
+        questions_analysis=question_analysis,
         completed_at=current_time,
         session_id=session_id
     )
     
     db.add(quiz_result)
     
-    # Update user analytics
-    current_user.total_quizzes_taken += 1
-    current_user.total_questions_answered += total_questions
-    current_user.total_correct_answers += correct_answers
-    current_user.last_quiz_date = current_time
-    
-    # Calculate new average score
-    if current_user.total_quizzes_taken > 0:
-        current_user.average_score = current_user.total_correct_answers / current_user.total_questions_answered * 100
-    
-    # Update best score
-    if percentage > current_user.best_score:
-        current_user.best_score = percentage
+    # Update user analytics (atomic upserts into the stats and daily rollup tables)
+    dialect_name = db.get_bind().dialect.name
+    for statement in quiz_stats_upserts(
+        dialect_name, current_user.id, tenant_id, topic_name,
+        correct_answers, total_questions, percentage, time_taken, current_time, quiz_id=quiz_id,
+        timezone_name=current_user.timezone
+    ) + daily_progress_upserts(
+        dialect_name, current_user.id, tenant_id, current_time,
+        correct_answers, total_questions, time_taken, question_history_rows
+    ):
+        await db.execute(statement)
+    await record_errors_async(db, current_user.id, tenant_id, graded.error_cells, current_time)
     
     # Update quiz analytics
     quiz.total_attempts += 1
     quiz.average_score = ((quiz.average_score * (quiz.total_attempts - 1)) + percentage) / quiz.total_attempts
     
-    db.commit()
+    await db.commit()
+    analytics_cache.invalidate_user(current_user.id, tenant_id)
+    
+    # Per-question counters are written behind, in batches (see question_stats.py); the journal
+    # write happens before the response, in a worker thread so it never blocks the event loop
+    await asyncio.to_thread(question_stats.record, tenant_id, question_history_rows)
     
     return {
         "success": True,
@@ -692,64 +848,66 @@ def _generate_feedback(self, percentage: float, score: int, total_questions: int
         return "Keep practicing! Review the material and try again to improve your understanding."
 
 @app.get("/analytics/user")
-def get_user_analytics(
+async def get_user_analytics(
+    request: Request,
     tenant_id: str = Query(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user)
 ):
     """Get comprehensive user analytics with progress tracking"""
     # Ensure user belongs to the specified tenant
     if current_user.tenant_id != tenant_id:
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
+    # Running totals kept up to date by submit-quiz; their analytics_version names the cached response
+    stats = (await db.scalars(select(models.UserStats).where(
+        models.UserStats.user_id == current_user.id,
+        models.UserStats.tenant_id == tenant_id
+    ))).first()
+    
+    key = ("analytics/user", current_user.id, tenant_id)
+    etag, last_modified = analytics_validators(
+        key, stats.analytics_version if stats else None, stats.updated_at if stats else None, current_user.timezone
+    )
+    return await analytics_cache.serve(
+        request, key, etag, last_modified, lambda: _user_analytics(db, current_user, tenant_id, stats)
+    )
+
+def _results_across_tiers(user_id: int, tenant_id: str, order_by, limit: int):
+    """Top `limit` results of a user from quiz_results and quiz_results_archive together;
+    each tier contributes at most `limit` rows, so archiving never changes the answer"""
+    tiers = [
+        select(model.quiz_id, model.percentage, model.time_taken, model.completed_at).where(
+            model.user_id == user_id, model.tenant_id == tenant_id
+        ).order_by(*order_by(model)).limit(limit).subquery().select()
+        for model in (models.QuizResult, models.QuizResultArchive)
+    ]
+    combined = union_all(*tiers).subquery()
+    return select(combined).order_by(*order_by(combined.c)).limit(limit)
+
+async def _user_analytics(db: AsyncSession, current_user: models.User, tenant_id: str,
+                          stats: Optional[models.UserStats]) -> Dict[str, Any]:
     try:
-        # Get user's quiz results (tenant-isolated)
-        quiz_results = db.query(models.QuizResult).filter(
-            models.QuizResult.user_id == current_user.id,
-            models.QuizResult.tenant_id == tenant_id
-        ).order_by(models.QuizResult.completed_at.desc()).all()
-        
-        # Get user's answered questions for tracking
-        answered_questions = db.query(models.UserQuestionHistory).filter(
-            models.UserQuestionHistory.user_id == current_user.id,
-            models.UserQuestionHistory.tenant_id == tenant_id
-        ).all()
+        topic_stats = (await db.scalars(select(models.UserTopicStats).where(
+            models.UserTopicStats.user_id == current_user.id,
+            models.UserTopicStats.tenant_id == tenant_id
+        ))).all()
         
-        # Calculate detailed analytics
-        total_quizzes = len(quiz_results)
-        total_questions_answered = len(answered_questions)
-        correct_answers = sum(1 for q in answered_questions if q.is_correct)
+        total_quizzes = stats.total_quizzes_taken if stats else 0
+        total_questions_answered = stats.total_questions_answered if stats else 0
+        correct_answers = stats.total_correct_answers if stats else 0
         
         # Performance by topic
         topic_performance = {}
-        for result in quiz_results:
-            quiz = db.query(models.Quiz).filter(models.Quiz.id == result.quiz_id).first()
-            if quiz:
-                topic = db.query(models.Topic).filter(models.Topic.id == quiz.topic_id).first()
-                if topic:
-                    topic_name = topic.name
-                    if topic_name not in topic_performance:
-                        topic_performance[topic_name] = {
-                            'total_quizzes': 0,
-                            'total_questions': 0,
-                            'correct_answers': 0,
-                            'average_score': 0,
-                            'best_score': 0,
-                            'weakest_areas': []
-                        }
-                    
-                    topic_performance[topic_name]['total_quizzes'] += 1
-                    topic_performance[topic_name]['total_questions'] += result.total_questions
-                    topic_performance[topic_name]['correct_answers'] += result.score
-                    
-                    # Update best score
-                    if result.percentage > topic_performance[topic_name]['best_score']:
-                        topic_performance[topic_name]['best_score'] = result.percentage
-        
-        # Calculate averages
-        for topic in topic_performance.values():
-            if topic['total_questions'] > 0:
-                topic['average_score'] = (topic['correct_answers'] / topic['total_questions']) * 100
+        for topic in topic_stats:
+            topic_performance[topic.topic_name] = {
+                'total_quizzes': topic.total_quizzes,
+                'total_questions': topic.total_questions,
+                'correct_answers': topic.correct_answers,
+                'average_score': (topic.correct_answers / topic.total_questions) * 100 if topic.total_questions > 0 else 0,
+                'best_score': topic.best_score,
+                'weakest_areas': []
+            }
         
         # Performance by difficulty
         difficulty_performance = {
@@ -758,20 +916,47 @@ def get_user_analytics(
             'hard': {'total': 0, 'correct': 0, 'average': 0}
         }
         
-        for question in answered_questions:
-            difficulty = question.difficulty_level or 'medium'
-            if difficulty in difficulty_performance:
-                difficulty_performance[difficulty]['total'] += 1
-                if question.is_correct:
-                    difficulty_performance[difficulty]['correct'] += 1
+        difficulty = func.coalesce(models.UserQuestionHistory.difficulty_level, 'medium')
+        difficulty_totals = (await db.execute(select(
+            difficulty,
+            func.count(models.UserQuestionHistory.id),
+            func.sum(case((models.UserQuestionHistory.is_correct == True, 1), else_=0))
+        ).where(
+            models.UserQuestionHistory.user_id == current_user.id,
+            models.UserQuestionHistory.tenant_id == tenant_id
+        ).group_by(difficulty))).all()
+        
+        # Totals of archived rows, one row per topic and difficulty
+        rollups = (await db.scalars(select(models.UserTopicRollup).where(
+            models.UserTopicRollup.user_id == current_user.id,
+            models.UserTopicRollup.tenant_id == tenant_id
+        ))).all()
+        
+        # Answered and wrong questions per category and difficulty, one row kept up to date by submit-quiz
+        error_matrix = (await db.scalars(select(models.UserErrorMatrix).where(
+            models.UserErrorMatrix.user_id == current_user.id,
+            models.UserErrorMatrix.tenant_id == tenant_id
+        ))).first()
+        
+        for level, total, correct in difficulty_totals:
+            if level in difficulty_performance:
+                difficulty_performance[level]['total'] += total
+                difficulty_performance[level]['correct'] += correct or 0
+        
+        for rollup in rollups:
+            if rollup.difficulty_level in difficulty_performance:
+                difficulty_performance[rollup.difficulty_level]['total'] += rollup.questions_answered
+                difficulty_performance[rollup.difficulty_level]['correct'] += rollup.correct_answers
         
         # Calculate difficulty averages
         for diff in difficulty_performance.values():
             if diff['total'] > 0:
                 diff['average'] = (diff['correct'] / diff['total']) * 100
         
-        # Recent performance trend (last 10 quizzes)
-        recent_results = quiz_results[:10]
+        # Recent performance trend (last 10 quizzes, archived ones included)
+        recent_results = (await db.execute(_results_across_tiers(
+            current_user.id, tenant_id, lambda c: [c.completed_at.desc()], 10
+        ))).all()
         recent_scores = [r.percentage for r in recent_results]
         performance_trend = "improving" if len(recent_scores) >= 2 and recent_scores[0] > recent_scores[-1] else "stable"
         
@@ -788,14 +973,16 @@ def get_user_analytics(
             'slowest_quiz': None
         }
         
-        if quiz_results:
-            total_time = sum(r.time_taken for r in quiz_results)
-            total_questions = sum(r.total_questions for r in quiz_results)
-            if total_questions > 0:
-                time_analysis['average_time_per_question'] = total_time / total_questions
-            
-            fastest_quiz = min(quiz_results, key=lambda x: x.time_taken)
-            slowest_quiz = max(quiz_results, key=lambda x: x.time_taken)
+        if total_questions_answered > 0:
+            time_analysis['average_time_per_question'] = stats.total_time_seconds / total_questions_answered
+        
+        if recent_results:
+            fastest_quiz = (await db.execute(_results_across_tiers(
+                current_user.id, tenant_id, lambda c: [c.time_taken.asc(), c.completed_at.desc()], 1
+            ))).first()
+            slowest_quiz = (await db.execute(_results_across_tiers(
+                current_user.id, tenant_id, lambda c: [c.time_taken.desc(), c.completed_at.desc()], 1
+            ))).first()
             
             time_analysis['fastest_quiz'] = {
                 'quiz_id': fastest_quiz.quiz_id,
@@ -817,13 +1004,15 @@ def get_user_analytics(
                 "total_questions_answered": total_questions_answered,
                 "total_correct_answers": correct_answers,
                 "overall_accuracy": (correct_answers / total_questions_answered * 100) if total_questions_answered > 0 else 0,
-                "average_score": current_user.average_score,
-                "best_score": current_user.best_score,
+                "average_score": average_score(stats),
+                "best_score": stats.best_score if stats else 0,
                 "performance_trend": performance_trend
             },
             "topic_performance": topic_performance,
             "difficulty_performance": difficulty_performance,
             "weakest_areas": [topic for topic, score in weakest_topics],
+            "weak_areas": weak_areas(error_matrix.get_cells() if error_matrix else {}),
+            "streaks": streak_summary(stats, local_day(datetime.utcnow(), current_user.timezone)),
             "time_analysis": time_analysis,
             "recent_performance": {
                 "last_10_scores": recent_scores,
@@ -834,18 +1023,77 @@ def get_user_analytics(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analytics/user/report")
+async def get_user_analytics_report(
+    request: Request,
+    tenant_id: str = Query(...),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user)
+):
+    """Full-history report: topic, difficulty and time metrics, trend, weak areas and recommendations"""
+    # Ensure user belongs to the specified tenant
+    if current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
+    
+    # Same validators as /analytics/user: the report only changes when a quiz is recorded
+    stats = (await db.scalars(select(models.UserStats).where(
+        models.UserStats.user_id == current_user.id,
+        models.UserStats.tenant_id == tenant_id
+    ))).first()
+    
+    key = ("analytics/user/report", current_user.id, tenant_id)
+    etag, last_modified = analytics_validators(
+        key, stats.analytics_version if stats else None, stats.updated_at if stats else None, current_user.timezone
+    )
+    return await analytics_cache.serve(
+        request, key, etag, last_modified, lambda: _user_analytics_report(current_user.id, tenant_id)
+    )
+
+async def _user_analytics_report(user_id: int, tenant_id: str) -> Dict[str, Any]:
+    # Imported on first use: analytics_service pulls in pandas and NumPy
+    from analytics_service import AnalyticsService
+    
+    session_factory = await read_session_factory(tenant_id)
+    
+    def build():
+        # Columnar fetches and vectorized metrics are CPU work; keep them off the event loop
+        db = session_factory()
+        try:
+            return AnalyticsService(db).get_user_analytics(user_id, tenant_id)
+        finally:
+            db.close()
+    
+    report = await asyncio.to_thread(build)
+    if "error" in report:
+        raise HTTPException(status_code=500, detail=report["error"])
+    return report
+
 @app.get("/analytics/progress")
-def get_progress_data(
-    days: int = Query(30),
+async def get_progress_data(
+    request: Request,
+    days: int = Query(30, ge=1, le=365),  # one year of daily rollups at most
     tenant_id: str = Query(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user)
 ):
     """Get detailed progress tracking over time"""
     # Ensure user belongs to the specified tenant
     if current_user.tenant_id != tenant_id:
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
+    version = (await db.execute(select(models.UserStats.analytics_version, models.UserStats.updated_at).where(
+        models.UserStats.user_id == current_user.id,
+        models.UserStats.tenant_id == tenant_id
+    ))).first()
+    
+    # The window ends today (UTC), so the validators roll over with the UTC day
+    key = ("analytics/progress", current_user.id, tenant_id, days)
+    etag, last_modified = analytics_validators(key, *(version or (None, None)), "UTC")
+    return await analytics_cache.serve(
+        request, key, etag, last_modified, lambda: _progress_data(db, current_user, tenant_id, days)
+    )
+
+async def _progress_data(db: AsyncSession, current_user: models.User, tenant_id: str, days: int) -> Dict[str, Any]:
     try:
         from datetime import datetime, timedelta
         
@@ -853,44 +1101,39 @@ def get_progress_data(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Get quiz results in date range
-        quiz_results = db.query(models.QuizResult).filter(
-            models.QuizResult.user_id == current_user.id,
-            models.QuizResult.tenant_id == tenant_id,
-            models.QuizResult.completed_at >= start_date,
-            models.QuizResult.completed_at <= end_date
-        ).order_by(models.QuizResult.completed_at.asc()).all()
+        # Daily rollups maintained by submit-quiz: at most one row per day
+        progress_rows = (await db.scalars(select(models.ProgressTracking).where(
+            models.ProgressTracking.user_id == current_user.id,
+            models.ProgressTracking.tenant_id == tenant_id,
+            models.ProgressTracking.day >= start_date.date(),
+            models.ProgressTracking.day <= end_date.date()
+        ).order_by(models.ProgressTracking.day.asc()))).all()
         
         # Group by date
         daily_progress = {}
-        for result in quiz_results:
-            date_key = result.completed_at.date().isoformat()
-            if date_key not in daily_progress:
-                daily_progress[date_key] = {
-                    'quizzes_taken': 0,
-                    'questions_answered': 0,
-                    'correct_answers': 0,
-                    'average_score': 0,
-                    'total_time': 0
-                }
-            
-            daily_progress[date_key]['quizzes_taken'] += 1
-            daily_progress[date_key]['questions_answered'] += result.total_questions
-            daily_progress[date_key]['correct_answers'] += result.score
-            daily_progress[date_key]['total_time'] += result.time_taken
-        
-        # Calculate daily averages
-        for date_data in daily_progress.values():
-            if date_data['questions_answered'] > 0:
-                date_data['average_score'] = (date_data['correct_answers'] / date_data['questions_answered']) * 100
-        
-        # Get question history for detailed analysis
-        question_history = db.query(models.UserQuestionHistory).filter(
-            models.UserQuestionHistory.user_id == current_user.id,
-            models.UserQuestionHistory.tenant_id == tenant_id,
-            models.UserQuestionHistory.answered_at >= start_date,
-            models.UserQuestionHistory.answered_at <= end_date
-        ).all()
+        for row in progress_rows:
+            daily_progress[row.day.isoformat()] = {
+                'quizzes_taken': row.quizzes_taken,
+                'questions_answered': row.questions_answered,
+                'correct_answers': row.correct_answers,
+                'average_score': (row.correct_answers / row.questions_answered) * 100 if row.questions_answered > 0 else 0,
+                'total_time': row.total_time_seconds
+            }
+        
+        # Answered questions per topic and difficulty over the window
+        topic_totals = (await db.execute(select(
+            models.DailyTopicProgress.topic_name,
+            models.DailyTopicProgress.difficulty_level,
+            func.sum(models.DailyTopicProgress.questions_answered),
+            func.sum(models.DailyTopicProgress.correct_answers)
+        ).where(
+            models.DailyTopicProgress.user_id == current_user.id,
+            models.DailyTopicProgress.tenant_id == tenant_id,
+            models.DailyTopicProgress.day >= start_date.date(),
+            models.DailyTopicProgress.day <= end_date.date()
+        ).group_by(
+            models.DailyTopicProgress.topic_name, models.DailyTopicProgress.difficulty_level
+        ))).all()
         
         # Analyze question patterns
         question_patterns = {
@@ -899,52 +1142,185 @@ def get_progress_data(
             'strengths': []
         }
         
-        # Group questions by topic and difficulty
-        question_groups = {}
-        for qh in question_history:
-            key = f"{qh.topic_name}_{qh.difficulty_level}"
-            if key not in question_groups:
-                question_groups[key] = {'total': 0, 'correct': 0}
-            question_groups[key]['total'] += 1
-            if qh.is_correct:
-                question_groups[key]['correct'] += 1
-        
         # Identify strengths and weaknesses
-        for group_key, stats in question_groups.items():
-            accuracy = (stats['correct'] / stats['total']) * 100
-            topic, difficulty = group_key.split('_', 1)
+        for topic, difficulty, total, correct in topic_totals:
+            if not total:
+                continue
+            accuracy = ((correct or 0) / total) * 100
             
             if accuracy < 60:
                 question_patterns['improvement_areas'].append({
                     'topic': topic,
                     'difficulty': difficulty,
                     'accuracy': accuracy,
-                    'total_questions': stats['total']
+                    'total_questions': total
                 })
             elif accuracy > 80:
                 question_patterns['strengths'].append({
                     'topic': topic,
                     'difficulty': difficulty,
                     'accuracy': accuracy,
-                    'total_questions': stats['total']
+                    'total_questions': total
                 })
         
+        total_quizzes = sum(row.quizzes_taken for row in progress_rows)
+        
         return {
             "success": True,
             "period": f"Last {days} days",
             "daily_progress": daily_progress,
             "question_patterns": question_patterns,
             "summary": {
-                "total_quizzes": len(quiz_results),
-                "total_questions": len(question_history),
-                "average_daily_quizzes": len(quiz_results) / days if days > 0 else 0,
-                "consistency_score": len(set(qr.completed_at.date() for qr in quiz_results)) / days if days > 0 else 0
+                "total_quizzes": total_quizzes,
+                "total_questions": sum(total or 0 for _, _, total, _ in topic_totals),
+                "average_daily_quizzes": total_quizzes / days if days > 0 else 0,
+                "consistency_score": sum(1 for row in progress_rows if row.quizzes_taken) / days if days > 0 else 0
             }
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _display_name(user: models.User) -> str:
+    """First name and last initial, so cohort views do not expose emails"""
+    if user.first_name:
+        return f"{user.first_name} {user.last_name[:1]}." if user.last_name else user.first_name
+    return f"Learner {user.id}"
+
+@app.get("/analytics/tenant")
+async def get_tenant_analytics(
+    tenant_id: str = Query(...),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_admin)
+):
+    """Cohort view for tenant admins: topic accuracy across the tenant and the most active users"""
+    if current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
+    
+    # Tenant-wide totals per topic, maintained by submit-quiz
+    topic_rows = (await db.scalars(select(models.TenantTopicStats).where(
+        models.TenantTopicStats.tenant_id == tenant_id
+    ))).all()
+    
+    # Distinct learners per topic (one user_topic_stats row per learner and topic)
+    learners = dict((await db.execute(select(
+        models.UserTopicStats.topic_name, func.count(models.UserTopicStats.id)
+    ).where(
+        models.UserTopicStats.tenant_id == tenant_id
+    ).group_by(models.UserTopicStats.topic_name))).all())
+    
+    active_learners = await db.scalar(select(func.count(models.UserStats.id)).where(
+        models.UserStats.tenant_id == tenant_id,
+        models.UserStats.total_quizzes_taken > 0
+    ))
+    
+    most_active = (await db.execute(select(models.UserStats, models.User).join(
+        models.User, models.User.id == models.UserStats.user_id
+    ).where(
+        models.UserStats.tenant_id == tenant_id
+    ).order_by(
+        models.UserStats.total_quizzes_taken.desc(), models.UserStats.user_id
+    ).limit(limit))).all()
+    
+    topic_accuracy = sorted([
+        {
+            'topic': row.topic_name,
+            'learners': learners.get(row.topic_name, 0),
+            'total_quizzes': row.total_quizzes,
+            'total_questions': row.total_questions,
+            'correct_answers': row.correct_answers,
+            'accuracy': (row.correct_answers / row.total_questions) * 100 if row.total_questions > 0 else 0,
+            'average_time_per_question': row.total_time_seconds / row.total_questions if row.total_questions > 0 else 0,
+            'best_score': row.best_score,
+            'last_quiz_date': row.last_quiz_date.isoformat() if row.last_quiz_date else None
+        }
+        for row in topic_rows
+    ], key=lambda topic: topic['accuracy'])
+    
+    total_questions = sum(row.total_questions for row in topic_rows)
+    correct_answers = sum(row.correct_answers for row in topic_rows)
+    
+    return {
+        "success": True,
+        "tenant_id": tenant_id,
+        "summary": {
+            "active_learners": active_learners or 0,
+            "total_quizzes": sum(row.total_quizzes for row in topic_rows),
+            "total_questions": total_questions,
+            "correct_answers": correct_answers,
+            "accuracy": (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+        },
+        "topic_accuracy": topic_accuracy,
+        "most_active_users": [
+            {
+                'user_id': stats.user_id,
+                'name': _display_name(user),
+                'total_quizzes': stats.total_quizzes_taken,
+                'total_questions': stats.total_questions_answered,
+                'accuracy': average_score(stats),
+                'last_quiz_date': stats.last_quiz_date.isoformat() if stats.last_quiz_date else None
+            }
+            for stats, user in most_active
+        ]
+    }
+
+@app.get("/leaderboard")
+async def get_quiz_leaderboard(
+    quiz_id: int = Query(...),
+    tenant_id: str = Query(...),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user)
+):
+    """Best attempt per user on a quiz, ranked by score and then by time taken"""
+    if current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
+    
+    entry = models.QuizLeaderboardEntry
+    in_quiz = (entry.tenant_id == tenant_id, entry.quiz_id == quiz_id)
+    top = (await db.execute(select(entry, models.User).join(
+        models.User, models.User.id == entry.user_id
+    ).where(*in_quiz).order_by(
+        entry.best_score.desc(), entry.best_time_seconds.asc(), entry.achieved_at.asc()
+    ).limit(limit))).all()
+    
+    def as_row(rank: int, row, user) -> Dict[str, Any]:
+        return {
+            'rank': rank,
+            'user_id': row.user_id,
+            'name': _display_name(user),
+            'best_score': row.best_score,
+            'correct_answers': row.best_correct,
+            'time_taken': row.best_time_seconds,
+            'attempts': row.attempts,
+            'achieved_at': row.achieved_at.isoformat() if row.achieved_at else None
+        }
+    
+    entries = [as_row(rank, row, user) for rank, (row, user) in enumerate(top, start=1)]
+    
+    # The caller's own position when they are outside the top entries
+    your_entry = next((item for item in entries if item['user_id'] == current_user.id), None)
+    if your_entry is None:
+        mine = (await db.execute(select(entry, models.User).join(
+            models.User, models.User.id == entry.user_id
+        ).where(*in_quiz, entry.user_id == current_user.id))).first()
+        if mine:
+            row, user = mine
+            ahead = await db.scalar(select(func.count(entry.id)).where(*in_quiz, or_(
+                entry.best_score > row.best_score,
+                and_(entry.best_score == row.best_score, entry.best_time_seconds < row.best_time_seconds)
+            )))
+            your_entry = as_row(ahead + 1, row, user)
+    
+    return {
+        "success": True,
+        "quiz_id": quiz_id,
+        "participants": await db.scalar(select(func.count(entry.id)).where(*in_quiz)),
+        "entries": entries,
+        "your_entry": your_entry
+    }
+
 # Temporarily disabled chatbot endpoints due to langchain compatibility issues
 # @app.post("/chatbot/chat")
 # def chatbot_chat(
@@ -1100,78 +1476,136 @@ def create_dynamic_topic(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/quiz-history")
-def get_quiz_history(
+async def get_quiz_history(
     tenant_id: str = Query(...),
-    limit: int = Query(20),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    limit: int = Query(20, ge=1, le=500),
+    cursor: Optional[str] = Query(None),  # next_cursor from the previous page
+    include_archived: bool = Query(False),  # Also read results moved to the archive tier
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user)
 ):
-    """Get user's quiz history (tenant-isolated)"""
+    """Get user's quiz history (tenant-isolated), newest first, one keyset page at a time"""
     # Ensure user belongs to the specified tenant
     if current_user.tenant_id != tenant_id:
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
+    position = decode_cursor(cursor)
+    
     try:
-        # Get user's quiz results with quiz and topic details
-        results = db.query(models.QuizResult).join(models.Quiz).join(models.Topic).filter(
-            models.QuizResult.user_id == current_user.id,
-            models.QuizResult.tenant_id == tenant_id
-        ).order_by(models.QuizResult.completed_at.desc()).limit(limit).all()
-        
-        history = []
-        for result in results:
-            quiz = result.quiz
-            topic = quiz.topic if quiz else None
-            
-            history.append({
-                "quiz_id": result.quiz_id,
-                "topic": topic.name if topic else "Unknown",
-                "score": result.score,
-                "total_questions": result.total_questions,
-                "percentage": result.percentage,
-                "grade": result.grade,
-                "time_taken": result.time_taken,
-                "completed_at": result.completed_at.isoformat(),
-                "quiz_title": quiz.title if quiz else "Unknown Quiz"
-            })
+        # Joined projection: result columns plus quiz title and topic name, no entities to hydrate
+        def history_columns(result_model):
+            return (
+                result_model.id, result_model.quiz_id, result_model.score, result_model.total_questions,
+                result_model.percentage, result_model.grade, result_model.time_taken, result_model.completed_at,
+                models.Quiz.title.label("quiz_title"), models.Topic.name.label("topic_name")
+            )
+        
+        rows = list((await db.execute(keyset(
+            select(*history_columns(models.QuizResult))
+            .join(models.Quiz, models.QuizResult.quiz_id == models.Quiz.id)
+            .join(models.Topic, models.Quiz.topic_id == models.Topic.id)
+            .where(
+                models.QuizResult.user_id == current_user.id,
+                models.QuizResult.tenant_id == tenant_id
+            ),
+            models.QuizResult.completed_at, models.QuizResult.id, position
+        ).limit(limit + 1))).all())
+        
+        if include_archived:
+            # Archived rows keep their original ids, so one cursor pages through both tiers
+            rows += (await db.execute(keyset(
+                select(*history_columns(models.QuizResultArchive))
+                .outerjoin(models.Quiz, models.QuizResultArchive.quiz_id == models.Quiz.id)
+                .outerjoin(models.Topic, models.Quiz.topic_id == models.Topic.id)
+                .where(
+                    models.QuizResultArchive.user_id == current_user.id,
+                    models.QuizResultArchive.tenant_id == tenant_id
+                ),
+                models.QuizResultArchive.completed_at, models.QuizResultArchive.id, position
+            ).limit(limit + 1))).all()
+        
+        history = [
+            {
+                "id": row.id,
+                "quiz_id": row.quiz_id,
+                "topic": row.topic_name or "Unknown",
+                "score": row.score,
+                "total_questions": row.total_questions,
+                "percentage": row.percentage,
+                "grade": row.grade,
+                "time_taken": row.time_taken,
+                "completed_at": row.completed_at,
+                "quiz_title": row.quiz_title or "Unknown Quiz"
+            }
+            for row in rows
+        ]
+        
+        history, next_cursor = paginate(history, limit, lambda h: (h["completed_at"], h["id"]))
+        for entry in history:
+            entry["completed_at"] = entry["completed_at"].isoformat()
+        
+        # Totals come from the running stats, not from the page
+        stats = (await db.scalars(select(models.UserStats).where(
+            models.UserStats.user_id == current_user.id,
+            models.UserStats.tenant_id == tenant_id
+        ))).first()
         
         return {
             "success": True,
             "history": history,
-            "total_count": len(history)
+            "next_cursor": next_cursor,
+            "total_count": stats.total_quizzes_taken if stats else 0
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/question-history")
-def get_question_history(
+async def get_question_history(
     tenant_id: str = Query(...),
     topic: str = Query(None),  # Optional filter by topic
-    limit: int = Query(50),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),  # next_cursor from the previous page
+    include_archived: bool = Query(False),  # Also read history moved to the archive tier
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user)
 ):
     """Get user's question history to show which questions they've already answered"""
     # Ensure user belongs to the specified tenant
     if current_user.tenant_id != tenant_id:
         raise HTTPException(status_code=403, detail="Access denied: User does not belong to this tenant")
     
+    position = decode_cursor(cursor)
+    
     try:
         # Build query for user's answered questions
-        query = db.query(models.UserQuestionHistory).filter(
+        query = select(models.UserQuestionHistory).where(
             models.UserQuestionHistory.user_id == current_user.id,
             models.UserQuestionHistory.tenant_id == tenant_id
         )
         
         # Filter by topic if specified
         if topic:
-            query = query.filter(models.UserQuestionHistory.topic_name == topic)
+            query = query.where(models.UserQuestionHistory.topic_name == topic)
         
         # Get questions ordered by most recent first
-        answered_questions = query.order_by(
-            models.UserQuestionHistory.answered_at.desc()
-        ).limit(limit).all()
+        answered_questions = list((await db.scalars(keyset(
+            query, models.UserQuestionHistory.answered_at, models.UserQuestionHistory.id, position
+        ).limit(limit + 1))).all())
+        
+        if include_archived:
+            archive_query = select(models.UserQuestionHistoryArchive).where(
+                models.UserQuestionHistoryArchive.user_id == current_user.id,
+                models.UserQuestionHistoryArchive.tenant_id == tenant_id
+            )
+            if topic:
+                archive_query = archive_query.where(models.UserQuestionHistoryArchive.topic_name == topic)
+            answered_questions += (await db.scalars(keyset(
+                archive_query, models.UserQuestionHistoryArchive.answered_at,
+                models.UserQuestionHistoryArchive.id, position
+            ).limit(limit + 1))).all()
+        
+        answered_questions, next_cursor = paginate(answered_questions, limit, lambda qh: (qh.answered_at, qh.id))
         
         # Format the response
         question_history = []
@@ -1189,17 +1623,26 @@ def get_question_history(
                 "quiz_id": qh.quiz_id
             })
         
-        # Get summary statistics
-        total_answered = len(answered_questions)
-        correct_answers = sum(1 for q in answered_questions if q.is_correct)
+        # Get summary statistics (per-topic running totals cover every page and both tiers)
+        topic_query = select(models.UserTopicStats).where(
+            models.UserTopicStats.user_id == current_user.id,
+            models.UserTopicStats.tenant_id == tenant_id
+        )
+        if topic:
+            topic_query = topic_query.where(models.UserTopicStats.topic_name == topic)
+        topic_stats = (await db.scalars(topic_query)).all()
+        
+        total_answered = sum(t.total_questions for t in topic_stats)
+        correct_answers = sum(t.correct_answers for t in topic_stats)
         accuracy = (correct_answers / total_answered * 100) if total_answered > 0 else 0
         
         # Get unique topics
-        unique_topics = list(set(qh.topic_name for qh in answered_questions))
+        unique_topics = [t.topic_name for t in topic_stats if t.total_questions]
         
         return {
             "success": True,
             "question_history": question_history,
+            "next_cursor": next_cursor,
             "summary": {
                 "total_questions_answered": total_answered,
                 "correct_answers": correct_answers,
@@ -1207,7 +1650,7 @@ def get_question_history(
                 "unique_topics": unique_topics,
                 "topics_count": len(unique_topics)
             },
-            "total_count": len(question_history)
+            "total_count": total_answered
         }
         
     except Exception as e:
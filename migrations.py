@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for the Quiz Application
+Each migration runs once per database and is recorded in the schema_migrations table
+"""
+
+import json
+import sys
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from database import Base, engine
+
+
+# Composite indexes for the hot query paths in main.py: (name, table, columns)
+HOT_PATH_INDEXES = [
+    ("ix_uqh_user_tenant_answered", "user_question_history", ["user_id", "tenant_id", "answered_at"]),
+    ("ix_quiz_results_user_tenant_completed", "quiz_results", ["user_id", "tenant_id", "completed_at"]),
+    ("ix_questions_quiz_id", "questions", ["quiz_id"]),
+    ("ix_quizzes_topic_tenant", "quizzes", ["topic_id", "tenant_id"]),
+    ("ix_quiz_sessions_quiz_user_status", "quiz_sessions", ["quiz_id", "user_id", "status"]),
+    ("ix_chatbot_interactions_user_created", "chatbot_interactions", ["user_id", "created_at"]),
+]
+
+
+def _create_indexes(engine: Engine, indexes: List[Tuple[str, str, List[str]]]):
+    """Create indexes if missing; on Postgres build them concurrently so writes are not blocked"""
+    is_postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as conn:
+        if is_postgres:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name, table, columns in indexes:
+            concurrently = "CONCURRENTLY " if is_postgres else ""
+            conn.execute(text(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+            ))
+            print(f"  ✓ Index {name} on {table}({', '.join(columns)})")
+        if not is_postgres:
+            conn.commit()
+
+
+def _m001_hot_path_indexes(engine: Engine):
+    _create_indexes(engine, HOT_PATH_INDEXES)
+
+
+def _m002_answered_question_index(engine: Engine):
+    # Backs the NOT EXISTS anti-join in generate_quiz
+    _create_indexes(engine, [("ix_uqh_user_question", "user_question_history", ["user_id", "question_id"])])
+
+
+def _create_tables(engine: Engine, model_names: List[str]):
+    import models
+
+    for name in model_names:
+        table = getattr(models, name).__table__
+        table.create(bind=engine, checkfirst=True)
+        print(f"  ✓ Table {table.name}")
+
+
+def _m003_archive_tier(engine: Engine):
+    _create_tables(engine, ["UserQuestionHistoryArchive", "QuizResultArchive", "UserTopicRollup"])
+
+
+def _m004_user_stats(engine: Engine):
+    from sqlalchemy.orm import Session
+
+    from stats_service import rebuild_stats
+
+    _create_tables(engine, ["UserStats", "UserTopicStats"])
+    with Session(bind=engine) as db:
+        result = rebuild_stats(db)
+    print(f"  ✓ Backfilled {result['user_stats']} user stats and {result['user_topic_stats']} topic stats rows")
+
+
+def _add_columns(engine: Engine, table: str, columns: List[Tuple[str, str]]):
+    """ALTER TABLE ... ADD COLUMN for columns that create_all cannot add to an existing table"""
+    from sqlalchemy import inspect
+
+    existing = {column["name"] for column in inspect(engine).get_columns(table)}
+    with engine.begin() as conn:
+        for name, ddl in columns:
+            if name in existing:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            print(f"  ✓ Column {table}.{name}")
+
+
+def _m005_daily_progress(engine: Engine):
+    from sqlalchemy.orm import Session
+
+    from stats_service import rebuild_daily_progress
+
+    _add_columns(engine, "progress_tracking", [
+        ("tenant_id", "VARCHAR"),
+        ("day", "DATE"),
+        ("total_time_seconds", "INTEGER DEFAULT 0"),
+    ])
+    _create_tables(engine, ["DailyTopicProgress"])
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_progress_tracking_user_tenant_day "
+            "ON progress_tracking (user_id, tenant_id, day)"
+        ))
+    with Session(bind=engine) as db:
+        result = rebuild_daily_progress(db)
+    print(f"  ✓ Backfilled {result['progress_tracking']} daily rows and "
+          f"{result['daily_topic_progress']} daily topic rows")
+
+
+def _drop_indexes(engine: Engine, names: List[str]):
+    is_postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as conn:
+        if is_postgres:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name in names:
+            concurrently = "CONCURRENTLY " if is_postgres else ""
+            conn.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+            print(f"  ✓ Dropped index {name}")
+        if not is_postgres:
+            conn.commit()
+
+
+def _m006_keyset_pagination_indexes(engine: Engine):
+    # (timestamp, id) ordering for cursor pagination; the new indexes supersede the old prefixes
+    _create_indexes(engine, [
+        ("ix_quiz_results_user_tenant_completed_id", "quiz_results", ["user_id", "tenant_id", "completed_at", "id"]),
+        ("ix_uqh_user_tenant_answered_id", "user_question_history", ["user_id", "tenant_id", "answered_at", "id"]),
+        ("ix_quiz_results_archive_user_tenant_completed_id", "quiz_results_archive",
+         ["user_id", "tenant_id", "completed_at", "id"]),
+        ("ix_uqh_archive_user_tenant_answered_id", "user_question_history_archive",
+         ["user_id", "tenant_id", "answered_at", "id"]),
+    ])
+    _drop_indexes(engine, [
+        "ix_quiz_results_user_tenant_completed",
+        "ix_uqh_user_tenant_answered",
+        "ix_quiz_results_archive_user_tenant_completed",
+        "ix_uqh_archive_user_tenant_answered",
+    ])
+
+
+JSON_DOCUMENT_COLUMNS = ["user_answers", "correct_answers", "questions_analysis", "time_per_question", "difficulty_breakdown"]
+
+
+def _decode_legacy_json(raw):
+    """Decode a stored value, unwrapping documents that were json.dumps()-ed into a JSON column"""
+    value = raw
+    for _ in range(2):
+        if not isinstance(value, (str, bytes)):
+            break
+        try:
+            value = json.loads(value)
+        except ValueError:
+            break
+    return value
+
+
+def _reencode_json_postgres(engine: Engine, table: str, columns: List[str]):
+    with engine.begin() as conn:
+        types = dict(conn.execute(text(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = :t"
+        ), {"t": table}).all())
+        for column in columns:
+            if types.get(column) in (None, "jsonb"):
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING ("
+                f"CASE WHEN json_typeof({column}::json) = 'string' "
+                f"THEN ({column}::json #>> '{{}}')::jsonb ELSE {column}::jsonb END)"
+            ))
+            print(f"  ✓ {table}.{column} -> JSONB")
+
+
+def _reencode_json_text(engine: Engine, table: str, columns: List[str], batch_size: int = 1000):
+    select_sql = text(f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > :after ORDER BY id LIMIT :n")
+    update_sql = text(f"UPDATE {table} SET {', '.join(f'{c} = :{c}' for c in columns)} WHERE id = :id")
+    after, rewritten = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select_sql, {"after": after, "n": batch_size}).all()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                values = {"id": row[0]}
+                for column, raw in zip(columns, row[1:]):
+                    values[column] = None if raw is None else json.dumps(
+                        _decode_legacy_json(raw), separators=(",", ":")
+                    )
+                if any(values[c] != raw for c, raw in zip(columns, row[1:])):
+                    updates.append(values)
+            if updates:
+                conn.execute(update_sql, updates)
+            rewritten += len(updates)
+            after = rows[-1][0]
+    print(f"  ✓ Re-encoded {rewritten} rows in {table}")
+
+
+def _m007_json_documents(engine: Engine):
+    for table in ("quiz_results", "quiz_results_archive"):
+        if engine.dialect.name == "postgresql":
+            _reencode_json_postgres(engine, table, JSON_DOCUMENT_COLUMNS)
+        else:
+            _reencode_json_text(engine, table, JSON_DOCUMENT_COLUMNS)
+
+
+def _m008_tenant_directory(engine: Engine):
+    _create_tables(engine, ["TenantShard"])
+
+
+def _m009_session_sweeper(engine: Engine):
+    json_type = "JSONB" if engine.dialect.name == "postgresql" else "TEXT"
+    _add_columns(engine, "quiz_sessions", [("partial_answers", json_type)])
+    _create_indexes(engine, [
+        ("ix_quiz_sessions_status_end_time", "quiz_sessions", ["status", "end_time"]),
+    ])
+
+
+def _m010_tenant_aggregates(engine: Engine):
+    from sqlalchemy.orm import Session
+
+    from stats_service import rebuild_stats
+
+    _create_tables(engine, ["TenantTopicStats", "QuizLeaderboardEntry"])
+    _create_indexes(engine, [
+        ("ix_user_stats_tenant_quizzes", "user_stats", ["tenant_id", "total_quizzes_taken"]),
+        ("ix_user_topic_stats_tenant_topic", "user_topic_stats", ["tenant_id", "topic_name"]),
+    ])
+    with Session(bind=engine) as db:
+        result = rebuild_stats(db)
+    print(f"  ✓ Backfilled {result['tenant_topic_stats']} tenant topic and "
+          f"{result['quiz_leaderboard']} leaderboard rows")
+
+
+def _m011_streaks(engine: Engine):
+    from sqlalchemy.orm import Session
+
+    from stats_service import rebuild_streaks
+
+    _add_columns(engine, "users", [("timezone", "VARCHAR")])
+    _add_columns(engine, "user_stats", [
+        ("last_active_day", "DATE"),
+        ("current_streak", "INTEGER"),
+        ("longest_streak", "INTEGER"),
+    ])
+    with Session(bind=engine) as db:
+        result = rebuild_streaks(db)
+    print(f"  ✓ Backfilled streaks for {result['user_stats']} users and {result['progress_tracking']} daily rows")
+
+def _m012_analytics_version(engine: Engine):
+    _add_columns(engine, "user_stats", [("analytics_version", "INTEGER")])
+
+def _m013_question_stats(engine: Engine):
+    _add_columns(engine, "questions", [("answer_time_samples", "INTEGER")])
+    _create_tables(engine, ["QuestionStatsFlush"])
+
+def _m014_error_matrix(engine: Engine):
+    from sqlalchemy.orm import Session
+
+    from stats_service import rebuild_error_matrix
+
+    _create_tables(engine, ["UserErrorMatrix"])
+    with Session(bind=engine) as db:
+        result = rebuild_error_matrix(db)
+    print(f"  ✓ Backfilled the error matrix for {result['user_error_matrix']} users")
+
+
+def _m015_progress_tenant(engine: Engine):
+    with engine.begin() as conn:
+        updated = conn.execute(text(
+            "UPDATE progress_tracking SET tenant_id = "
+            "(SELECT users.tenant_id FROM users WHERE users.id = progress_tracking.user_id) "
+            "WHERE tenant_id IS NULL"
+        )).rowcount
+    print(f"  ✓ Backfilled tenant_id on {updated} progress rows")
+
+# Ordered list of (version, description, upgrade function)
+MIGRATIONS: List[Tuple[int, str, Callable[[Engine], None]]] = [
+    (1, "Composite indexes for hot query paths", _m001_hot_path_indexes),
+    (2, "Index for unanswered-question anti-join", _m002_answered_question_index),
+    (3, "Archive tables and per-topic rollups for old history", _m003_archive_tier),
+    (4, "Per-user stats aggregates", _m004_user_stats),
+    (5, "Daily progress rollups", _m005_daily_progress),
+    (6, "Keyset pagination indexes for history", _m006_keyset_pagination_indexes),
+    (7, "Store quiz result JSON once (JSONB on Postgres, compact text elsewhere)", _m007_json_documents),
+    (8, "Tenant shard directory", _m008_tenant_directory),
+    (9, "Saved answers and expiry index for the session sweeper", _m009_session_sweeper),
+    (10, "Tenant topic aggregates and quiz leaderboards", _m010_tenant_aggregates),
+    (11, "Incremental study streaks with per-user time zones", _m011_streaks),
+    (12, "Analytics version counter for response caching", _m012_analytics_version),
+    (13, "Write-behind question stats", _m013_question_stats),
+    (14, "Per-user error matrix by category and difficulty", _m014_error_matrix),
+    (15, "Backfill progress_tracking.tenant_id from users", _m015_progress_tenant),
+]
+
+
+def _ensure_migrations_table(conn: Connection):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255), "
+        "applied_at TIMESTAMP)"
+    ))
+
+
+def get_applied_versions(engine: Engine = engine) -> List[int]:
+    """Return the migration versions already applied to this database"""
+    with engine.begin() as conn:
+        _ensure_migrations_table(conn)
+        rows = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))
+        return [row[0] for row in rows]
+
+
+def upgrade(engine: Engine = engine) -> List[int]:
+    """Create missing tables and apply all pending migrations in order"""
+    import models  # noqa: F401  (registers all tables on Base.metadata)
+
+    Base.metadata.create_all(bind=engine)
+
+    applied = set(get_applied_versions(engine))
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"⏫ Applying migration {version:03d}: {description}")
+        migrate(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()},
+            )
+        newly_applied.append(version)
+
+    return newly_applied
+
+
+if __name__ == "__main__":
+    print("Running database migrations...")
+    print("=" * 50)
+    try:
+        applied = upgrade()
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+    if applied:
+        print(f"\n🎉 Applied migrations: {', '.join(f'{v:03d}' for v in applied)}")
+    else:
+        print("\n✅ Database is up to date")
+
+    from database import tenant_router
+
+    if tenant_router.enabled:
+        try:
+            shards = tenant_router.prepare_known_shards()
+        except Exception as e:
+            print(f"❌ Shard migration failed: {e}")
+            sys.exit(1)
+        print(f"✅ Shards up to date: {', '.join(shards) or 'none'}")
@@ -1,9 +1,52 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Text, Float, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 import json
 from database import Base
 
+class JSONDocument(TypeDecorator):
+    """JSONB on Postgres, compact JSON text elsewhere; values are stored encoded exactly once.
+
+    Reads return what the driver gives back (decoded JSONB on Postgres, raw text on
+    SQLite); models decode lazily through _json_value so unused columns cost nothing.
+    Strings are taken as already-encoded JSON, so legacy json.dumps() callers do not
+    double-encode.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == "postgresql":
+            return json.loads(value) if isinstance(value, str) else value
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, separators=(",", ":"))
+
+class LazyJSONMixin:
+    """Decode JSONDocument columns on first access and memoize until the raw value changes"""
+
+    def _json_value(self, name: str, default=None):
+        raw = getattr(self, name)
+        if raw is None:
+            return default
+        cache = self.__dict__.setdefault("_decoded_json", {})
+        cached = cache.get(name)
+        if cached is not None and cached[0] is raw:
+            return cached[1]
+        value = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        cache[name] = (raw, value)
+        return value
+
 class User(Base):
     __tablename__ = "users"
 
@@ -13,6 +56,7 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String)
     tenant_id = Column(String, index=True)  # Multitenancy
+    timezone = Column(String, nullable=True)  # IANA name; day boundary for streaks (STREAK_TIMEZONE if unset)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -52,6 +96,9 @@ class Topic(Base):
 
 class Quiz(Base):
     __tablename__ = "quizzes"
+    __table_args__ = (
+        Index("ix_quizzes_topic_tenant", "topic_id", "tenant_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(String, index=True)  # Multitenancy
@@ -82,7 +129,7 @@ class Question(Base):
     __tablename__ = "questions"
 
     id = Column(Integer, primary_key=True, index=True)
-    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
     question_text = Column(Text)
     correct_answer = Column(String)
     option_a = Column(String)
@@ -98,12 +145,16 @@ class Question(Base):
     times_asked = Column(Integer, default=0)
     times_correct = Column(Integer, default=0)
     average_time_to_answer = Column(Float, default=0.0)  # in seconds
+    answer_time_samples = Column(Integer, nullable=True)  # answers with a recorded time, weight of the average
 
     # Relationships
     quiz = relationship("Quiz", back_populates="questions")
 
-class QuizResult(Base):
+class QuizResult(LazyJSONMixin, Base):
     __tablename__ = "quiz_results"
+    __table_args__ = (
+        Index("ix_quiz_results_user_tenant_completed_id", "user_id", "tenant_id", "completed_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(String, index=True)  # Multitenancy
@@ -115,15 +166,15 @@ class QuizResult(Base):
     percentage = Column(Float)
     grade = Column(String)  # A, B, C, D, F
     time_taken = Column(Integer)  # in seconds
-    user_answers = Column(Text)  # Store user's answers as JSON string
-    correct_answers = Column(Text)  # Store correct answers as JSON string
+    user_answers = Column(JSONDocument)  # {question_id: answer}
+    correct_answers = Column(JSONDocument)  # {question_id: correct answer}
     feedback = Column(Text, nullable=True)
     completed_at = Column(DateTime, default=datetime.utcnow)
     
     # Detailed analytics
-    questions_analysis = Column(JSON, nullable=True)  # Detailed analysis of each question
-    time_per_question = Column(JSON, nullable=True)  # Time spent on each question
-    difficulty_breakdown = Column(JSON, nullable=True)  # Performance by difficulty
+    questions_analysis = Column(JSONDocument, nullable=True)  # Detailed analysis of each question
+    time_per_question = Column(JSONDocument, nullable=True)  # Time spent on each question
+    difficulty_breakdown = Column(JSONDocument, nullable=True)  # Performance by difficulty
 
     # Relationships
     quiz = relationship("Quiz", back_populates="results")
@@ -132,27 +183,39 @@ class QuizResult(Base):
 
     def get_user_answers(self):
         """Get user answers as dict"""
-        if self.user_answers:
-            return json.loads(self.user_answers)
-        return {}
+        return self._json_value("user_answers", {})
 
     def set_user_answers(self, answers):
-        """Set user answers as JSON string"""
-        self.user_answers = json.dumps(answers)
+        """Set user answers (encoded once, on flush)"""
+        self.user_answers = answers
+
+    def get_correct_answers(self):
+        """Get correct answers as dict"""
+        return self._json_value("correct_answers", {})
+
+    def get_questions_analysis(self):
+        """Get the per-question analysis as a list"""
+        return self._json_value("questions_analysis", [])
 
 class ProgressTracking(Base):
     __tablename__ = "progress_tracking"
+    __table_args__ = (
+        Index("ux_progress_tracking_user_tenant_day", "user_id", "tenant_id", "day", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     topic_id = Column(Integer, ForeignKey("topics.id"), nullable=True)
     date = Column(DateTime, default=datetime.utcnow)
+    tenant_id = Column(String, nullable=True)
+    day = Column(Date, nullable=True)  # UTC day of a daily rollup row, upserted on quiz submit
     
     # Daily progress metrics
     quizzes_taken = Column(Integer, default=0)
     questions_answered = Column(Integer, default=0)
     correct_answers = Column(Integer, default=0)
     study_time = Column(Integer, default=0)  # in minutes
+    total_time_seconds = Column(Integer, default=0)
     average_score = Column(Float, default=0.0)
     
     # Streak tracking
@@ -169,6 +232,9 @@ class ProgressTracking(Base):
 
 class ChatbotInteraction(Base):
     __tablename__ = "chatbot_interactions"
+    __table_args__ = (
+        Index("ix_chatbot_interactions_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -263,8 +329,12 @@ class TopicMastery(Base):
     user = relationship("User", back_populates="topic_mastery")
     topic = relationship("Topic") 
 
-class QuizSession(Base):
+class QuizSession(LazyJSONMixin, Base):
     __tablename__ = "quiz_sessions"
+    __table_args__ = (
+        Index("ix_quiz_sessions_quiz_user_status", "quiz_id", "user_id", "status"),
+        Index("ix_quiz_sessions_status_end_time", "status", "end_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     quiz_id = Column(Integer, ForeignKey("quizzes.id"))
@@ -287,14 +357,25 @@ class QuizSession(Base):
     # Analytics
     questions_answered = Column(Integer, default=0)
     last_activity = Column(DateTime, default=datetime.utcnow)
+    # Answers saved while the quiz is in progress ({"user_answers": ..., "question_times": ...}),
+    # graded by the session sweeper if the session expires before it is submitted
+    partial_answers = Column(JSONDocument, nullable=True)
     
     # Relationships
     quiz = relationship("Quiz")
     user = relationship("User", back_populates="quiz_sessions")
-    quiz_result = relationship("QuizResult", back_populates="session", uselist=False) 
+    quiz_result = relationship("QuizResult", back_populates="session", uselist=False)
+
+    def get_partial_answers(self):
+        """Get saved in-progress answers as {"user_answers": ..., "question_times": ...}"""
+        return self._json_value("partial_answers", {})
 
 class UserQuestionHistory(Base):
     __tablename__ = "user_question_history"
+    __table_args__ = (
+        Index("ix_uqh_user_tenant_answered_id", "user_id", "tenant_id", "answered_at", "id"),
+        Index("ix_uqh_user_question", "user_id", "question_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -327,4 +408,240 @@ class UserQuestionHistory(Base):
     user = relationship("User", back_populates="question_history")
     question = relationship("Question")
     quiz = relationship("Quiz")
-    quiz_session = relationship("QuizSession") 
\ No newline at end of file
+    quiz_session = relationship("QuizSession")
+
+
+# Cold tier: rows older than the archive window are moved here by archive_service.py
+class UserQuestionHistoryArchive(Base):
+    __tablename__ = "user_question_history_archive"
+    __table_args__ = (
+        Index("ix_uqh_archive_user_tenant_answered_id", "user_id", "tenant_id", "answered_at", "id"),
+        Index("ix_uqh_archive_user_question", "user_id", "question_id"),
+    )
+
+    id = Column(Integer, primary_key=True)  # Same id as the original hot row
+    user_id = Column(Integer, ForeignKey("users.id"))
+    question_id = Column(Integer, ForeignKey("questions.id"))
+    tenant_id = Column(String, index=True)
+    question_text = Column(Text)
+    topic_name = Column(String)
+    difficulty_level = Column(String)
+    user_answer = Column(String)
+    correct_answer = Column(String)
+    is_correct = Column(Boolean)
+    time_taken_seconds = Column(Integer, default=0)
+    answered_at = Column(DateTime)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    quiz_session_id = Column(Integer, ForeignKey("quiz_sessions.id"), nullable=True)
+    confidence_level = Column(Float, nullable=True)
+    explanation_reviewed = Column(Boolean, default=False)
+
+    # Archive metadata
+    partition_month = Column(String(7), index=True)  # YYYY-MM of answered_at
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class QuizResultArchive(LazyJSONMixin, Base):
+    __tablename__ = "quiz_results_archive"
+    __table_args__ = (
+        Index("ix_quiz_results_archive_user_tenant_completed_id", "user_id", "tenant_id", "completed_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)  # Same id as the original hot row
+    tenant_id = Column(String, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    session_id = Column(Integer, ForeignKey("quiz_sessions.id"), nullable=True)
+    score = Column(Integer)
+    total_questions = Column(Integer)
+    percentage = Column(Float)
+    grade = Column(String)
+    time_taken = Column(Integer)
+    user_answers = Column(JSONDocument)
+    correct_answers = Column(JSONDocument)
+    feedback = Column(Text, nullable=True)
+    completed_at = Column(DateTime)
+    questions_analysis = Column(JSONDocument, nullable=True)
+    time_per_question = Column(JSONDocument, nullable=True)
+    difficulty_breakdown = Column(JSONDocument, nullable=True)
+
+    # Archive metadata
+    partition_month = Column(String(7), index=True)  # YYYY-MM of completed_at
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class UserTopicRollup(Base):
+    """Per-user, per-topic, per-difficulty totals of archived rows"""
+    __tablename__ = "user_topic_rollups"
+    __table_args__ = (
+        Index("ux_user_topic_rollups_key", "user_id", "tenant_id", "topic_name", "difficulty_level", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    tenant_id = Column(String)
+    topic_name = Column(String)
+    difficulty_level = Column(String)
+
+    # From archived user_question_history rows
+    questions_answered = Column(Integer, default=0)
+    correct_answers = Column(Integer, default=0)
+    question_time_seconds = Column(Integer, default=0)
+
+    # From archived quiz_results rows
+    quizzes_taken = Column(Integer, default=0)
+    quiz_score_total = Column(Integer, default=0)
+    quiz_questions_total = Column(Integer, default=0)
+    quiz_time_seconds = Column(Integer, default=0)
+    percentage_total = Column(Float, default=0.0)
+    best_percentage = Column(Float, default=0.0)
+
+    first_activity_at = Column(DateTime, nullable=True)
+    last_activity_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class UserStats(Base):
+    """Running per-user totals, updated in the same transaction as each quiz submit"""
+    __tablename__ = "user_stats"
+    __table_args__ = (
+        Index("ux_user_stats_user_tenant", "user_id", "tenant_id", unique=True),
+        Index("ix_user_stats_tenant_quizzes", "tenant_id", "total_quizzes_taken"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    tenant_id = Column(String)
+
+    total_quizzes_taken = Column(Integer, default=0)
+    total_questions_answered = Column(Integer, default=0)
+    total_correct_answers = Column(Integer, default=0)
+    total_time_seconds = Column(Integer, default=0)
+    best_score = Column(Float, default=0.0)
+    last_quiz_date = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    # Study streak, advanced on submit; days are counted in the user's time zone
+    last_active_day = Column(Date, nullable=True)
+    current_streak = Column(Integer, nullable=True)
+    longest_streak = Column(Integer, nullable=True)
+
+    # Bumped whenever the user's analytics change; part of the analytics ETags
+    analytics_version = Column(Integer, nullable=True)
+
+class UserTopicStats(Base):
+    """Running per-user, per-topic totals, updated alongside UserStats"""
+    __tablename__ = "user_topic_stats"
+    __table_args__ = (
+        Index("ux_user_topic_stats_key", "user_id", "tenant_id", "topic_name", unique=True),
+        Index("ix_user_topic_stats_tenant_topic", "tenant_id", "topic_name"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    tenant_id = Column(String)
+    topic_name = Column(String)
+
+    total_quizzes = Column(Integer, default=0)
+    total_questions = Column(Integer, default=0)
+    correct_answers = Column(Integer, default=0)
+    total_time_seconds = Column(Integer, default=0)
+    best_score = Column(Float, default=0.0)
+    last_quiz_date = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class DailyTopicProgress(Base):
+    """Per-user, per-day answered questions by topic and difficulty"""
+    __tablename__ = "daily_topic_progress"
+    __table_args__ = (
+        Index("ux_daily_topic_progress_key", "user_id", "tenant_id", "day", "topic_name", "difficulty_level", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    tenant_id = Column(String)
+    day = Column(Date)
+    topic_name = Column(String)
+    difficulty_level = Column(String)
+
+    questions_answered = Column(Integer, default=0)
+    correct_answers = Column(Integer, default=0)
+    time_seconds = Column(Integer, default=0)
+
+class UserErrorMatrix(LazyJSONMixin, Base):
+    """Answered and wrong questions per (category, difficulty) for one user, updated on each quiz submit"""
+    __tablename__ = "user_error_matrix"
+    __table_args__ = (
+        Index("ux_user_error_matrix_user_tenant", "user_id", "tenant_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    tenant_id = Column(String)
+
+    cells = Column(JSONDocument)  # {category: {difficulty: [answered, incorrect]}}
+    total_answered = Column(Integer, default=0)
+    total_incorrect = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def get_cells(self):
+        return self._json_value("cells", {})
+
+class TenantTopicStats(Base):
+    """Running per-tenant, per-topic totals across all users, updated alongside UserTopicStats"""
+    __tablename__ = "tenant_topic_stats"
+    __table_args__ = (
+        Index("ux_tenant_topic_stats_key", "tenant_id", "topic_name", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String)
+    topic_name = Column(String)
+
+    total_quizzes = Column(Integer, default=0)
+    total_questions = Column(Integer, default=0)
+    correct_answers = Column(Integer, default=0)
+    total_time_seconds = Column(Integer, default=0)
+    best_score = Column(Float, default=0.0)
+    last_quiz_date = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class QuizLeaderboardEntry(Base):
+    """Best attempt per user and quiz (highest score, then fastest), for the per-quiz leaderboards"""
+    __tablename__ = "quiz_leaderboard"
+    __table_args__ = (
+        Index("ux_quiz_leaderboard_key", "tenant_id", "quiz_id", "user_id", unique=True),
+        Index("ix_quiz_leaderboard_rank", "tenant_id", "quiz_id", "best_score", "best_time_seconds"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+
+    attempts = Column(Integer, default=0)
+    best_score = Column(Float, default=0.0)  # percentage of the best attempt
+    best_correct = Column(Integer, default=0)
+    best_time_seconds = Column(Integer, default=0)
+    achieved_at = Column(DateTime)  # completion time of the best attempt
+    last_attempt_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class QuestionStatsFlush(Base):
+    """Journal segments of the question stats aggregator already applied to this database (per tenant)"""
+    __tablename__ = "question_stats_flushes"
+    __table_args__ = (
+        Index("ux_question_stats_flushes_key", "flush_id", "tenant_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    flush_id = Column(String)
+    tenant_id = Column(String)
+    applied_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class TenantShard(Base):
+    """Directory of tenants placed on a non-default shard (kept in the default database)"""
+    __tablename__ = "tenant_shards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String, unique=True, nullable=False)
+    shard = Column(String, nullable=False)
+    status = Column(String, default="active")  # active, moving
+    updated_at = Column(DateTime, default=datetime.utcnow)
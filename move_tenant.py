@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Move a tenant's rows to another shard
+The tenant is marked 'moving' in the tenant_shards directory (its requests get
+503 + Retry-After), every tenant-scoped table is copied in dependency order
+with ids preserved, row counts are verified, the directory is pointed at the
+new shard, and the source rows are deleted.
+
+Usage:
+    python move_tenant.py <tenant_id> <target_shard> [--keep-source] [--batch-size 1000] [--no-wait]
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Table, and_, delete, func, insert, or_, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+
+import models
+from database import Base, TENANT_DIRECTORY_TTL_SECONDS, engine as directory_engine, tenant_router
+
+DIRECTORY_TABLE = models.TenantShard.__table__
+
+
+def _tenant_filter(table: Table, tenant_id: str):
+    """WHERE clause selecting the tenant's rows, directly or through users/quizzes"""
+    users = Base.metadata.tables["users"]
+    quizzes = Base.metadata.tables["quizzes"]
+    if "tenant_id" in table.c and "user_id" in table.c:
+        # Rows written before tenant_id was populated still belong to their user's tenant
+        return or_(
+            table.c.tenant_id == tenant_id,
+            and_(
+                table.c.tenant_id.is_(None),
+                table.c.user_id.in_(select(users.c.id).where(users.c.tenant_id == tenant_id)),
+            ),
+        )
+    if "tenant_id" in table.c:
+        return table.c.tenant_id == tenant_id
+    if "user_id" in table.c:
+        return table.c.user_id.in_(select(users.c.id).where(users.c.tenant_id == tenant_id))
+    if "quiz_id" in table.c:
+        return table.c.quiz_id.in_(select(quizzes.c.id).where(quizzes.c.tenant_id == tenant_id))
+    return None
+
+
+def tenant_tables() -> List[Table]:
+    """Tenant-scoped tables, parents before children"""
+    return [
+        table for table in Base.metadata.sorted_tables
+        if table is not DIRECTORY_TABLE and _tenant_filter(table, "") is not None
+    ]
+
+
+def _set_directory(tenant_id: str, shard: str, status: str):
+    with directory_engine.begin() as conn:
+        updated = conn.execute(
+            update(DIRECTORY_TABLE)
+            .where(DIRECTORY_TABLE.c.tenant_id == tenant_id)
+            .values(shard=shard, status=status, updated_at=datetime.utcnow())
+        ).rowcount
+        if not updated:
+            conn.execute(insert(DIRECTORY_TABLE).values(
+                tenant_id=tenant_id, shard=shard, status=status, updated_at=datetime.utcnow()
+            ))
+    tenant_router.forget(tenant_id)
+
+
+def _current_shard(tenant_id: str) -> str:
+    with directory_engine.connect() as conn:
+        row = conn.execute(
+            select(DIRECTORY_TABLE.c.shard, DIRECTORY_TABLE.c.status).where(DIRECTORY_TABLE.c.tenant_id == tenant_id)
+        ).first()
+    if row and row.status == "moving":
+        raise RuntimeError(f"Tenant {tenant_id} is already being moved (clear tenant_shards.status to retry)")
+    return row.shard if row else tenant_router.default_shard
+
+
+def _check_collisions(source, target, tables: List[Table], tenant_id: str, batch_size: int):
+    """Ids are preserved, so the target must not already hold any of them"""
+    for table in tables:
+        pk = table.c.id
+        after = None
+        with source.connect() as src, target.connect() as dst:
+            while True:
+                query = select(pk).where(_tenant_filter(table, tenant_id)).order_by(pk).limit(batch_size)
+                if after is not None:
+                    query = query.where(pk > after)
+                ids = src.execute(query).scalars().all()
+                if not ids:
+                    break
+                taken = dst.execute(select(func.count()).select_from(table).where(pk.in_(ids))).scalar()
+                if taken:
+                    raise RuntimeError(f"{taken} ids of {table.name} already exist on the target shard")
+                after = ids[-1]
+
+
+def _copy_table(source, target, table: Table, tenant_id: str, batch_size: int) -> int:
+    pk = table.c.id
+    copied = 0
+    after = None
+    with source.connect() as src:
+        while True:
+            query = select(table).where(_tenant_filter(table, tenant_id)).order_by(pk).limit(batch_size)
+            if after is not None:
+                query = query.where(pk > after)
+            rows = [dict(row._mapping) for row in src.execute(query)]
+            if not rows:
+                break
+            with target.begin() as dst:
+                dst.execute(insert(table), rows)
+            copied += len(rows)
+            after = rows[-1]["id"]
+    return copied
+
+
+def _count(engine, table: Table, tenant_id: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table).where(_tenant_filter(table, tenant_id))).scalar()
+
+
+def _bump_sequences(target, tables: List[Table]):
+    """Explicit ids leave Postgres sequences behind; move them past the copied rows"""
+    if target.dialect.name != "postgresql":
+        return
+    with target.begin() as conn:
+        for table in tables:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+            ))
+
+
+def _delete_tenant(engine, tables: List[Table], tenant_id: str):
+    with engine.begin() as conn:
+        for table in reversed(tables):
+            conn.execute(delete(table).where(_tenant_filter(table, tenant_id)))
+
+
+def move_tenant(tenant_id: str, target_shard: str, keep_source: bool = False,
+                batch_size: int = 1000, wait_seconds: Optional[float] = None) -> dict:
+    source_shard = _current_shard(tenant_id)
+    if source_shard == target_shard:
+        raise RuntimeError(f"Tenant {tenant_id} is already on shard {target_shard}")
+    source = tenant_router.engine(tenant_router.target(source_shard, tenant_id))
+    target = tenant_router.engine(tenant_router.target(target_shard, tenant_id))  # created and migrated on demand
+    tables = tenant_tables()
+
+    _set_directory(tenant_id, source_shard, "moving")
+    wait = TENANT_DIRECTORY_TTL_SECONDS if wait_seconds is None else wait_seconds
+    if wait > 0:
+        print(f"⏳ Waiting {wait:.0f}s for cached directory entries to expire...")
+        time.sleep(wait)
+
+    copied = {}
+    try:
+        _check_collisions(source, target, tables, tenant_id, batch_size)
+        for table in tables:
+            copied[table.name] = _copy_table(source, target, table, tenant_id, batch_size)
+            expected = _count(source, table, tenant_id)
+            if _count(target, table, tenant_id) != expected:
+                raise RuntimeError(f"Row count mismatch for {table.name}: expected {expected}")
+            print(f"  ✓ {table.name}: {copied[table.name]} rows")
+        _bump_sequences(target, tables)
+    except Exception:
+        if copied:
+            _delete_tenant(target, tables, tenant_id)
+        _set_directory(tenant_id, source_shard, "active")
+        raise
+
+    _set_directory(tenant_id, target_shard, "active")
+    cleanup_error = None
+    if not keep_source:
+        # The tenant is already served from the target; a failed delete only leaves stale source rows
+        try:
+            _delete_tenant(source, tables, tenant_id)
+        except SQLAlchemyError as e:
+            cleanup_error = str(e).splitlines()[0]
+    return {"source": source_shard, "target": target_shard, "rows": copied, "cleanup_error": cleanup_error}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move a tenant to another shard")
+    parser.add_argument("tenant_id")
+    parser.add_argument("target_shard", help="Shard name from TENANT_SHARDS, or 'default'")
+    parser.add_argument("--keep-source", action="store_true", help="Leave the copied rows on the source shard")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--no-wait", action="store_true",
+                        help="Skip waiting for the directory cache TTL (only safe with the API stopped)")
+    args = parser.parse_args()
+
+    try:
+        result = move_tenant(args.tenant_id, args.target_shard, keep_source=args.keep_source,
+                             batch_size=args.batch_size, wait_seconds=0 if args.no_wait else None)
+    except (RuntimeError, KeyError, ValueError) as e:
+        print(f"❌ Move failed: {e}")
+        sys.exit(1)
+    total = sum(result["rows"].values())
+    print(f"✅ Moved tenant {args.tenant_id} from {result['source']} to {result['target']} ({total} rows)")
+    if result["cleanup_error"]:
+        print(f"⚠️  Source rows on {result['source']} were not deleted: {result['cleanup_error']}")
+        print("   Delete them by hand once the cause is fixed; the tenant already reads from the target")
+        sys.exit(2)
@@ -0,0 +1,48 @@
+"""
+Opaque keyset cursors for the history endpoints
+A cursor encodes the (timestamp, id) of the last row on a page; the next page
+continues strictly after it, so deep pages cost the same as the first one.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+Position = Tuple[datetime, int]
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = json.dumps({"t": timestamp.isoformat(), "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Position]:
+    """Turn a next_cursor value back into a (timestamp, id) position; 400 if it was tampered with"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(statement, timestamp_column, id_column, position: Optional[Position]):
+    """Order newest first on (timestamp, id) and continue after the position, if any"""
+    if position is not None:
+        statement = statement.where(tuple_(timestamp_column, id_column) < tuple_(*position))
+    return statement.order_by(timestamp_column.desc(), id_column.desc())
+
+
+def paginate(rows: Sequence, limit: int, key: Callable[[object], Position]) -> Tuple[List, Optional[str]]:
+    """Trim a limit + 1 fetch to one page and build next_cursor from its last row"""
+    rows = sorted(rows, key=key, reverse=True)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,135 @@
+"""
+Password hashing off the event loop
+bcrypt runs in a dedicated, bounded process pool with its own concurrency
+limit, so login/signup storms cannot starve the threadpool other endpoints share.
+On Vercel / AWS Lambda, which have no /dev/shm for multiprocessing semaphores,
+a dedicated thread pool is used instead. This module only depends on passlib so
+pool workers start quickly.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+# bcrypt work factor; hashes with any other factor are re-hashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "auto")  # process | thread | auto
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", str(PASSWORD_HASH_WORKERS)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "0"))  # 0 = unbounded
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+def resolve_executor_kind(kind: str = PASSWORD_HASH_EXECUTOR) -> str:
+    # Same serverless detection as database.resolve_pool_profile (not imported: workers load only passlib)
+    if kind == "auto":
+        return "thread" if os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "process"
+    if kind not in ("process", "thread"):
+        raise ValueError(f"Unknown PASSWORD_HASH_EXECUTOR '{kind}' (use process, thread or auto)")
+    return kind
+
+
+class HashingQueueFull(Exception):
+    """Raised when more hashing requests are waiting than PASSWORD_HASH_MAX_QUEUE allows"""
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash when the stored one uses an outdated work factor"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """Runs hashing on a bounded executor and tracks queue depth"""
+
+    def __init__(self, executor_kind: str, workers: int, max_concurrency: int, max_queue: int):
+        self.executor_kind = executor_kind
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.max_queue and self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise HashingQueueFull("Too many pending password hashing requests")
+
+        self.queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), func, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "executor": self.executor_kind,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    resolve_executor_kind(), PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_CONCURRENCY, PASSWORD_HASH_MAX_QUEUE
+)
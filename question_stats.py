@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Write-behind per-question statistics
+Submit-quiz and session auto-grading hand their answered questions to the
+aggregator in this process instead of updating questions.times_asked /
+times_correct / average_time_to_answer inline, where every submission of a
+popular quiz would queue on the same rows. Deltas are summed per question
+(answer time as a Welford running mean) and flushed with one batched UPDATE
+per tenant database, every QUESTION_STATS_FLUSH_INTERVAL_SECONDS or once
+QUESTION_STATS_FLUSH_MAX_ANSWERS answers are pending.
+
+Crash safety: each recorded batch is appended to a journal file first. A
+flush renames the journal into a segment and applies it per tenant in one
+transaction that also inserts a (flush_id, tenant_id) row into
+question_stats_flushes, so a segment left behind by a crash is replayed on
+the next flush and one that was already applied is skipped. Every flush
+also takes over the journals of worker processes that have since exited.
+
+The aggregated counts drive effective_difficulty(), used by generate-quiz to
+pick questions that play at the requested difficulty, and the calibration
+report below.
+
+Usage:
+    python question_stats.py --flush                # apply journal segments left by stopped processes
+    python question_stats.py --calibrate [--apply]  # compare labelled and observed difficulty
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+QUESTION_STATS_FLUSH_INTERVAL_SECONDS = float(os.getenv("QUESTION_STATS_FLUSH_INTERVAL_SECONDS", "10"))  # 0 disables
+QUESTION_STATS_FLUSH_MAX_ANSWERS = int(os.getenv("QUESTION_STATS_FLUSH_MAX_ANSWERS", "1000"))
+# Empty turns the journal off (pending deltas are then lost if the process dies)
+QUESTION_STATS_JOURNAL_DIR = os.getenv(
+    "QUESTION_STATS_JOURNAL_DIR", os.path.join(tempfile.gettempdir(), "quiz_question_stats")
+)
+QUESTION_STATS_FSYNC = os.getenv("QUESTION_STATS_FSYNC", "false").lower() == "true"
+
+# Observed difficulty: labelled difficulty until enough answers, then by share of correct answers
+QUESTION_CALIBRATION_MIN_ANSWERS = int(os.getenv("QUESTION_CALIBRATION_MIN_ANSWERS", "20"))
+QUESTION_EASY_ACCURACY = float(os.getenv("QUESTION_EASY_ACCURACY", "0.8"))
+QUESTION_HARD_ACCURACY = float(os.getenv("QUESTION_HARD_ACCURACY", "0.5"))
+
+MARKER_RETENTION_DAYS = 7
+
+
+@dataclass
+class QuestionDelta:
+    """Answers to one question since the last flush"""
+    asked: int = 0
+    correct: int = 0
+    timed: int = 0
+    mean_time: float = 0.0
+
+    def add(self, is_correct: bool, seconds: Optional[float]):
+        self.asked += 1
+        self.correct += 1 if is_correct else 0
+        if seconds and seconds > 0:
+            # Welford: running mean without keeping the samples
+            self.timed += 1
+            self.mean_time += (seconds - self.mean_time) / self.timed
+
+
+def effective_difficulty(question=models.Question):
+    """SQL expression: the observed difficulty once a question has enough answers, else its label"""
+    asked = func.coalesce(question.times_asked, 0)
+    accuracy = func.coalesce(question.times_correct, 0) * 1.0 / case((asked > 0, asked), else_=1)
+    return case(
+        (asked < QUESTION_CALIBRATION_MIN_ANSWERS, func.coalesce(question.difficulty_level, "medium")),
+        (accuracy >= QUESTION_EASY_ACCURACY, "easy"),
+        (accuracy < QUESTION_HARD_ACCURACY, "hard"),
+        else_="medium"
+    )
+
+
+def _aggregate(batches: Iterable[dict]) -> Dict[str, Dict[int, QuestionDelta]]:
+    """Journal batches ({"t": tenant_id, "a": [[question_id, correct, seconds], ...]}) summed per tenant"""
+    tenants: Dict[str, Dict[int, QuestionDelta]] = defaultdict(lambda: defaultdict(QuestionDelta))
+    for batch in batches:
+        deltas = tenants[batch["t"]]
+        for question_id, is_correct, seconds in batch["a"]:
+            deltas[question_id].add(bool(is_correct), seconds)
+    return tenants
+
+
+def _read_segment(path: str) -> List[dict]:
+    batches = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                batches.append(json.loads(line))
+            except ValueError:
+                continue  # torn last line from a crash mid-write; its submit never got a response
+    return batches
+
+
+def apply_deltas(db: Session, flush_id: str, tenant_id: str, deltas: Dict[int, QuestionDelta]) -> bool:
+    """Add one tenant's deltas in a single transaction; False if this flush was applied before"""
+    table = models.Question.__table__
+    samples = func.coalesce(table.c.answer_time_samples, 0)
+    new_samples = samples + bindparam("b_timed")
+    try:
+        # Marker first: a concurrent or repeated apply of the same segment fails here, before any UPDATE
+        db.execute(insert(models.QuestionStatsFlush).values(
+            flush_id=flush_id, tenant_id=tenant_id, applied_at=datetime.utcnow()
+        ))
+        db.connection().execute(update(table).where(table.c.id == bindparam("b_id")).values(
+            times_asked=func.coalesce(table.c.times_asked, 0) + bindparam("b_asked"),
+            times_correct=func.coalesce(table.c.times_correct, 0) + bindparam("b_correct"),
+            # Combine the stored mean and the batch mean, weighted by their sample counts
+            average_time_to_answer=case(
+                (new_samples > 0, (
+                    func.coalesce(table.c.average_time_to_answer, 0.0) * samples
+                    + bindparam("b_mean") * bindparam("b_timed")
+                ) / new_samples),
+                else_=table.c.average_time_to_answer
+            ),
+            answer_time_samples=new_samples,
+        ), [
+            # Fixed row order, so concurrent flushers lock questions in the same sequence
+            {"b_id": question_id, "b_asked": delta.asked, "b_correct": delta.correct,
+             "b_timed": delta.timed, "b_mean": delta.mean_time}
+            for question_id, delta in sorted(deltas.items())
+        ])
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _open_session(tenant_id: str):
+    from database import tenant_router
+
+    return tenant_router.session(tenant_router.shard_for(tenant_id))
+
+
+class QuestionStatsAggregator:
+    """Per-process accumulator of per-question deltas with a write-ahead journal"""
+
+    def __init__(self, journal_dir: str, max_answers: int, fsync: bool = False):
+        self.journal_dir = journal_dir
+        self.max_answers = max_answers
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._unjournaled: List[dict] = []  # batches only held in memory (journal off or failing)
+        self._pending_answers = 0
+        self._journal_fd: Optional[int] = None
+        self._recovered = False  # journals a previous run with this pid left behind were picked up
+        self.last_flush_at: Optional[float] = None
+        self.flushes = 0
+        self.flushed_answers = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def _active_path(self) -> str:
+        return os.path.join(self.journal_dir, f"active-{os.getpid()}.jsonl")
+
+    def record(self, tenant_id: str, question_rows: List[dict]):
+        """Queue the answered questions of one submission (user_question_history rows)
+
+        Blocks on journal I/O (and on a flush rotating the journal); call it from a
+        worker thread, e.g. through asyncio.to_thread, never on the event loop.
+        """
+        if not question_rows:
+            return
+        batch = {"t": tenant_id, "a": [
+            [row["question_id"], 1 if row["is_correct"] else 0, row.get("time_taken_seconds") or 0]
+            for row in question_rows
+        ]}
+        with self._lock:
+            self._pending_answers += len(batch["a"])
+            if self.journal_dir:
+                try:
+                    self._append(batch)
+                    return
+                except OSError as e:
+                    # Keep it in memory; only crash safety is lost
+                    self.errors += 1
+                    self.last_error = f"journal: {e}"
+            self._unjournaled.append(batch)
+
+    @property
+    def due(self) -> bool:
+        return self._pending_answers >= self.max_answers
+
+    def _append(self, batch: dict):
+        if self._journal_fd is None:
+            if not self._recovered:
+                self._recover_orphans()
+            self._journal_fd = os.open(self._active_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        os.write(self._journal_fd, (json.dumps(batch, separators=(",", ":")) + "\n").encode())
+        if self.fsync:
+            os.fsync(self._journal_fd)
+
+    def _recover_orphans(self):
+        """Turn journals of processes that are gone into segments; runs on every flush, since workers
+        die while this one keeps running. This pid's own journals are only orphans on the first scan
+        (a previous run with the same pid); after that they belong to this process."""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(self.journal_dir, "*-*.jsonl")):
+            kind, _, rest = os.path.basename(path)[:-len(".jsonl")].partition("-")
+            if kind not in ("active", "applying"):
+                continue
+            flush_id, _, pid = rest.rpartition("-")
+            if int(pid) == os.getpid():
+                if self._recovered:
+                    continue
+            elif _process_alive(int(pid)):
+                continue
+            # A segment that was being applied keeps its flush id, so its applied tenants are skipped
+            try:
+                os.replace(path, os.path.join(self.journal_dir, f"segment-{flush_id or uuid.uuid4().hex}.jsonl"))
+            except FileNotFoundError:
+                continue  # another process recovered it first
+        self._recovered = True
+
+    def _rotate(self):
+        """Close the journal and rename it into a segment; called with the lock held"""
+        if self._journal_fd is None:
+            return
+        os.close(self._journal_fd)
+        self._journal_fd = None
+        os.replace(self._active_path, os.path.join(self.journal_dir, f"segment-{uuid.uuid4().hex}.jsonl"))
+
+    def flush(self) -> int:
+        """Apply pending deltas and any journal segments left on disk; returns the answers applied"""
+        with self._flush_lock:
+            with self._lock:
+                batches, self._unjournaled, self._pending_answers = self._unjournaled, [], 0
+                if self.journal_dir:
+                    try:
+                        self._recover_orphans()
+                        self._rotate()
+                    except OSError as e:
+                        self.errors += 1
+                        self.last_error = f"journal: {e}"
+
+            applied = 0
+            try:
+                if batches:
+                    applied = self._apply_batches(uuid.uuid4().hex, batches, requeue=True)
+                if self.journal_dir and os.path.isdir(self.journal_dir):
+                    applied += self._apply_segments()
+            finally:
+                self.flushes += 1
+                self.flushed_answers += applied
+                self.last_flush_at = time.time()
+            return applied
+
+    def _apply_batches(self, flush_id: str, batches: List[dict], requeue: bool = False) -> int:
+        applied, failed = 0, []
+        for tenant_id, deltas in _aggregate(batches).items():
+            db = _open_session(tenant_id)
+            try:
+                if apply_deltas(db, flush_id, tenant_id, deltas):
+                    applied += sum(delta.asked for delta in deltas.values())
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"⚠️ Question stats flush failed for tenant {tenant_id}: {e}")
+                failed.append(tenant_id)
+            finally:
+                db.close()
+        if failed and requeue:
+            with self._lock:
+                for batch in batches:
+                    if batch["t"] in failed:
+                        self._unjournaled.append(batch)
+                        self._pending_answers += len(batch["a"])
+        if failed and not requeue:
+            raise RuntimeError(f"tenants {', '.join(failed)} not applied")
+        return applied
+
+    def _apply_segments(self) -> int:
+        applied = 0
+        for segment in sorted(glob.glob(os.path.join(self.journal_dir, "segment-*.jsonl"))):
+            flush_id = os.path.basename(segment)[len("segment-"):-len(".jsonl")]
+            claimed = os.path.join(self.journal_dir, f"applying-{flush_id}-{os.getpid()}.jsonl")
+            try:
+                os.replace(segment, claimed)  # another process got it first if this fails
+            except OSError:
+                continue
+            try:
+                applied += self._apply_batches(flush_id, _read_segment(claimed))
+            except Exception:
+                # Retried by a later flush; tenants already applied are skipped by their marker
+                os.replace(claimed, segment)
+                continue
+            os.remove(claimed)
+        if applied:
+            self._prune_markers()
+        return applied
+
+    def _prune_markers(self):
+        from database import tenant_router
+
+        cutoff = datetime.utcnow() - timedelta(days=MARKER_RETENTION_DAYS)
+        for session_factory in tenant_router.session_factories():
+            db = session_factory()
+            try:
+                db.execute(delete(models.QuestionStatsFlush).where(models.QuestionStatsFlush.applied_at < cutoff))
+                db.commit()
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_answers": self._pending_answers,
+                "flushes": self.flushes,
+                "flushed_answers": self.flushed_answers,
+                "last_flush_at": datetime.utcfromtimestamp(self.last_flush_at).isoformat() if self.last_flush_at else None,
+                "journal": self.journal_dir or None,
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but belongs to someone else
+    return True
+
+
+question_stats = QuestionStatsAggregator(QUESTION_STATS_JOURNAL_DIR, QUESTION_STATS_FLUSH_MAX_ANSWERS,
+                                         QUESTION_STATS_FSYNC)
+
+
+async def run_periodically(interval_seconds: float = QUESTION_STATS_FLUSH_INTERVAL_SECONDS):
+    """Background task for the API process: flush on the interval, or sooner once enough answers are pending"""
+    last_flush = time.monotonic()
+    while True:
+        await asyncio.sleep(min(1.0, interval_seconds))
+        if question_stats.due or time.monotonic() - last_flush >= interval_seconds:
+            try:
+                await asyncio.to_thread(question_stats.flush)
+            except Exception as e:
+                print(f"⚠️ Question stats flush failed: {e}")
+            last_flush = time.monotonic()
+
+
+def calibration_report(db: Session) -> List[dict]:
+    """Questions with enough answers whose observed difficulty differs from their label"""
+    observed = effective_difficulty()
+    rows = db.execute(select(
+        models.Question.id, models.Question.difficulty_level, observed,
+        models.Question.times_asked, models.Question.times_correct, models.Question.average_time_to_answer
+    ).where(
+        models.Question.times_asked >= QUESTION_CALIBRATION_MIN_ANSWERS,
+        func.coalesce(models.Question.difficulty_level, "medium") != observed
+    ).order_by(models.Question.id)).all()
+    return [
+        {"question_id": question_id, "labelled": labelled, "observed": level, "times_asked": asked,
+         "accuracy": round(correct / asked * 100, 1), "average_time_to_answer": round(seconds or 0.0, 1)}
+        for question_id, labelled, level, asked, correct, seconds in rows
+    ]
+
+
+def apply_calibration(db: Session) -> int:
+    """Relabel questions with their observed difficulty"""
+    observed = effective_difficulty()
+    updated = db.execute(update(models.Question).where(
+        models.Question.times_asked >= QUESTION_CALIBRATION_MIN_ANSWERS,
+        func.coalesce(models.Question.difficulty_level, "medium") != observed
+    ).values(difficulty_level=observed).execution_options(synchronize_session=False)).rowcount
+    db.commit()
+    return updated
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Per-question statistics maintenance")
+    parser.add_argument("--flush", action="store_true", help="Apply journal segments left by stopped processes")
+    parser.add_argument("--calibrate", action="store_true", help="Report questions whose difficulty label is off")
+    parser.add_argument("--apply", action="store_true", help="With --calibrate: relabel them")
+    args = parser.parse_args()
+    if not (args.flush or args.calibrate):
+        parser.print_help()
+        sys.exit(0)
+
+    if args.flush:
+        print(f"✅ Applied {question_stats.flush()} pending answers from {QUESTION_STATS_JOURNAL_DIR}")
+    if args.calibrate:
+        db = SessionLocal()
+        try:
+            report = calibration_report(db)
+            for row in report:
+                print(f"  #{row['question_id']}: labelled {row['labelled']}, plays {row['observed']} "
+                      f"({row['accuracy']}% correct over {row['times_asked']} answers, "
+                      f"{row['average_time_to_answer']}s on average)")
+            if args.apply:
+                print(f"✅ Relabelled {apply_calibration(db)} questions")
+            else:
+                print(f"📊 {len(report)} questions play at a different difficulty than labelled")
+        finally:
+            db.close()
@@ -10,6 +10,7 @@ class UserBase(BaseModel):
 
 class UserCreate(UserBase):
     password: str
+    timezone: Optional[str] = None  # IANA name, e.g. "America/New_York"
 
 class User(UserBase):
     id: int
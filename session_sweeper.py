@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Background expiry of abandoned quiz sessions
+Sessions past their end_time are flipped to "expired" with one indexed bulk
+UPDATE per database (ix_quiz_sessions_status_end_time), so the active-session
+lookup in start-quiz-session only sees live sessions. With auto-grading on,
+expired sessions that saved answers through PUT /quiz-session/{id}/answers are
+graded first, producing a normal quiz result and stats update. That includes
+sessions the API already flipped to "expired" on a status check or late
+submit: completed_at stays NULL until a session is submitted or graded, so it
+marks the ones still owed a result.
+
+The API runs the sweeper every SESSION_SWEEP_INTERVAL_SECONDS; the command
+below runs it once (or in a loop) from cron or a worker.
+
+Usage:
+    python session_sweeper.py [--auto-grade] [--loop]
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+from grading import grade_answers
+from question_stats import question_stats
+from stats_service import daily_progress_upserts, quiz_stats_upserts, record_errors
+
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))  # 0 disables
+SESSION_SWEEP_AUTO_GRADE = os.getenv("SESSION_SWEEP_AUTO_GRADE", "false").lower() == "true"
+SESSION_SWEEP_GRADE_BATCH = int(os.getenv("SESSION_SWEEP_GRADE_BATCH", "200"))
+SESSION_SWEEP_GRADE_LOOKBACK_HOURS = float(os.getenv("SESSION_SWEEP_GRADE_LOOKBACK_HOURS", "24"))
+
+
+class SweepMetrics:
+    """Counters for the sweeper runs in this process, reported by /health"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.errors = 0
+        self.expired_total = 0
+        self.graded_total = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_expired = 0
+        self.last_graded = 0
+        self.last_duration_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def record(self, expired: int, graded: int, duration_ms: float, error: Optional[str] = None):
+        with self._lock:
+            self.runs += 1
+            self.expired_total += expired
+            self.graded_total += graded
+            self.last_run_at = datetime.utcnow()
+            self.last_expired = expired
+            self.last_graded = graded
+            self.last_duration_ms = round(duration_ms, 1)
+            if error:
+                self.errors += 1
+                self.last_error = error
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "errors": self.errors,
+                "expired_total": self.expired_total,
+                "graded_total": self.graded_total,
+                "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+                "last_expired": self.last_expired,
+                "last_graded": self.last_graded,
+                "last_duration_ms": self.last_duration_ms,
+                "last_error": self.last_error,
+            }
+
+
+sweep_metrics = SweepMetrics()
+
+
+def _grade_session(db: Session, session: models.QuizSession) -> bool:
+    """Claim one expired session and grade its saved answers; False if a submit got there first"""
+    time_taken = max(0, int((session.end_time - session.start_time).total_seconds()))
+    claimed = db.execute(
+        update(models.QuizSession)
+        .where(
+            models.QuizSession.id == session.id,
+            models.QuizSession.status.in_(("active", "expired")),
+            models.QuizSession.completed_at.is_(None),
+        )
+        .values(
+            status="expired",
+            completed_at=session.end_time,
+            actual_time_taken=time_taken,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return False
+
+    quiz_row = db.execute(select(models.Quiz, models.Topic.name).outerjoin(
+        models.Topic, models.Quiz.topic_id == models.Topic.id
+    ).where(models.Quiz.id == session.quiz_id)).first()
+    questions = db.scalars(select(models.Question).where(models.Question.quiz_id == session.quiz_id)).all()
+    if not quiz_row or not questions:
+        db.commit()
+        return False
+    quiz, topic_name = quiz_row
+
+    saved = session.get_partial_answers()
+    user_answers = saved.get("user_answers", {})
+    graded = grade_answers(
+        questions, user_answers, saved.get("question_times", {}),
+        user_id=session.user_id, tenant_id=session.tenant_id, quiz_id=quiz.id, session_id=session.id,
+        topic_name=topic_name or "Unknown", answered_at=session.end_time
+    )
+
+    db.execute(insert(models.UserQuestionHistory), graded.question_history_rows)
+    db.add(models.QuizResult(
+        tenant_id=session.tenant_id,
+        quiz_id=quiz.id,
+        user_id=session.user_id,
+        score=graded.correct_answers,
+        total_questions=graded.total_questions,
+        percentage=graded.percentage,
+        grade=graded.grade,
+        time_taken=time_taken,
+        user_answers=user_answers,
+        correct_answers={str(q.id): q.correct_answer for q in questions},
+        questions_analysis=graded.question_analysis,
+        completed_at=session.end_time,
+        session_id=session.id
+    ))
+
+    timezone_name = db.scalar(select(models.User.timezone).where(models.User.id == session.user_id))
+    dialect_name = db.get_bind().dialect.name
+    for statement in quiz_stats_upserts(
+        dialect_name, session.user_id, session.tenant_id, topic_name or "Unknown",
+        graded.correct_answers, graded.total_questions, graded.percentage, time_taken, session.end_time,
+        quiz_id=quiz.id, timezone_name=timezone_name
+    ) + daily_progress_upserts(
+        dialect_name, session.user_id, session.tenant_id, session.end_time,
+        graded.correct_answers, graded.total_questions, time_taken, graded.question_history_rows
+    ):
+        db.execute(statement)
+    record_errors(db, session.user_id, session.tenant_id, graded.error_cells, session.end_time)
+
+    quiz.total_attempts += 1
+    quiz.average_score = ((quiz.average_score * (quiz.total_attempts - 1)) + graded.percentage) / quiz.total_attempts
+    db.commit()
+    question_stats.record(session.tenant_id, graded.question_history_rows)
+    return True
+
+
+def gradable_sessions(now: datetime, limit: int = SESSION_SWEEP_GRADE_BATCH):
+    """Timed-out sessions with saved answers and no result yet, whether or not the API already expired them"""
+    return select(models.QuizSession).where(
+        models.QuizSession.status.in_(("active", "expired")),
+        models.QuizSession.end_time < now,
+        models.QuizSession.end_time >= now - timedelta(hours=SESSION_SWEEP_GRADE_LOOKBACK_HOURS),
+        models.QuizSession.completed_at.is_(None),
+        models.QuizSession.partial_answers.isnot(None)
+    ).order_by(models.QuizSession.end_time).limit(limit)
+
+
+def grade_expired_sessions(db: Session, now: datetime, limit: int = SESSION_SWEEP_GRADE_BATCH) -> int:
+    """Grade up to `limit` expired sessions that saved answers, one transaction each"""
+    sessions = db.scalars(gradable_sessions(now, limit)).all()
+    graded = 0
+    for session in sessions:
+        try:
+            graded += _grade_session(db, session)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Could not auto-grade quiz session {session.id}: {e}")
+    return graded
+
+
+def expire_sessions(db: Session, now: datetime) -> int:
+    """Bulk-expire every active session whose time is up"""
+    expired = db.execute(
+        update(models.QuizSession)
+        .where(models.QuizSession.status == "active", models.QuizSession.end_time < now)
+        .values(status="expired")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return expired
+
+
+def sweep(db: Session, auto_grade: bool = SESSION_SWEEP_AUTO_GRADE, now: Optional[datetime] = None) -> dict:
+    """One sweeper pass over a database: optional auto-grading, then the bulk UPDATE"""
+    now = now or datetime.utcnow()
+    graded = grade_expired_sessions(db, now) if auto_grade else 0
+    expired = expire_sessions(db, now)
+    return {"expired": expired, "graded": graded}
+
+
+def sweep_all(auto_grade: bool = SESSION_SWEEP_AUTO_GRADE) -> dict:
+    """Sweep the default database and every tenant shard opened by this process"""
+    from database import tenant_router
+
+    started = time.perf_counter()
+    totals = {"expired": 0, "graded": 0}
+    error = None
+    for session_factory in tenant_router.session_factories():
+        db = session_factory()
+        try:
+            result = sweep(db, auto_grade)
+            totals["expired"] += result["expired"]
+            totals["graded"] += result["graded"]
+        except Exception as e:
+            db.rollback()
+            error = str(e)
+            print(f"⚠️ Session sweep failed: {e}")
+        finally:
+            db.close()
+    sweep_metrics.record(totals["expired"], totals["graded"], (time.perf_counter() - started) * 1000, error)
+    return totals
+
+
+async def run_periodically(interval_seconds: float = SESSION_SWEEP_INTERVAL_SECONDS):
+    """Background task for the API process; the sweep itself runs in a worker thread"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await asyncio.to_thread(sweep_all)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expire quiz sessions whose time is up")
+    parser.add_argument("--auto-grade", action="store_true", default=SESSION_SWEEP_AUTO_GRADE,
+                        help="Grade saved answers of expired sessions before expiring them")
+    parser.add_argument("--loop", action="store_true", help="Keep sweeping every SESSION_SWEEP_INTERVAL_SECONDS")
+    args = parser.parse_args()
+
+    while True:
+        result = sweep_all(args.auto_grade)
+        if result["graded"]:
+            question_stats.flush()
+        print(f"🧹 Expired {result['expired']} quiz sessions, auto-graded {result['graded']}")
+        if not args.loop:
+            break
+        time.sleep(SESSION_SWEEP_INTERVAL_SECONDS or 60)
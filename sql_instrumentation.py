@@ -0,0 +1,284 @@
+"""
+Per-request SQL statement counting and profiling
+A before_cursor_execute hook on every Engine (sync and async) bumps the counter
+of the request or block currently being measured, so N+1 regressions show up
+as a growing X-SQL-Statements header or a failed assert_max_statements().
+
+With SQL_PROFILING on, the matching after_cursor_execute hook times a sample
+of statements (SQL_PROFILE_SAMPLE_RATE) and folds them into a process-wide
+table keyed by statement fingerprint (literals and IN lists collapsed), served
+by GET /admin/perf/sql. Statements slower than SQL_EXPLAIN_THRESHOLD_MS get
+their plan captured once per fingerprint. Profiling is off by default so the
+hot path only pays for the counter.
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Adds the X-SQL-Statements response header (defaults on when DEBUG=true)
+SQL_DEBUG_HEADERS = os.getenv("SQL_DEBUG_HEADERS", os.getenv("DEBUG", "false")).lower() == "true"
+SQL_STATEMENTS_HEADER = "X-SQL-Statements"
+SQL_TIME_HEADER = "X-SQL-Time-Ms"
+
+SQL_PROFILING = os.getenv("SQL_PROFILING", "false").lower() == "true"
+# Share of statements timed and recorded while profiling (1 = all); calls in the profile are sampled counts
+SQL_PROFILE_SAMPLE_RATE = min(1.0, max(0.0, float(os.getenv("SQL_PROFILE_SAMPLE_RATE", "1"))))
+SQL_PROFILE_TOP_N = int(os.getenv("SQL_PROFILE_TOP_N", "20"))
+SQL_PROFILE_MAX_FINGERPRINTS = int(os.getenv("SQL_PROFILE_MAX_FINGERPRINTS", "1000"))
+# EXPLAIN statements slower than this (milliseconds); unset or 0 disables plan capture
+SQL_EXPLAIN_THRESHOLD_MS = float(os.getenv("SQL_EXPLAIN_THRESHOLD_MS", "0"))
+
+
+class StatementCounter:
+    """Mutable counter shared by the request task and the threads/greenlets it spawns"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.total_ms = 0.0
+
+    def record(self, statement: str):
+        self.count += 1
+        self.statements.append(statement)
+
+
+_current_counter: ContextVar[Optional[StatementCounter]] = ContextVar("sql_statement_counter", default=None)
+_current_route: ContextVar[Optional[str]] = ContextVar("sql_profile_route", default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?\b")
+_PATH_ID = re.compile(r"/\d+(?=/|$)")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+))+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so executions that differ only in literals or IN-list length group together"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class QueryStats:
+    __slots__ = ("fingerprint", "calls", "total_ms", "max_ms", "rows", "last_seen", "routes", "plan", "plan_ms")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.last_seen: Optional[datetime] = None
+        self.routes: Dict[str, int] = {}
+        self.plan: Optional[str] = None
+        self.plan_ms = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "total_ms": round(self.total_ms, 2),
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "rows": self.rows,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "routes": dict(sorted(self.routes.items(), key=lambda item: -item[1])[:5]),
+            "explain": self.plan,
+            "explain_for_ms": round(self.plan_ms, 2) if self.plan else None,
+        }
+
+
+class QueryProfile:
+    """Process-wide per-fingerprint statement timings, bounded to max_fingerprints entries"""
+
+    def __init__(self, max_fingerprints: int = SQL_PROFILE_MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self.started_at = datetime.utcnow()
+        self._stats: Dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration_ms: float, rows: int, route: Optional[str]) -> QueryStats:
+        key = fingerprint(statement)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    # Forget the cheapest fingerprint to stay bounded
+                    cheapest = min(self._stats.values(), key=lambda s: s.total_ms)
+                    del self._stats[cheapest.fingerprint]
+                stats = self._stats[key] = QueryStats(key)
+            stats.calls += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            if rows > 0:
+                stats.rows += rows
+            stats.last_seen = datetime.utcnow()
+            if route:
+                stats.routes[route] = stats.routes.get(route, 0) + 1
+        return stats
+
+    def top(self, limit: int = SQL_PROFILE_TOP_N, order_by: str = "total_ms") -> List[dict]:
+        with self._lock:
+            ranked = sorted(self._stats.values(), key=lambda s: getattr(s, order_by), reverse=True)[:limit]
+            return [stats.as_dict() for stats in ranked]
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "since": self.started_at.isoformat(),
+                "fingerprints": len(self._stats),
+                "statements": sum(s.calls for s in self._stats.values()),
+                "total_ms": round(sum(s.total_ms for s in self._stats.values()), 2),
+                "enabled": SQL_PROFILING,
+                "sample_rate": SQL_PROFILE_SAMPLE_RATE,
+                "explain_threshold_ms": SQL_EXPLAIN_THRESHOLD_MS or None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = datetime.utcnow()
+
+
+query_profile = QueryProfile()
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """Plan for a just-run SELECT, on a separate cursor of the same connection (no ANALYZE: nothing re-runs)
+
+    On Postgres a failed statement aborts the whole transaction, so the EXPLAIN
+    runs under a savepoint that is rolled back if it fails and the request's
+    own transaction carries on.
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    elif dialect == "postgresql":
+        prefix = "EXPLAIN "
+    else:
+        return None
+    savepoint = dialect == "postgresql"
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT sql_profile_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+            raise
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT sql_profile_explain")
+    finally:
+        cursor.close()
+    if dialect == "sqlite":
+        return "\n".join(str(row[-1]) for row in rows)
+    return "\n".join(str(row[0]) for row in rows)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.record(statement)
+    if context is None:
+        return
+    # Time the statement when it is sampled for the profile or a debug header reports request SQL time
+    profiled = SQL_PROFILING and (SQL_PROFILE_SAMPLE_RATE >= 1 or random.random() < SQL_PROFILE_SAMPLE_RATE)
+    if profiled or (SQL_DEBUG_HEADERS and counter is not None):
+        conn.info.setdefault("_query_started", []).append(time.perf_counter())
+        context._sql_timed = True
+        context._sql_profiled = profiled
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_failed_statement(exception_context):
+    # A failing statement never reaches after_cursor_execute; drop its start time
+    context = exception_context.execution_context
+    if getattr(context, "_sql_timed", False) and exception_context.connection is not None:
+        context._sql_timed = False
+        started = exception_context.connection.info.get("_query_started")
+        if started:
+            started.pop()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _profile_statement(conn, cursor, statement, parameters, context, executemany):
+    if not getattr(context, "_sql_timed", False):
+        return
+    context._sql_timed = False
+    started = conn.info.get("_query_started")
+    if not started:
+        return
+    duration_ms = (time.perf_counter() - started.pop()) * 1000
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.total_ms += duration_ms
+    if not context._sql_profiled:
+        return
+    # Driver-reported rows: affected rows for DML, fetched rows for Postgres SELECTs (SQLite reports -1)
+    rows = cursor.rowcount if cursor.rowcount is not None else -1
+    stats = query_profile.record(statement, duration_ms, rows, _current_route.get())
+
+    if (
+        SQL_EXPLAIN_THRESHOLD_MS
+        and duration_ms >= SQL_EXPLAIN_THRESHOLD_MS
+        and not executemany
+        and stats.plan is None
+        and statement.lstrip()[:6].upper() in ("SELECT", "WITH")
+    ):
+        try:
+            stats.plan = _explain(conn, statement, parameters)
+            stats.plan_ms = duration_ms
+        except Exception as e:
+            stats.plan = f"EXPLAIN failed: {e}"
+
+
+@contextmanager
+def count_statements() -> Iterator[StatementCounter]:
+    """Count the SQL statements executed inside the block (and by work it awaits)"""
+    counter = StatementCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+@contextmanager
+def assert_max_statements(limit: int) -> Iterator[StatementCounter]:
+    """Fail when the block runs more than `limit` SQL statements"""
+    with count_statements() as counter:
+        yield counter
+    if counter.count > limit:
+        listing = "\n".join(f"  {i + 1}. {s.splitlines()[0][:120]}" for i, s in enumerate(counter.statements))
+        raise AssertionError(f"Expected at most {limit} SQL statements, got {counter.count}:\n{listing}")
+
+
+async def count_request_statements(request, call_next):
+    """HTTP middleware: count and time each request's statements and report them in debug headers"""
+    route_token = _current_route.set(f"{request.method} {_PATH_ID.sub('/{id}', request.url.path)}")
+    try:
+        with count_statements() as counter:
+            response = await call_next(request)
+    finally:
+        _current_route.reset(route_token)
+    if SQL_DEBUG_HEADERS:
+        response.headers[SQL_STATEMENTS_HEADER] = str(counter.count)
+        response.headers[SQL_TIME_HEADER] = f"{counter.total_ms:.2f}"
+    return response
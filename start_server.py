@@ -16,6 +16,10 @@ def main():
     print("🛑 Press Ctrl+C to stop the server")
     print()
     
+    # Tables and indexes are no longer created when main is imported
+    from migrations import upgrade
+    upgrade()
+    
     # Start server without reload to avoid file watching issues
     uvicorn.run(
         "main:app",
@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained per-user stats
+user_stats (per user and tenant), user_topic_stats (per user, tenant and topic)
+and the daily rollups in progress_tracking / daily_topic_progress are bumped
+with upserts inside the submit-quiz transaction, so the analytics endpoints read
+a handful of rows instead of scanning every result. The tenant-wide
+tenant_topic_stats and the per-quiz best attempts in quiz_leaderboard are
+maintained the same way. Study streaks are kept on user_stats as the last
+active day (in the user's time zone) plus the current and longest run, and
+advanced in the same upsert. Answered and wrong questions per (category,
+difficulty) live in one user_error_matrix row per user, folded in by the same
+transaction, so weak areas come from a single small read. The rebuild commands
+recompute them from the hot and archived tables.
+
+Usage:
+    python stats_service.py --rebuild          # user_stats, user_topic_stats, tenant_topic_stats, quiz_leaderboard
+    python stats_service.py --rebuild-daily    # progress_tracking, daily_topic_progress
+    python stats_service.py --rebuild-streaks  # streak columns of user_stats and progress_tracking
+    python stats_service.py --rebuild-errors   # user_error_matrix
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import and_, bindparam, case, delete, func, insert, literal_column, or_, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+
+# Day boundary for users without a time zone of their own (IANA name, e.g. "Europe/Berlin")
+STREAK_TIMEZONE = os.getenv("STREAK_TIMEZONE", "UTC")
+# Error-matrix cells with fewer answers than this rank behind the others as weak areas
+WEAK_AREA_MIN_ANSWERS = int(os.getenv("WEAK_AREA_MIN_ANSWERS", "3"))
+
+_COUNTERS = {
+    models.UserStats: ["total_quizzes_taken", "total_questions_answered", "total_correct_answers", "total_time_seconds"],
+    models.UserTopicStats: ["total_quizzes", "total_questions", "correct_answers", "total_time_seconds"],
+    models.TenantTopicStats: ["total_quizzes", "total_questions", "correct_answers", "total_time_seconds"],
+    models.ProgressTracking: ["quizzes_taken", "questions_answered", "correct_answers", "study_time", "total_time_seconds"],
+    models.DailyTopicProgress: ["questions_answered", "correct_answers", "time_seconds"],
+}
+_KEYS = {
+    models.UserStats: ["user_id", "tenant_id"],
+    models.UserTopicStats: ["user_id", "tenant_id", "topic_name"],
+    models.TenantTopicStats: ["tenant_id", "topic_name"],
+    models.ProgressTracking: ["user_id", "tenant_id", "day"],
+    models.DailyTopicProgress: ["user_id", "tenant_id", "day", "topic_name", "difficulty_level"],
+}
+
+
+def valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def local_day(moment: datetime, timezone_name: Optional[str] = None) -> date:
+    """Calendar day of a naive UTC timestamp in the given (or the default) time zone"""
+    name = timezone_name or STREAK_TIMEZONE
+    zone = ZoneInfo(name if valid_timezone(name) else "UTC")
+    return moment.replace(tzinfo=timezone.utc).astimezone(zone).date()
+
+
+def _next_day(dialect_name: str, column):
+    if dialect_name == "postgresql":
+        return column + literal_column("1")
+    return func.date(column, "+1 day")
+
+
+def _streak_updates(dialect_name: str, table, excluded) -> dict:
+    """Advance the streak by the inserted active day: same day keeps it, the next day extends it,
+    a later day restarts it and an earlier day (a late auto-grade) leaves it alone"""
+    last = table.c.last_active_day
+    day = excluded.last_active_day
+    current = func.coalesce(table.c.current_streak, 0)
+    streak = case(
+        (last.is_(None), 1),
+        (day == last, current),
+        (day == _next_day(dialect_name, last), current + 1),
+        (day > last, 1),
+        else_=current
+    )
+    longest = func.coalesce(table.c.longest_streak, 0)
+    return {
+        "current_streak": streak,
+        "longest_streak": case((streak > longest, streak), else_=longest),
+        "last_active_day": case((last.is_(None), day), (day > last, day), else_=last),
+    }
+
+
+def _upsert(dialect_name: str, model, row: dict):
+    """INSERT the row, or add its counters to the existing one (ON CONFLICT DO UPDATE)"""
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(model).values(**row)
+    table = model.__table__
+    excluded = stmt.excluded
+    updates = {name: table.c[name] + excluded[name] for name in _COUNTERS[model]}
+    if "best_score" in table.c:
+        updates["best_score"] = case(
+            (excluded.best_score > table.c.best_score, excluded.best_score),
+            else_=table.c.best_score
+        )
+    if "last_quiz_date" in table.c:
+        updates["last_quiz_date"] = case(
+            (table.c.last_quiz_date.is_(None), excluded.last_quiz_date),
+            (excluded.last_quiz_date > table.c.last_quiz_date, excluded.last_quiz_date),
+            else_=table.c.last_quiz_date
+        )
+    if "updated_at" in table.c:
+        updates["updated_at"] = excluded.updated_at
+    if "analytics_version" in row:
+        updates["analytics_version"] = func.coalesce(table.c.analytics_version, 0) + 1
+    if model is models.UserStats and "last_active_day" in row:
+        updates.update(_streak_updates(dialect_name, table, excluded))
+    if model is models.ProgressTracking and "current_streak" in row:
+        updates["current_streak"] = excluded.current_streak
+        updates["longest_streak"] = excluded.longest_streak
+    if model is models.ProgressTracking:
+        questions = table.c.questions_answered + excluded.questions_answered
+        updates["average_score"] = case(
+            (questions > 0, (table.c.correct_answers + excluded.correct_answers) * 100.0 / questions),
+            else_=0.0
+        )
+    return stmt.on_conflict_do_update(index_elements=_KEYS[model], set_=updates)
+
+
+def _leaderboard_upsert(dialect_name: str, row: dict):
+    """INSERT the attempt, or count it and keep whichever attempt ranks higher (score, then time)"""
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(models.QuizLeaderboardEntry).values(**row)
+    table = models.QuizLeaderboardEntry.__table__
+    excluded = stmt.excluded
+    better = or_(
+        excluded.best_score > table.c.best_score,
+        and_(excluded.best_score == table.c.best_score, excluded.best_time_seconds < table.c.best_time_seconds)
+    )
+    updates = {
+        name: case((better, excluded[name]), else_=table.c[name])
+        for name in ("best_score", "best_correct", "best_time_seconds", "achieved_at")
+    }
+    updates["attempts"] = table.c.attempts + 1
+    updates["last_attempt_at"] = case(
+        (table.c.last_attempt_at.is_(None), excluded.last_attempt_at),
+        (excluded.last_attempt_at > table.c.last_attempt_at, excluded.last_attempt_at),
+        else_=table.c.last_attempt_at
+    )
+    updates["updated_at"] = excluded.updated_at
+    return stmt.on_conflict_do_update(index_elements=["tenant_id", "quiz_id", "user_id"], set_=updates)
+
+
+def quiz_stats_upserts(dialect_name: str, user_id: int, tenant_id: str, topic_name: str,
+                       score: int, total_questions: int, percentage: float, time_taken: int,
+                       completed_at: datetime, quiz_id: Optional[int] = None,
+                       timezone_name: Optional[str] = None) -> List:
+    """Statements that add one quiz result to the per-user, per-tenant and leaderboard aggregates"""
+    now = datetime.utcnow()
+    statements = [
+        _upsert(dialect_name, models.UserStats, {
+            "user_id": user_id, "tenant_id": tenant_id,
+            "total_quizzes_taken": 1, "total_questions_answered": total_questions,
+            "total_correct_answers": score, "total_time_seconds": time_taken or 0,
+            "best_score": percentage, "last_quiz_date": completed_at, "updated_at": now,
+            "last_active_day": local_day(completed_at, timezone_name), "current_streak": 1, "longest_streak": 1,
+            "analytics_version": 1,
+        }),
+        _upsert(dialect_name, models.UserTopicStats, {
+            "user_id": user_id, "tenant_id": tenant_id, "topic_name": topic_name,
+            "total_quizzes": 1, "total_questions": total_questions,
+            "correct_answers": score, "total_time_seconds": time_taken or 0,
+            "best_score": percentage, "last_quiz_date": completed_at, "updated_at": now,
+        }),
+        _upsert(dialect_name, models.TenantTopicStats, {
+            "tenant_id": tenant_id, "topic_name": topic_name,
+            "total_quizzes": 1, "total_questions": total_questions,
+            "correct_answers": score, "total_time_seconds": time_taken or 0,
+            "best_score": percentage, "last_quiz_date": completed_at, "updated_at": now,
+        }),
+    ]
+    if quiz_id is not None:
+        statements.append(_leaderboard_upsert(dialect_name, {
+            "tenant_id": tenant_id, "quiz_id": quiz_id, "user_id": user_id, "attempts": 1,
+            "best_score": percentage, "best_correct": score, "best_time_seconds": time_taken or 0,
+            "achieved_at": completed_at, "last_attempt_at": completed_at, "updated_at": now,
+        }))
+    return statements
+
+
+def daily_progress_upserts(dialect_name: str, user_id: int, tenant_id: str, completed_at: datetime,
+                           score: int, total_questions: int, time_taken: int,
+                           question_rows: List[dict]) -> List:
+    """Statements that add one quiz result to the day's progress_tracking and daily_topic_progress rows"""
+    day = completed_at.date()
+    user_stats = (models.UserStats.user_id == user_id, models.UserStats.tenant_id == tenant_id)
+    statements = [
+        _upsert(dialect_name, models.ProgressTracking, {
+            "user_id": user_id, "tenant_id": tenant_id, "day": day, "date": completed_at,
+            "quizzes_taken": 1, "questions_answered": total_questions, "correct_answers": score,
+            "study_time": (time_taken or 0) // 60, "total_time_seconds": time_taken or 0,
+            "average_score": score / total_questions * 100 if total_questions else 0.0,
+            # Streak as of this submit; quiz_stats_upserts has already advanced it
+            "current_streak": select(models.UserStats.current_streak).where(*user_stats).scalar_subquery(),
+            "longest_streak": select(models.UserStats.longest_streak).where(*user_stats).scalar_subquery(),
+        })
+    ]
+
+    groups: Dict[tuple, dict] = {}
+    for row in question_rows:
+        key = (row["topic_name"] or "Unknown", row["difficulty_level"] or "medium")
+        group = groups.setdefault(key, {"questions_answered": 0, "correct_answers": 0, "time_seconds": 0})
+        group["questions_answered"] += 1
+        group["correct_answers"] += 1 if row["is_correct"] else 0
+        group["time_seconds"] += row["time_taken_seconds"] or 0
+    for (topic_name, difficulty), totals in groups.items():
+        statements.append(_upsert(dialect_name, models.DailyTopicProgress, {
+            "user_id": user_id, "tenant_id": tenant_id, "day": day,
+            "topic_name": topic_name, "difficulty_level": difficulty, **totals,
+        }))
+    return statements
+
+
+def average_score(stats) -> float:
+    """Share of correct answers across all quizzes, in percent"""
+    if stats is None or not stats.total_questions_answered:
+        return 0.0
+    return stats.total_correct_answers / stats.total_questions_answered * 100
+
+
+def streak_summary(stats, today: date) -> Dict[str, object]:
+    """Streaks from a user_stats row; the current streak is broken once a whole day was missed"""
+    if stats is None or stats.last_active_day is None:
+        return {"current_streak": 0, "longest_streak": 0, "last_active_day": None}
+    ongoing = (today - stats.last_active_day).days <= 1
+    return {
+        "current_streak": (stats.current_streak or 0) if ongoing else 0,
+        "longest_streak": stats.longest_streak or 0,
+        "last_active_day": stats.last_active_day.isoformat(),
+    }
+
+
+def merge_error_cells(cells: Optional[dict], deltas: dict) -> dict:
+    """Add one quiz's {category: {difficulty: [answered, incorrect]}} to a stored matrix (returns a new dict)"""
+    merged = {
+        category: {difficulty: list(cell) for difficulty, cell in by_difficulty.items()}
+        for category, by_difficulty in (cells or {}).items()
+    }
+    for category, by_difficulty in deltas.items():
+        for difficulty, (answered, incorrect) in by_difficulty.items():
+            cell = merged.setdefault(category, {}).setdefault(difficulty, [0, 0])
+            cell[0] += answered
+            cell[1] += incorrect
+    return merged
+
+
+def _error_totals(cells: dict) -> Tuple[int, int]:
+    answered = sum(cell[0] for by_difficulty in cells.values() for cell in by_difficulty.values())
+    incorrect = sum(cell[1] for by_difficulty in cells.values() for cell in by_difficulty.values())
+    return answered, incorrect
+
+
+def _error_matrix_query(user_id: int, tenant_id: str):
+    # FOR UPDATE serializes concurrent submits of one user on Postgres; SQLite already holds the write lock
+    return select(models.UserErrorMatrix).where(
+        models.UserErrorMatrix.user_id == user_id,
+        models.UserErrorMatrix.tenant_id == tenant_id
+    ).with_for_update()
+
+
+def _error_matrix_insert(dialect_name: str, user_id: int, tenant_id: str, cells: dict, now: datetime):
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    answered, incorrect = _error_totals(cells)
+    return dialect_insert(models.UserErrorMatrix).values(
+        user_id=user_id, tenant_id=tenant_id, cells=cells,
+        total_answered=answered, total_incorrect=incorrect, updated_at=now
+    ).on_conflict_do_nothing(index_elements=["user_id", "tenant_id"])
+
+
+def _fold_error_cells(matrix: models.UserErrorMatrix, cells: dict, now: datetime):
+    merged = merge_error_cells(matrix.get_cells(), cells)
+    matrix.cells = merged
+    matrix.total_answered, matrix.total_incorrect = _error_totals(merged)
+    matrix.updated_at = now
+
+
+def record_errors(db: Session, user_id: int, tenant_id: str, cells: dict, now: datetime):
+    """Fold a graded quiz's error cells into the user's matrix row (the caller commits)"""
+    if not cells:
+        return
+    matrix = db.scalars(_error_matrix_query(user_id, tenant_id)).first()
+    if matrix is None:
+        if db.execute(_error_matrix_insert(db.get_bind().dialect.name, user_id, tenant_id, cells, now)).rowcount:
+            return
+        # A concurrent submit created the row first
+        matrix = db.scalars(_error_matrix_query(user_id, tenant_id)).one()
+    _fold_error_cells(matrix, cells, now)
+
+
+async def record_errors_async(db: AsyncSession, user_id: int, tenant_id: str, cells: dict, now: datetime):
+    """record_errors for the async request sessions"""
+    if not cells:
+        return
+    matrix = (await db.scalars(_error_matrix_query(user_id, tenant_id))).first()
+    if matrix is None:
+        statement = _error_matrix_insert(db.get_bind().dialect.name, user_id, tenant_id, cells, now)
+        if (await db.execute(statement)).rowcount:
+            return
+        matrix = (await db.scalars(_error_matrix_query(user_id, tenant_id))).one()
+    _fold_error_cells(matrix, cells, now)
+
+
+def weak_areas(cells: dict, limit: int = 5) -> List[Dict[str, object]]:
+    """(category, difficulty) cells the user answers wrong most often, highest error rate first
+
+    Ties go to the cell with more wrong answers; cells answered fewer than
+    WEAK_AREA_MIN_ANSWERS times rank behind the rest.
+    """
+    areas = []
+    for category, by_difficulty in cells.items():
+        for difficulty, (answered, incorrect) in by_difficulty.items():
+            if not incorrect:
+                continue
+            areas.append({
+                "category": category,
+                "difficulty": difficulty,
+                "incorrect_count": incorrect,
+                "answered": answered,
+                "error_rate": round(incorrect / answered * 100, 2),
+                "recommendation": f"Focus on {category} questions at {difficulty} level",
+            })
+    areas.sort(key=lambda area: (
+        area["answered"] >= WEAK_AREA_MIN_ANSWERS, area["error_rate"], area["incorrect_count"]
+    ), reverse=True)
+    return areas[:limit]
+
+
+def _result_totals(db: Session, result_model):
+    topic = func.coalesce(models.Topic.name, "Unknown")
+    return db.execute(select(
+        result_model.user_id, result_model.tenant_id, topic,
+        func.count(result_model.id),
+        func.sum(func.coalesce(result_model.total_questions, 0)),
+        func.sum(func.coalesce(result_model.score, 0)),
+        func.sum(func.coalesce(result_model.time_taken, 0)),
+        func.max(result_model.percentage),
+        func.max(result_model.completed_at)
+    ).select_from(result_model).outerjoin(models.Quiz, result_model.quiz_id == models.Quiz.id).outerjoin(
+        models.Topic, models.Quiz.topic_id == models.Topic.id
+    ).group_by(result_model.user_id, result_model.tenant_id, topic)).all()
+
+
+def _leaderboard_rows(db: Session, now: datetime) -> List[dict]:
+    """Best attempt (highest score, then fastest) and attempt count per tenant, quiz and user"""
+    entries: Dict[tuple, dict] = {}
+    for result_model in (models.QuizResult, models.QuizResultArchive):
+        rows = db.execute(select(
+            result_model.tenant_id, result_model.quiz_id, result_model.user_id,
+            result_model.percentage, result_model.score, result_model.time_taken, result_model.completed_at
+        ).where(result_model.quiz_id.isnot(None)).execution_options(yield_per=5000))
+        for tenant_id, quiz_id, user_id, percentage, score, seconds, completed_at in rows:
+            percentage, seconds = percentage or 0.0, seconds or 0
+            entry = entries.get((tenant_id, quiz_id, user_id))
+            if entry is None:
+                entries[(tenant_id, quiz_id, user_id)] = {
+                    "tenant_id": tenant_id, "quiz_id": quiz_id, "user_id": user_id, "attempts": 1,
+                    "best_score": percentage, "best_correct": score or 0, "best_time_seconds": seconds,
+                    "achieved_at": completed_at, "last_attempt_at": completed_at, "updated_at": now,
+                }
+                continue
+            entry["attempts"] += 1
+            if completed_at and (entry["last_attempt_at"] is None or completed_at > entry["last_attempt_at"]):
+                entry["last_attempt_at"] = completed_at
+            if (percentage, -seconds) > (entry["best_score"], -entry["best_time_seconds"]):
+                entry.update(best_score=percentage, best_correct=score or 0,
+                             best_time_seconds=seconds, achieved_at=completed_at)
+    return list(entries.values())
+
+
+def rebuild_stats(db: Session) -> Dict[str, int]:
+    """Recompute the per-user, per-tenant and leaderboard aggregates from hot and archived quiz results
+
+    The user_stats rows are recreated without streaks; rebuild_streaks fills those in.
+    """
+    now = datetime.utcnow()
+    users: Dict[tuple, dict] = {}
+    topics: Dict[tuple, dict] = {}
+    tenant_topics: Dict[tuple, dict] = {}
+
+    def add(bucket: dict, counters: List[str], values, best, last):
+        for name, value in zip(counters, values):
+            bucket[name] += value or 0
+        bucket["best_score"] = max(bucket["best_score"], best or 0.0)
+        if last and (bucket["last_quiz_date"] is None or last > bucket["last_quiz_date"]):
+            bucket["last_quiz_date"] = last
+
+    for result_model in (models.QuizResult, models.QuizResultArchive):
+        for user_id, tenant_id, topic_name, quizzes, questions, correct, seconds, best, last in _result_totals(db, result_model):
+            user = users.setdefault((user_id, tenant_id), {
+                "user_id": user_id, "tenant_id": tenant_id,
+                "total_quizzes_taken": 0, "total_questions_answered": 0, "total_correct_answers": 0,
+                "total_time_seconds": 0, "best_score": 0.0, "last_quiz_date": None, "updated_at": now,
+            })
+            add(user, _COUNTERS[models.UserStats], (quizzes, questions, correct, seconds), best, last)
+
+            topic = topics.setdefault((user_id, tenant_id, topic_name), {
+                "user_id": user_id, "tenant_id": tenant_id, "topic_name": topic_name,
+                "total_quizzes": 0, "total_questions": 0, "correct_answers": 0,
+                "total_time_seconds": 0, "best_score": 0.0, "last_quiz_date": None, "updated_at": now,
+            })
+            add(topic, _COUNTERS[models.UserTopicStats], (quizzes, questions, correct, seconds), best, last)
+
+            tenant_topic = tenant_topics.setdefault((tenant_id, topic_name), {
+                "tenant_id": tenant_id, "topic_name": topic_name,
+                "total_quizzes": 0, "total_questions": 0, "correct_answers": 0,
+                "total_time_seconds": 0, "best_score": 0.0, "last_quiz_date": None, "updated_at": now,
+            })
+            add(tenant_topic, _COUNTERS[models.TenantTopicStats], (quizzes, questions, correct, seconds), best, last)
+
+    leaderboard = _leaderboard_rows(db, now)
+
+    try:
+        db.execute(delete(models.UserTopicStats))
+        db.execute(delete(models.UserStats))
+        db.execute(delete(models.TenantTopicStats))
+        db.execute(delete(models.QuizLeaderboardEntry))
+        if users:
+            db.execute(insert(models.UserStats), list(users.values()))
+        if topics:
+            db.execute(insert(models.UserTopicStats), list(topics.values()))
+        if tenant_topics:
+            db.execute(insert(models.TenantTopicStats), list(tenant_topics.values()))
+        if leaderboard:
+            db.execute(insert(models.QuizLeaderboardEntry), leaderboard)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {
+        "user_stats": len(users), "user_topic_stats": len(topics),
+        "tenant_topic_stats": len(tenant_topics), "quiz_leaderboard": len(leaderboard),
+    }
+
+
+def _as_date(value) -> date:
+    # func.date() returns a string on SQLite and a date on Postgres
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def rebuild_daily_progress(db: Session) -> Dict[str, int]:
+    """Recompute the daily rollup rows from hot and archived results and question history"""
+    days: Dict[tuple, dict] = {}
+    topics: Dict[tuple, dict] = {}
+
+    for result_model in (models.QuizResult, models.QuizResultArchive):
+        day = func.date(result_model.completed_at)
+        rows = db.execute(select(
+            result_model.user_id, result_model.tenant_id, day,
+            func.count(result_model.id),
+            func.sum(func.coalesce(result_model.total_questions, 0)),
+            func.sum(func.coalesce(result_model.score, 0)),
+            func.sum(func.coalesce(result_model.time_taken, 0)),
+            func.sum(func.coalesce(result_model.time_taken, 0) // 60),
+            func.max(result_model.completed_at)
+        ).where(result_model.completed_at.isnot(None)).group_by(
+            result_model.user_id, result_model.tenant_id, day
+        )).all()
+        for user_id, tenant_id, raw_day, quizzes, questions, correct, seconds, minutes, last in rows:
+            key = (user_id, tenant_id, _as_date(raw_day))
+            row = days.setdefault(key, {
+                "user_id": user_id, "tenant_id": tenant_id, "day": key[2], "date": last,
+                "quizzes_taken": 0, "questions_answered": 0, "correct_answers": 0,
+                "study_time": 0, "total_time_seconds": 0, "average_score": 0.0,
+            })
+            row["quizzes_taken"] += quizzes
+            row["questions_answered"] += questions or 0
+            row["correct_answers"] += correct or 0
+            row["study_time"] += minutes or 0
+            row["total_time_seconds"] += seconds or 0
+            row["date"] = max(row["date"], last)
+
+    for history_model in (models.UserQuestionHistory, models.UserQuestionHistoryArchive):
+        day = func.date(history_model.answered_at)
+        topic = func.coalesce(history_model.topic_name, "Unknown")
+        difficulty = func.coalesce(history_model.difficulty_level, "medium")
+        rows = db.execute(select(
+            history_model.user_id, history_model.tenant_id, day, topic, difficulty,
+            func.count(history_model.id),
+            func.sum(case((history_model.is_correct == True, 1), else_=0)),
+            func.sum(func.coalesce(history_model.time_taken_seconds, 0))
+        ).where(history_model.answered_at.isnot(None)).group_by(
+            history_model.user_id, history_model.tenant_id, day, topic, difficulty
+        )).all()
+        for user_id, tenant_id, raw_day, topic_name, diff, answered, correct, seconds in rows:
+            key = (user_id, tenant_id, _as_date(raw_day), topic_name, diff)
+            row = topics.setdefault(key, {
+                "user_id": user_id, "tenant_id": tenant_id, "day": key[2],
+                "topic_name": topic_name, "difficulty_level": diff,
+                "questions_answered": 0, "correct_answers": 0, "time_seconds": 0,
+            })
+            row["questions_answered"] += answered
+            row["correct_answers"] += correct or 0
+            row["time_seconds"] += seconds or 0
+
+    for row in days.values():
+        if row["questions_answered"]:
+            row["average_score"] = row["correct_answers"] / row["questions_answered"] * 100
+
+    try:
+        db.execute(delete(models.DailyTopicProgress))
+        db.execute(delete(models.ProgressTracking).where(models.ProgressTracking.day.isnot(None)))
+        if days:
+            db.execute(insert(models.ProgressTracking), list(days.values()))
+        if topics:
+            db.execute(insert(models.DailyTopicProgress), list(topics.values()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"progress_tracking": len(days), "daily_topic_progress": len(topics)}
+
+
+def rebuild_streaks(db: Session) -> Dict[str, int]:
+    """Replay every quiz result in order to recompute the streak columns of user_stats and progress_tracking"""
+    timezones = dict(db.execute(select(models.User.id, models.User.timezone)).all())
+    completions = union_all(*(
+        select(model.user_id, model.tenant_id, model.completed_at).where(model.completed_at.isnot(None))
+        for model in (models.QuizResult, models.QuizResultArchive)
+    )).subquery()
+    rows = db.execute(select(completions).order_by(
+        completions.c.user_id, completions.c.tenant_id, completions.c.completed_at
+    ).execution_options(yield_per=5000))
+
+    streaks: Dict[tuple, dict] = {}
+    daily: Dict[tuple, dict] = {}
+    for user_id, tenant_id, completed_at in rows:
+        day = local_day(completed_at, timezones.get(user_id))
+        state = streaks.get((user_id, tenant_id))
+        if state is None:
+            state = streaks[(user_id, tenant_id)] = {"day": day, "current": 1, "longest": 1}
+        elif (day - state["day"]).days == 1:
+            state["current"] += 1
+        elif (day - state["day"]).days > 1:
+            state["current"] = 1
+        state["day"] = max(state["day"], day)
+        state["longest"] = max(state["longest"], state["current"])
+        daily[(user_id, tenant_id, completed_at.date())] = {
+            "b_user_id": user_id, "b_tenant_id": tenant_id, "b_day": completed_at.date(),
+            "current_streak": state["current"], "longest_streak": state["longest"],
+        }
+
+    stats_params = [
+        {"b_user_id": user_id, "b_tenant_id": tenant_id, "last_active_day": state["day"],
+         "current_streak": state["current"], "longest_streak": state["longest"]}
+        for (user_id, tenant_id), state in streaks.items()
+    ]
+    try:
+        db.execute(update(models.UserStats).values(last_active_day=None, current_streak=0, longest_streak=0))
+        if stats_params:
+            db.connection().execute(update(models.UserStats).where(
+                models.UserStats.user_id == bindparam("b_user_id"),
+                models.UserStats.tenant_id == bindparam("b_tenant_id")
+            ), stats_params)
+        if daily:
+            db.connection().execute(update(models.ProgressTracking).where(
+                models.ProgressTracking.user_id == bindparam("b_user_id"),
+                models.ProgressTracking.tenant_id == bindparam("b_tenant_id"),
+                models.ProgressTracking.day == bindparam("b_day")
+            ), list(daily.values()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"user_stats": len(stats_params), "progress_tracking": len(daily)}
+
+
+def rebuild_error_matrix(db: Session) -> Dict[str, int]:
+    """Recompute user_error_matrix from the hot and archived question history"""
+    now = datetime.utcnow()
+    matrices: Dict[tuple, dict] = {}
+    for history_model in (models.UserQuestionHistory, models.UserQuestionHistoryArchive):
+        category = func.coalesce(models.Question.category, "General")
+        difficulty = func.coalesce(history_model.difficulty_level, "medium")
+        rows = db.execute(select(
+            history_model.user_id, history_model.tenant_id, category, difficulty,
+            func.count(history_model.id),
+            func.sum(case((history_model.is_correct == True, 0), else_=1))
+        ).select_from(history_model).outerjoin(
+            models.Question, models.Question.id == history_model.question_id
+        ).group_by(history_model.user_id, history_model.tenant_id, category, difficulty))
+        for user_id, tenant_id, category_name, level, answered, incorrect in rows:
+            cell = matrices.setdefault((user_id, tenant_id), {}).setdefault(category_name, {}).setdefault(level, [0, 0])
+            cell[0] += answered
+            cell[1] += incorrect or 0
+
+    rows = []
+    for (user_id, tenant_id), cells in matrices.items():
+        answered, incorrect = _error_totals(cells)
+        rows.append({
+            "user_id": user_id, "tenant_id": tenant_id, "cells": cells,
+            "total_answered": answered, "total_incorrect": incorrect, "updated_at": now,
+        })
+    try:
+        db.execute(delete(models.UserErrorMatrix))
+        if rows:
+            db.execute(insert(models.UserErrorMatrix), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"user_error_matrix": len(rows)}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the per-user and per-tenant stats tables")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute user stats from all quiz results")
+    parser.add_argument("--rebuild-daily", action="store_true", help="Recompute the daily progress rollups")
+    parser.add_argument("--rebuild-streaks", action="store_true",
+                        help="Recompute study streaks (also runs after --rebuild and --rebuild-daily)")
+    parser.add_argument("--rebuild-errors", action="store_true",
+                        help="Recompute the per-user error matrix from the question history")
+    args = parser.parse_args()
+    if not (args.rebuild or args.rebuild_daily or args.rebuild_streaks or args.rebuild_errors):
+        parser.print_help()
+        sys.exit(0)
+
+    db = SessionLocal()
+    try:
+        if args.rebuild:
+            print("Rebuilding user stats...")
+            result = rebuild_stats(db)
+            print(f"✅ Rebuilt {result['user_stats']} user stats, {result['user_topic_stats']} topic stats, "
+                  f"{result['tenant_topic_stats']} tenant topic and {result['quiz_leaderboard']} leaderboard rows")
+        if args.rebuild_daily:
+            print("Rebuilding daily progress rollups...")
+            result = rebuild_daily_progress(db)
+            print(f"✅ Rebuilt {result['progress_tracking']} daily rows and "
+                  f"{result['daily_topic_progress']} daily topic rows")
+        if args.rebuild or args.rebuild_daily or args.rebuild_streaks:
+            print("Rebuilding study streaks...")
+            result = rebuild_streaks(db)
+            print(f"✅ Rebuilt streaks for {result['user_stats']} users and {result['progress_tracking']} daily rows")
+        if args.rebuild_errors:
+            print("Rebuilding error matrix...")
+            result = rebuild_error_matrix(db)
+            print(f"✅ Rebuilt error matrix for {result['user_error_matrix']} users")
+    except Exception as e:
+        print(f"❌ Rebuild failed: {e}")
+        sys.exit(1)
+    finally:
+        db.close()